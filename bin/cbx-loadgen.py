@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Load generator for the HAL -> Event Manager -> consumer chain.
+
+Starts a private session bus, an Event Manager and a HAL service polling a set of synthetic
+devices (see :py:mod:`pycstbox.hal.loadgen`), then counts the events received by a
+consumer subscribed to the sensor channel. The throughput and the delivery latency are reported
+periodically, and the polling stats of the coordinators at the end of the run.
+
+The bus of the running CSTBox is not used, so the load generator can be run on a live box.
+"""
+
+import json
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import time
+
+import gobject
+from dbus.exceptions import DBusException
+
+import pycstbox.cli as cli
+import pycstbox.dbuslib as dbuslib
+import pycstbox.evtmgr as evtmgr
+import pycstbox.log as log
+from pycstbox.devcfg import Coordinator, Device
+from pycstbox.hal import network
+from pycstbox.hal.loadgen import COORDINATOR_TYPE, DEVICE_TYPE, LoadGenCoordinatorServiceObject
+from pycstbox.hal.metrics import Histogram
+from pycstbox.sysutils import parse_period
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+SERVICE_NAME = 'LoadGen'
+SERVICE_START_TIMEOUT = 30
+
+
+def start_private_bus():
+    """ Starts a private session bus and makes it the one used by this process and its children.
+
+    :returns: the pid of the bus daemon
+    """
+    out = subprocess.check_output(['dbus-launch', '--sh-syntax'])
+    env = dict(re.findall(r"^(DBUS_SESSION_BUS_\w+)='?([^';]*)'?;", out, re.MULTILINE))
+    os.environ['DBUS_SESSION_BUS_ADDRESS'] = env['DBUS_SESSION_BUS_ADDRESS']
+    return int(env['DBUS_SESSION_BUS_PID'])
+
+
+def wait_for_service(svc_name):
+    """ Waits until a service is available on the bus.
+
+    :raises RuntimeError: if the service is not available in time
+    """
+    bus = dbuslib.get_bus()
+    deadline = time.time() + SERVICE_START_TIMEOUT
+    while not bus.name_has_owner(dbuslib.make_bus_name(svc_name)):
+        if time.time() > deadline:
+            raise RuntimeError('service %s not started' % svc_name)
+        time.sleep(0.1)
+
+
+def make_configuration(args):
+    """ Builds the configuration of the synthetic devices network, the devices being evenly
+    spread over the coordinators.
+    """
+    coordinators = [
+        Coordinator('loadgen%d' % i, type=COORDINATOR_TYPE, poll_workers=args.workers)
+        for i in xrange(args.coordinators)
+    ]
+    for i in xrange(args.devices):
+        dev_id = 'lg%05d' % i
+        outputs = {
+            'out%d' % j: {'enabled': True, 'varname': '%s_%d' % (dev_id, j)}
+            for j in xrange(args.outputs)
+        }
+        coordinators[i % len(coordinators)].add_device(Device(
+            dev_id, type=COORDINATOR_TYPE + ':' + DEVICE_TYPE, enabled=True, location='loadgen', polling=args.period,
+            change_ratio=args.change_ratio, noise=args.noise, failure_ratio=args.failure_ratio,
+            latency=args.latency, outputs=outputs
+        ))
+    return {c.uid: c for c in coordinators}
+
+
+def run_event_manager(level):
+    dbuslib.dbus_init()
+    svc = evtmgr.EventManager(dbuslib.get_bus())
+    svc.log_setLevel(level)
+    svc.start()
+
+
+def run_hal(cfg, multiprocess, level):
+    dbuslib.dbus_init()
+    wait_for_service(evtmgr.SERVICE_NAME)
+    svc = network.DeviceNetworkSvc(dbuslib.get_bus(), SERVICE_NAME,
+                                   coord_typemap={COORDINATOR_TYPE: LoadGenCoordinatorServiceObject},
+                                   multiprocess=multiprocess)
+    svc.log_setLevel(level)
+    svc.load_configuration(cfg)
+    svc.start()
+
+
+class EventsCounter(object):
+    """ Consumer of the sensor channel events, measuring the throughput and the delay between
+    the emission of the events by the Event Manager and their reception.
+    """
+    def __init__(self):
+        self.count = 0
+        self.latency = Histogram()
+        self.start_time = time.time()
+        self._last_report = (self.start_time, 0)
+
+    def on_event(self, timestamp, var_type, var_name, data):  #pylint: disable=W0613
+        self.count += 1
+        self.latency.add(max(time.time() - timestamp / 1000., 0))
+
+    def report(self):
+        now = time.time()
+        last_time, last_count = self._last_report
+        self._last_report = (now, self.count)
+        print("%6.0fs : %d events (%.0f/s) - latency %s" % (
+            now - self.start_time, self.count, (self.count - last_count) / (now - last_time), self.latency
+        ))
+        return True
+
+
+def report_polling_stats(cfg):
+    total_poll = events = 0
+    for cid in sorted(cfg):
+        try:
+            stats = json.loads(
+                dbuslib.get_object(SERVICE_NAME, '/' + cid).getPollingStats(dbus_interface=network.SERVICE_INTERFACE)
+            )
+        except DBusException as e:
+            print("%s : stats not available (%s)" % (cid, e))
+            continue
+        total_poll += stats.get('total_poll', 0)
+        events += stats.get('events', 0)
+        print("%s : %d polls, %d events, utilization=%.3f" % (
+            cid, stats.get('total_poll', 0), stats.get('events', 0), stats.get('utilization', 0)
+        ))
+    return total_poll, events
+
+
+if __name__ == '__main__':
+    parser = cli.get_argument_parser('CSTBox events chain load generator')
+    parser.add_argument('-d', '--devices', type=int, default=1000,
+                        help='number of synthetic devices')
+    parser.add_argument('-o', '--outputs', type=int, default=1,
+                        help='number of outputs per device')
+    parser.add_argument('-p', '--period', default='10s',
+                        help='polling period of the devices')
+    parser.add_argument('-c', '--change-ratio', type=float, default=0.1,
+                        help='probability for a value to change between two polls')
+    parser.add_argument('-n', '--noise', type=float, default=0.,
+                        help='standard deviation of the noise added to the values')
+    parser.add_argument('-f', '--failure-ratio', type=float, default=0.,
+                        help='probability for a poll to fail')
+    parser.add_argument('-l', '--latency', type=float, default=0.01,
+                        help='duration of a poll (in seconds)')
+    parser.add_argument('-C', '--coordinators', type=int, default=1,
+                        help='number of coordinators the devices are spread over')
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help='size of the polling workers pool of each coordinator')
+    parser.add_argument('-m', '--multiprocess', action='store_true',
+                        help='run the coordinators in worker processes')
+    parser.add_argument('-t', '--duration', default='1m',
+                        help='duration of the run')
+    parser.add_argument('-r', '--report', default='10s',
+                        help='throughput report period')
+    parser.set_defaults(loglevel='WARN')
+    args = parser.parse_args()
+
+    log.setup_logging('loadgen')
+    level = log.loglevel_from_args(args)
+    cfg = make_configuration(args)
+
+    bus_pid = start_private_bus()
+    processes = []
+    try:
+        # the services are forked before the D-Bus initialization of this process
+        for target, target_args in ((run_event_manager, (level,)), (run_hal, (cfg, args.multiprocess, level))):
+            process = multiprocessing.Process(target=target, args=target_args)
+            process.start()
+            processes.append(process)
+
+        dbuslib.dbus_init()
+        wait_for_service(evtmgr.SERVICE_NAME)
+        wait_for_service(SERVICE_NAME)
+
+        counter = EventsCounter()
+        dbuslib.get_bus().add_signal_receiver(
+            counter.on_event,
+            signal_name='onCSTBoxEvent',
+            dbus_interface=evtmgr.SERVICE_INTERFACE,
+            path='/' + evtmgr.SENSOR_EVENT_CHANNEL
+        )
+        print("%d devices x %d outputs polled every %s on a private bus (%s)" % (
+            args.devices, args.outputs, args.period, os.environ['DBUS_SESSION_BUS_ADDRESS']
+        ))
+
+        loop = gobject.MainLoop()
+        gobject.timeout_add(int(parse_period(args.report) * 1000), counter.report)
+        gobject.timeout_add(int(parse_period(args.duration) * 1000), loop.quit)
+        try:
+            loop.run()
+        except KeyboardInterrupt:
+            pass
+
+        counter.report()
+        total_poll, events = report_polling_stats(cfg)
+        print("total : %d polls, %d events emitted, %d received (%.1f%%)" % (
+            total_poll, events, counter.count, 100. * counter.count / events if events else 0
+        ))
+
+    except Exception as e:  #pylint: disable=W0703
+        log.exception(e)
+        sys.exit(e)
+
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(5)
+        os.kill(bus_pid, 15)
@@ -52,8 +52,28 @@ class ConfigurationParms(object):
     ADDRESS = 'address'
     TYPE = 'type'
     DELTA_MIN = 'delta_min'
+    FILTER = 'filter'
+    AGGREGATE = 'aggregate'
     POLL_PERIOD = 'polling'
+    POLL_PERIOD_MIN = 'polling_min'
+    POLL_PERIOD_MAX = 'polling_max'
     POLL_REQUESTS_INTERVAL = 'poll_req_interval'
+    POLL_WORKERS = 'poll_workers'
+    POLL_PHASING = 'poll_phasing'
+    POLL_PRIORITY = 'priority'
+    POLL_TIMEOUT = 'poll_timeout'
+    POLL_CONCURRENCY = 'poll_concurrency'
+    PROCESS = 'process'
+    BACKOFF_MAX = 'backoff_max'
+    STATS_PUBLISH = 'stats_publish'
+    HEARTBEAT = 'heartbeat'
+    BUS = 'bus'
+    BUS_GAP = 'bus_gap'
+    BUS_RATE = 'bus_rate'
+    BUS_BURST = 'bus_burst'
+    RECORD = 'record'
+    REPLAY = 'replay'
+    REPLAY_SPEED = 'replay_speed'
     LOCATION = 'location'
     EVENTS_TTL = 'events_ttl'
     DEFAULT_VALUE = 'defvalue'
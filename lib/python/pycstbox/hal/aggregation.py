@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Aggregation of the values read from the outputs of the devices over windows.
+
+Devices can be polled fast for responsiveness while only aggregated values are processed
+by the change detection and emitted on the bus. The aggregation is selected by the
+``aggregate`` setting of the outputs, given as ``<function>:<window>``, where the function
+is one of ``mean``, ``min``, ``max`` and ``last``, and the window is either:
+
+- a count of reads (ex: ``mean:10``)
+- a duration, with its units (ex: ``max:30s``, ``mean:5m``)
+
+Duration windows are aligned on multiples of their duration. Since the end of a window is
+known when the first value of the next one is read, its aggregate is produced at that time.
+
+The aggregates are computed incrementally, so that the values of the window do not need
+to be kept. Missing values are not part of the aggregates.
+"""
+
+from pycstbox.sysutils import parse_period
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+AGGREGATE_MEAN = 'mean'
+AGGREGATE_MIN = 'min'
+AGGREGATE_MAX = 'max'
+AGGREGATE_LAST = 'last'
+AGGREGATE_FUNCTIONS = (AGGREGATE_MEAN, AGGREGATE_MIN, AGGREGATE_MAX, AGGREGATE_LAST)
+
+
+class Aggregator(object):
+    """ Incremental aggregation of the values of an output over count or duration windows."""
+    __slots__ = (
+        'function', 'size', 'duration', 'window', 'count', 'total', 'low', 'high', 'last',
+        'samples', 'windows'
+    )
+
+    def __init__(self, function, size=0, duration=0.):
+        """
+        :param str function: the aggregation function (see :py:data:`AGGREGATE_FUNCTIONS`)
+        :param int size: the count of values of the windows
+        :param float duration: the duration of the windows (in seconds), used if no size is given
+        :raises ValueError: if the function is unknown or if no window is defined
+        """
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError('unknown aggregation function : %s' % function)
+        if size <= 0 and duration <= 0:
+            raise ValueError('aggregation window size or duration must be positive')
+        self.function = function
+        self.size = int(size)
+        self.duration = float(duration) if not size else 0.
+        self.window = None
+        self.samples = self.windows = 0
+        self._clear()
+
+    def _clear(self):
+        self.count = 0
+        self.total = 0.
+        self.low = self.high = self.last = None
+
+    def add(self, value, now):
+        """ Adds a value read from the device to the current window.
+
+        :param float value: the value
+        :param float now: the time of the read
+        :returns: the aggregate of the window completed by this read, or None if none
+        """
+        self.samples += 1
+        result = None
+        if self.duration:
+            window = int(now // self.duration)
+            if window != self.window:
+                if self.count:
+                    result = self._close()
+                self.window = window
+
+        self.count += 1
+        self.total += value
+        self.last = value
+        if self.low is None or value < self.low:
+            self.low = value
+        if self.high is None or value > self.high:
+            self.high = value
+
+        if self.size and self.count >= self.size:
+            result = self._close()
+        return result
+
+    def _close(self):
+        """ Returns the aggregate of the current window, and starts a new one."""
+        function = self.function
+        if function == AGGREGATE_MEAN:
+            result = self.total / self.count
+        elif function == AGGREGATE_MIN:
+            result = self.low
+        elif function == AGGREGATE_MAX:
+            result = self.high
+        else:
+            result = self.last
+        self.windows += 1
+        self._clear()
+        return result
+
+    @property
+    def reduction_ratio(self):
+        return float(self.samples) / self.windows if self.windows else 0.
+
+    def as_dict(self):
+        return {
+            'function': self.function,
+            'window': self.size or self.duration,
+            'samples': self.samples,
+            'windows': self.windows,
+            'ratio': round(self.reduction_ratio, 2)
+        }
+
+
+def make_aggregator(spec):
+    """ Creates an aggregator from its specification.
+
+    :param str spec: the aggregation specification, as ``<function>:<window>``, the window being
+        a count of reads, or a duration if followed by its units
+    :rtype: Aggregator
+    :raises ValueError: if the specification is invalid
+    """
+    function, _, window = (s.strip() for s in spec.partition(':'))
+    if window.isdigit():
+        return Aggregator(function, size=int(window))
+    try:
+        duration = parse_period(window)
+    except ValueError:
+        raise ValueError('invalid aggregation window : %s' % spec)
+    return Aggregator(function, duration=duration)
@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Coordinator for network attached devices, polled concurrently from the main loop.
+
+Instead of dedicating a thread to the polling, the coordinator defined here drives
+the polls from the GLib main loop already run by the service container. Devices
+supporting non-blocking reads (see :py:class:`AsyncPolledDevice`) are polled by
+sending their requests and processing the replies when they arrive, so that
+hundreds of requests can be in flight at the same time, each one with its own timeout.
+"""
+
+import errno
+import math
+import socket
+from collections import deque
+from functools import partial
+
+import gobject
+
+from pycstbox.devcfg import ConfigurationParms
+from pycstbox.log import Loggable
+from pycstbox.hal.device import PolledDevice, CommunicationError, PollTimeoutError
+from pycstbox.hal.network import CoordinatorServiceObject, CommandTask, _PollingEngine
+from pycstbox.hal.scheduler import PHASING_HASH
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+DFLT_POLL_TIMEOUT = 5           # secs
+DFLT_POLL_CONCURRENCY = 256
+
+
+class AsyncCoordinatorServiceObject(CoordinatorServiceObject):
+    """ Coordinator polling its devices from the main loop.
+
+    Devices implementing the ``poll_async`` method are polled without blocking, up to
+    a configurable number of concurrent requests. Polls of devices sharing the same bus
+    are still serialized. The other devices are polled synchronously in the main loop,
+    which is supported but defeats the purpose of this coordinator.
+
+    Batched reads are not used by this coordinator, and the commands sent to the devices are
+    applied synchronously in the main loop.
+    """
+    def __init__(self, cid):
+        super(AsyncCoordinatorServiceObject, self).__init__(cid)
+        self._poll_concurrency = DFLT_POLL_CONCURRENCY
+
+    def _configure_coordinator(self, cfg):
+        super(AsyncCoordinatorServiceObject, self)._configure_coordinator(cfg)
+
+        # polls are always time limited here, since nothing else would release their slot
+        if not self._poll_timeout:
+            self._poll_timeout = DFLT_POLL_TIMEOUT
+            self.log_info('polling timeout defaulted to %ss', self._poll_timeout)
+
+        self._poll_concurrency = int(getattr(cfg, ConfigurationParms.POLL_CONCURRENCY, DFLT_POLL_CONCURRENCY))
+        self.log_info('concurrent polls limit : %d', self._poll_concurrency)
+
+    def _default_bus(self, dev):
+        """ Devices with no declared bus are reachable independently of the others, since
+        polled concurrently.
+        """
+        return dev.id_
+
+    def _start_polling(self, tasks):
+        """ Starts the polling from the main loop.
+
+        :param list tasks: the initial polling tasks
+        """
+        self._polling_thread = _AsyncPoller(
+            owner=self,
+            tasks=tasks,
+            scheduler=self.create_scheduler(),
+            phasing=self._poll_phasing,
+            concurrency=self._poll_concurrency,
+            timeout=self._poll_timeout
+        )
+        self._polling_thread.log_setLevel(self.log_getEffectiveLevel())
+        self._polling_thread.start()
+
+
+class AsyncPolledDevice(PolledDevice):  #pylint: disable=W0223
+    """ A polled device which low level interface supports non-blocking reads.
+
+    In addition to the ``poll`` method, the ``_hwdev`` object must implement a
+    ``poll_async(callback)`` method, which sends the read request and returns immediately
+    an object providing a ``cancel()`` method. The callback must be invoked from the main
+    loop with the output values, or with the IOError which occurred.
+
+    :py:class:`TcpChannel` can be used for implementing it for devices reached over TCP.
+    """
+    def poll_async(self, callback):
+        """ Starts reading the device.
+
+        :param callable callback: invoked with the list of events produced by the poll as
+            ``events`` keyword parameter, or with the error as ``error`` keyword parameter
+        :returns: the handle of the request
+        """
+        def done(output_values):
+            if isinstance(output_values, IOError):
+                callback(error=CommunicationError(self._cfg.uid, output_values))
+                return
+            try:
+                events = self.process_outputs(output_values)
+            except (ValueError, TypeError) as e:
+                callback(error=e)
+            else:
+                callback(events=events)
+
+        return self._hwdev.poll_async(done)
+
+
+class _PendingPoll(object):
+    """ A poll in progress."""
+    __slots__ = ['task', 'when', 'stats', 'start', 'handle', 'timer', 'done']
+
+    def __init__(self, task, when, stats, start):
+        self.task, self.when, self.stats, self.start = task, when, stats, start
+        self.handle = self.timer = None
+        self.done = False
+
+
+class _AsyncPoller(_PollingEngine):
+    """ Polling engine driven by the main loop.
+
+    A single main loop timer is armed for the next schedule deadline. When it fires, the due
+    tasks are started, as long as the concurrent polls limit is not reached. Completed polls
+    release their slot and their bus, and the next due tasks are started in turn.
+
+    All the methods must be invoked from the main loop thread.
+    """
+    def __init__(self, owner, tasks, scheduler=None, phasing=PHASING_HASH,
+                 concurrency=DFLT_POLL_CONCURRENCY, timeout=DFLT_POLL_TIMEOUT, clock=None):
+        """
+        :param int concurrency: the maximum number of polls in progress at the same time
+        :param float timeout: the delay after which a poll without reply is failed (in seconds),
+            for the tasks which do not define their own one
+
+        See :py:class:`pycstbox.hal.network._PollingEngine` for the other parameters.
+        """
+        _PollingEngine.__init__(self, owner, tasks, scheduler, phasing, clock)
+        self._concurrency = max(concurrency, 1)
+        self._timeout = timeout
+        self._running = False
+        self._timer = None
+        self._timer_time = None
+        self._dispatching = False
+        # polls in progress, keyed by device id
+        self._in_flight = {}
+        # polls waiting for their bus to be released, keyed by the ids of the busy buses
+        self._bus_queues = {}
+        # polls which bus has just been released, to be started first
+        self._ready = deque()
+        # devices without non-blocking reads already reported
+        self._blocking_devs = set()
+
+    def start(self):
+        self._start_polling()
+        self._running = True
+        self.log_info('polling started (concurrency=%d, timeout=%ss)', self._concurrency, self._timeout)
+        self._dispatch()
+
+    def schedule(self, task, when, priority=None):
+        _PollingEngine.schedule(self, task, when, priority)
+        if self._running and not self._dispatching:
+            self._arm()
+
+    def submit_command(self, dev, control, value, issued, bus, gap=0., timeout=None):
+        _PollingEngine.submit_command(self, dev, control, value, issued, bus, gap, timeout)
+        if self._running and not self._dispatching:
+            self._arm()
+
+    def _arm(self):
+        """ Arms the timer for the next schedule deadline, unless no poll can be started before
+        another one completes."""
+        if self._terminate:
+            return
+        with self._wakeup:
+            next_time = self._scheduler.next_time()
+        if next_time is None or len(self._in_flight) >= self._concurrency:
+            self._disarm()
+            return
+        if self._timer is not None and self._timer_time <= next_time:
+            return
+
+        self._disarm()
+        delay = max(next_time - self._clock(), 0)
+        self._timer_time = next_time
+        self._timer = gobject.timeout_add(int(math.ceil(delay * 1000)), self._timer_fired)
+
+    def _disarm(self):
+        if self._timer is not None:
+            gobject.source_remove(self._timer)
+            self._timer = None
+
+    def _timer_fired(self):
+        self._timer = None
+        self._dispatch()
+        return False
+
+    def _dispatch(self):
+        """ Starts the due polls, within the limit of the concurrent polls."""
+        if self._dispatching:
+            return
+        self._dispatching = True
+        try:
+            now = self._clock()
+            while not self._terminate and len(self._in_flight) < self._concurrency:
+                if self._ready:
+                    task, when = self._ready.popleft()
+                else:
+                    with self._wakeup:
+                        schedule = self._scheduler.pop_due(now)
+                    if not schedule:
+                        break
+                    when, task = schedule
+                    if task.bus in self._bus_queues:
+                        self._bus_queues[task.bus].append((task, when))
+                        continue
+                    self._bus_queues[task.bus] = deque()
+
+                if isinstance(task, CommandTask):
+                    self._pacer(task.bus).acquire(self._clock())
+                    self._apply_command(task)
+                    self._bus_done(task.bus, task.gap)
+                    continue
+
+                # the task can have been removed while waiting for its bus
+                if self._tasks.get(task.dev.id_) is not task:
+                    self._release_bus(task.bus)
+                    continue
+                self._start_poll(task, when)
+        finally:
+            self._dispatching = False
+        self._arm()
+
+    def _start_poll(self, task, when):
+        stats, poll_start = self._poll_started(task, when)
+        self._pacer(task.bus).acquire(poll_start)
+        pending = _PendingPoll(task, when, stats, poll_start)
+        dev_id = task.dev.id_
+        haldev = task.dev.haldev
+        self._in_flight[dev_id] = pending
+
+        if not hasattr(haldev, 'poll_async'):
+            if dev_id not in self._blocking_devs:
+                self.log_warning('[%s] non-blocking reads not supported -> polled synchronously', dev_id)
+                self._blocking_devs.add(dev_id)
+            try:
+                events = haldev.poll() or []
+            except (CommunicationError, ValueError, TypeError) as e:
+                self._poll_done(pending, error=e)
+            else:
+                self._poll_done(pending, events=events)
+            return
+
+        timeout = task.timeout or self._timeout
+        pending.timer = gobject.timeout_add(int(timeout * 1000), self._poll_timed_out, pending, timeout)
+        try:
+            pending.handle = haldev.poll_async(partial(self._poll_done, pending))
+        except IOError as e:
+            self._poll_done(pending, error=CommunicationError(dev_id, e))
+        except (CommunicationError, ValueError, TypeError) as e:
+            self._poll_done(pending, error=e)
+
+    def _poll_timed_out(self, pending, timeout):
+        pending.timer = None
+        if pending.handle is not None:
+            pending.handle.cancel()
+        self._poll_done(pending, error=PollTimeoutError(
+            pending.task.dev.id_, IOError('no reply after %ss' % timeout)
+        ))
+        return False
+
+    def _poll_done(self, pending, events=None, error=None):
+        """ Processes the outcome of a poll.
+
+        Replies arriving after the poll has timed out are ignored.
+        """
+        if pending.done:
+            return
+        pending.done = True
+        if pending.timer is not None:
+            gobject.source_remove(pending.timer)
+            pending.timer = None
+
+        task = pending.task
+        if self._in_flight.get(task.dev.id_) is pending:
+            del self._in_flight[task.dev.id_]
+        now = self._clock()
+        self._account_poll_time(task, pending.stats, now - pending.start)
+        self._poll_completed(task, pending.when, pending.stats, events or [], error)
+        self._bus_done(task.bus, task.gap)
+        self._dispatch()
+
+    def _bus_done(self, bus, gap):
+        """ Ends a transaction on a bus, keeping it busy until its pacing allows a new one."""
+        now = self._clock()
+        pacer = self._pacer(bus)
+        pacer.release(now, gap)
+        delay = pacer.delay(now)
+        if delay:
+            self._account_pacing(bus, delay)
+            gobject.timeout_add(int(math.ceil(delay * 1000)), self._bus_pause_ended, bus)
+        else:
+            self._release_bus(bus)
+
+    def _bus_pause_ended(self, bus):
+        self._release_bus(bus)
+        self._dispatch()
+        return False
+
+    def _release_bus(self, bus):
+        waiting = self._bus_queues.get(bus)
+        if waiting:
+            self._ready.append(waiting.popleft())
+        else:
+            self._bus_queues.pop(bus, None)
+
+    def terminate(self):
+        """ Stops the polling, abandoning the polls in progress."""
+        _PollingEngine.terminate(self)
+        self._running = False
+        self._disarm()
+        for pending in self._in_flight.values():
+            pending.done = True
+            if pending.timer is not None:
+                gobject.source_remove(pending.timer)
+            if pending.handle is not None:
+                pending.handle.cancel()
+        self._in_flight.clear()
+
+    def join(self, timeout=None):
+        """ Flushes the stats, for compatibility with the polling thread interface."""
+        self._stop_polling()
+        self.log_info('terminated')
+
+
+class TcpChannel(Loggable):
+    """ Persistent TCP connection to a network attached device, handled from the main loop.
+
+    Requests are exchanged one at a time. The connection is opened on the first request,
+    and closed when an error occurs or a request is cancelled, so that a late reply cannot
+    be taken for the one of the next request. It is re-opened by the next request.
+    """
+    def __init__(self, host, port):
+        """
+        :param str host: the device host name or address
+        :param int port: the device port
+        """
+        Loggable.__init__(self, logname='TCP:%s:%d' % (host, port))
+        self._address = (host, port)
+        self._sock = None
+        self._connected = False
+        self._request = None
+
+    def request(self, data, complete, callback):
+        """ Sends a request to the device, and waits for its reply without blocking.
+
+        :param str data: the request
+        :param callable complete: invoked with the data received so far, and returning
+            True when they form a complete reply
+        :param callable callback: invoked with the reply, or with the IOError which occurred
+        :returns: the handle of the request, which ``cancel()`` method abandons it
+        :raises IOError: if a request is already in progress
+        """
+        if self._request:
+            raise IOError('request already in progress')
+
+        self._request = req = _TcpRequest(self, data, complete, callback)
+        if self._connected:
+            req.watch = gobject.io_add_watch(self._sock, gobject.IO_OUT | gobject.IO_ERR | gobject.IO_HUP, self._send)
+            return req
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setblocking(0)
+        err = self._sock.connect_ex(self._address)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self._failed(socket.error(err, errno.errorcode.get(err, 'connection failed')))
+            return req
+        req.watch = gobject.io_add_watch(self._sock, gobject.IO_OUT | gobject.IO_ERR | gobject.IO_HUP, self._send)
+        return req
+
+    def _send(self, source, condition):
+        req = self._request
+        try:
+            if not self._connected:
+                err = self._sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err:
+                    raise socket.error(err, errno.errorcode.get(err, 'connection failed'))
+                self._connected = True
+                self.log_debug('connected')
+            if condition & (gobject.IO_ERR | gobject.IO_HUP):
+                raise socket.error('connection closed')
+
+            sent = self._sock.send(req.data)
+            req.data = req.data[sent:]
+            if req.data:
+                return True
+
+        except socket.error as e:
+            req.watch = None
+            self._failed(e)
+            return False
+
+        req.watch = gobject.io_add_watch(self._sock, gobject.IO_IN | gobject.IO_ERR | gobject.IO_HUP, self._receive)
+        return False
+
+    def _receive(self, source, condition):
+        req = self._request
+        try:
+            data = self._sock.recv(4096)
+            if not data:
+                raise socket.error('connection closed by peer')
+        except socket.error as e:
+            req.watch = None
+            self._failed(e)
+            return False
+
+        req.reply += data
+        if not req.complete(req.reply):
+            return True
+
+        req.watch = None
+        self._request = None
+        req.callback(req.reply)
+        return False
+
+    def _failed(self, error):
+        req = self._request
+        self._request = None
+        self.close()
+        self.log_debug('request failed : %s', error)
+        req.callback(IOError(str(error)))
+
+    def _cancel(self, req):
+        if req is self._request:
+            self._request = None
+            self.close()
+
+    def close(self):
+        """ Closes the connection, abandoning the request in progress if any."""
+        if self._request and self._request.watch is not None:
+            gobject.source_remove(self._request.watch)
+            self._request.watch = None
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        self._connected = False
+
+
+class _TcpRequest(object):
+    """ A request in progress on a :py:class:`TcpChannel`."""
+    __slots__ = ['channel', 'data', 'complete', 'callback', 'reply', 'watch']
+
+    def __init__(self, channel, data, complete, callback):
+        self.channel = channel
+        self.data, self.complete, self.callback = data, complete, callback
+        self.reply = ''
+        self.watch = None
+
+    def cancel(self):
+        if self.watch is not None:
+            gobject.source_remove(self.watch)
+            self.watch = None
+        self.channel._cancel(self)
@@ -129,7 +129,7 @@ class SerialCoordinatorServiceObject(CoordinatorServiceObject):
         events = self.dispatch_received_data(data)
         for evt in events:
             self.log_debug('emitting ' + str(evt))
-            self._evtmgr.emitEvent(
+            self.emit_event(
                 evt.var_type, evt.var_name, json.dumps(evt.data)
             )
 
@@ -22,9 +22,20 @@ import time
 
 import pycstbox.events as evts
 import pycstbox.sysutils as sysutils
+from pycstbox.devcfg import ConfigurationParms
+from pycstbox.hal.filters import make_filter
+from pycstbox.hal.aggregation import make_aggregator
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 _logger = logging.getLogger('hal.device')
 
+# relative distance to the half-way point under which a vectorized rounding is not trusted
+_TIE_TOLERANCE = 1e-12
+
 
 def log_setLevel(level):
     """ Set the level of module level logging."""
@@ -33,6 +44,178 @@ def log_setLevel(level):
 DEFAULT_PRECISION = 3
 """ Default precision for notified values."""
 
+_VALUE, _UNIT = evts.DataKeys.VALUE, evts.DataKeys.UNIT
+
+
+def get_events_ttl(dev_cfg):
+    """ Returns the events time to live of a device.
+
+    :param devcfg.Device dev_cfg: the device configuration
+    :returns: the time to live (in seconds), defaulted to :py:data:`pycstbox.events.DEFAULT_EVENT_TTL`
+    """
+    try:
+        return sysutils.parse_period(dev_cfg.events_ttl) or evts.DEFAULT_EVENT_TTL
+    except AttributeError:
+        return evts.DEFAULT_EVENT_TTL
+
+
+class OutputsPlan(object):
+    """ Precompiled processing of the enabled outputs of a device.
+
+    It is built from the device configuration the first time events are created, and holds
+    for each output its position in the output values, the metadata of the events to be
+    produced and its notification state (last notified value and time), so that the events
+    creation does not need to look up the configuration again.
+
+    When the device returns its values as a NumPy array, the plan is vectorized: the state
+    is kept in arrays too, and the change detection is done for all the outputs at once
+    (see :py:meth:`HalDevice.create_events`). This is not possible if some outputs are
+    filtered (see :py:mod:`pycstbox.hal.filters`) or aggregated (see :py:mod:`pycstbox.hal.aggregation`),
+    the array being processed item by item in this case.
+    """
+    __slots__ = (
+        'names', 'outputs', 'prev_values', 'event_times', 'values_type', 'indexed', 'entries',
+        'array', 'vectorized', 'indexes', 'scales', 'deltas', 'notified'
+    )
+
+    def __init__(self, names, outputs):
+        """
+        :param tuple names: the names of the enabled outputs
+        :param tuple outputs: for each output, a tuple containing the type, the name and the units
+            of the variable, the precision and the small variations threshold of the values, the
+            filter of the output (None if not filtered) and its aggregator (None if not aggregated)
+        """
+        self.names = names
+        self.outputs = outputs
+        self.prev_values = [None] * len(names)
+        self.event_times = [0] * len(names)
+        self.values_type = None
+        self.indexed = self.array = self.vectorized = False
+        self.entries = ()
+        self.indexes = self.scales = self.deltas = self.notified = None
+
+    def bind(self, values_type, array_outputs=None):
+        """ Resolves the position of the outputs in the values returned by the device.
+
+        If the values are named tuples, the outputs are accessed by their index. If they are
+        NumPy arrays, their positions are given by the array outputs of the device. Otherwise
+        they are fetched by name and stored in the plan order before being processed.
+
+        :param type values_type: the type of the output values
+        :param tuple array_outputs: the names of the outputs, in the order of the values arrays
+        :raises AttributeError: if an output is not part of the values
+        """
+        state = self.get_state()
+        array = numpy is not None and issubclass(values_type, numpy.ndarray)
+        vectorized = array and not any(output[5] or output[6] for output in self.outputs)
+        fields = array_outputs if array else getattr(values_type, '_fields', None)
+        if fields is not None:
+            try:
+                indexes = [fields.index(name) for name in self.names]
+            except ValueError:
+                raise AttributeError(
+                    "'%s' object has no output among %s" % (values_type.__name__, ', '.join(self.names))
+                )
+        elif array:
+            raise AttributeError('array outputs of the device not defined')
+        else:
+            indexes = range(len(self.names))
+        self.entries = tuple((i, index) + self.outputs[i] for i, index in enumerate(indexes))
+        self.values_type = values_type
+        self.indexed = fields is not None
+
+        count = len(self.names)
+        if vectorized:
+            self.indexes = numpy.array(indexes, dtype=int)
+            self.scales = numpy.array([10. ** output[3] for output in self.outputs])
+            self.deltas = numpy.array([output[4] or 0. for output in self.outputs])
+            self.prev_values = numpy.zeros(count)
+            self.event_times = numpy.zeros(count)
+            self.notified = numpy.zeros(count, dtype=bool)
+        else:
+            self.indexes = self.scales = self.deltas = self.notified = None
+            self.prev_values = [None] * count
+            self.event_times = [0] * count
+        self.array, self.vectorized = array, vectorized
+        self.set_state(state)
+
+    def get_state(self):
+        """ Returns the notification state of the outputs.
+
+        :returns dict: the last notified value (None if not yet notified) and time, by output name
+        """
+        prev_values, event_times = self.prev_values, self.event_times
+        if self.vectorized:
+            prev_values = [v if notified else None for v, notified in zip(prev_values.tolist(), self.notified)]
+            event_times = event_times.tolist()
+        return dict(zip(self.names, zip(prev_values, event_times)))
+
+    def set_state(self, state):
+        """ Restores the notification state of the outputs, as returned by :py:meth:`get_state`.
+
+        Outputs which are not part of the plan are ignored.
+        """
+        for i, name in enumerate(self.names):
+            if name in state:
+                prev, self.event_times[i] = state[name]
+                if not self.vectorized:
+                    self.prev_values[i] = prev
+                elif prev is not None:
+                    self.prev_values[i], self.notified[i] = prev, True
+
+    def process_array(self, values, now, events_ttl):
+        """ Detects the changed outputs among values read as an array.
+
+        The rounding, the small variations filtering and the events aging are computed for all
+        the outputs in a single pass, and the notification state is updated for the changed ones.
+        Missing values are given as NaN.
+
+        :param numpy.ndarray values: the values read from the device
+        :param float now: the current time
+        :param float events_ttl: the events time to live (None for no limit)
+        :returns: the list of the positions in the plan of the changed outputs, and the list of
+            their values
+        """
+        prev_values, event_times = self.prev_values, self.event_times
+        values = values.take(self.indexes)
+        # NaN are replaced beforehand, so that the comparisons do not need to care about them
+        missing = numpy.isnan(values)
+        has_missing = missing.any()
+        if has_missing:
+            values[missing] = 0.
+
+        # rounding half away from zero, as the round() builtin
+        scaled = numpy.abs(values) * self.scales
+        rounded = numpy.floor(scaled + 0.5)
+        # the builtin rounds the exact value, while the product can be moved to or across the
+        # half-way point by its own rounding error (ex: 0.15 is slightly below 0.15, but 0.15 x 10
+        # is 1.5), so the values which are that close to a tie are rounded by the builtin instead
+        ties = numpy.abs(scaled - numpy.floor(scaled) - 0.5)
+        ties = numpy.flatnonzero(ties <= scaled * _TIE_TOLERANCE)
+        raw_values = values[ties].tolist()
+        values = numpy.copysign(rounded, values, out=rounded)
+        values /= self.scales
+        outputs = self.outputs
+        for i, raw_value in zip(ties.tolist(), raw_values):
+            values[i] = round(raw_value, outputs[i][3])
+
+        # values within the threshold are notified as the previous one if the events are expired
+        same = numpy.abs(values - prev_values) <= self.deltas
+        same &= self.notified
+        numpy.copyto(values, prev_values, where=same)
+        changed = ~same
+        if events_ttl is not None:
+            changed |= now - event_times >= events_ttl
+        if has_missing:
+            changed &= ~missing
+
+        changed = numpy.flatnonzero(changed)
+        values = values[changed]
+        prev_values[changed] = values
+        event_times[changed] = now
+        self.notified[changed] = True
+        return changed.tolist(), values.tolist()
+
 
 class HalDevice(object):    #pylint: disable=R0922
     """ Base class for modeling devices in the abstraction layer.
@@ -48,19 +231,33 @@ class HalDevice(object):    #pylint: disable=R0922
     Polled devices are modeled by the :py:class:`PolledDevice` class, which provides the
     foundation for managing the dialog with the physical equipment in order to get its outputs.
     """
+    # time source used for events aging, which can be replaced for running in simulated time
+    clock = staticmethod(time.time)
+
+    ttl_refresh = True
+    """ Tells if the unchanged values are notified again when their time to live has expired.
+    Cleared by the coordinator when its heartbeat takes care of it. """
+
+    array_outputs = None
+    """ Names of the outputs, in the order of the values in the arrays returned by devices
+    read as NumPy arrays. """
+
     def __init__(self, coord_cfg, dev_cfg):
         """
         :param devcfg.Coordinator coord_cfg: the parent coordinator configuration object
         :param devcfg.Device dev_cfg: the device configuration object, as retrieved from the global configuration data
+        :raises HalError: if the filter or the aggregation of an output is invalid
         """
         self.coord = coord_cfg
         self._cfg = dev_cfg
-        self._prev_values = {}
-        self._last_event_times = {}
+        # compiled at first events creation, once the driver class is completely set up
+        self._plan = None
+        self._filters = {}
+        self._aggregators = {}
 
         # process configuration values, added default values for unspecified
         # generic parameters
-        for output_cfg in self._cfg.outputs.itervalues():
+        for output, output_cfg in self._cfg.outputs.iteritems():
             if 'prec' in output_cfg:
                 output_cfg['prec'] = int(output_cfg['prec'])
             else:
@@ -69,15 +266,24 @@ class HalDevice(object):    #pylint: disable=R0922
                 output_cfg['delta_min'] = float(output_cfg['delta_min'])
             else:
                 output_cfg['delta_min'] = None
+            for setting, factory, registry in (
+                (ConfigurationParms.FILTER, make_filter, self._filters),
+                (ConfigurationParms.AGGREGATE, make_aggregator, self._aggregators)
+            ):
+                spec = output_cfg.get(setting)
+                if not spec:
+                    continue
+                try:
+                    registry[output] = factory(spec)
+                except ValueError as e:
+                    # imported here since the HAL package imports this module
+                    from pycstbox.hal import HalError
+                    raise HalError('device %s output %s : invalid %s setting (%s)' % (
+                        self._cfg.uid, output, setting, e
+                    ))
 
         # same for maximum age of last sent events, but globally for the device
-        try:
-            self._events_ttl = sysutils.parse_period(self._cfg.events_ttl)
-        except AttributeError:
-            self._events_ttl = evts.DEFAULT_EVENT_TTL
-        else:
-            if not self._events_ttl:    # None or 0
-                self._events_ttl = evts.DEFAULT_EVENT_TTL
+        self._events_ttl = get_events_ttl(self._cfg)
         _logger.info('events_ttl=%d', self._events_ttl)
 
     def is_pollable(self):
@@ -95,6 +301,27 @@ class HalDevice(object):    #pylint: disable=R0922
         """
         return hasattr(self, 'poll') and callable(self.poll)
 
+    def set_control(self, control, value):
+        """ Applies a value to a control (actuator, set-point,...) of the device.
+
+        Invoked by the coordinator when a command addressing one of the variables declared
+        in the ``controls`` section of the device configuration is received on the control
+        channel. The default implementation delegates to the ``set_control`` method of the
+        low level interface (``self._hwdev``) if it provides one.
+
+        :param str control: the name of the control, as used in the device configuration
+        :param value: the value to be applied
+        :raises NotImplementedError: if the device does not support this control
+        :raises CommunicationError: if the communication with the device failed
+        """
+        hwdev = getattr(self, '_hwdev', None)
+        if not callable(getattr(hwdev, 'set_control', None)):
+            raise NotImplementedError()
+        try:
+            hwdev.set_control(control, value)
+        except IOError as e:
+            raise CommunicationError(self._cfg.uid, e)
+
     def create_events(self, output_values):
         """ Creates the list of events depending on the collected or received
         data from the device.
@@ -108,31 +335,65 @@ class HalDevice(object):    #pylint: disable=R0922
         It relies on the method get_output_data_definition(), which must be
         implemented by subclasses to provide the value type and unit associated
         to a given device output. These information are used to build the
-        event to be produced.
+        event to be produced. They are gathered with the outputs settings in an
+        :py:class:`OutputsPlan` when the method is called for the first time.
+
+        Other reduction strategies can be selected for each output by its ``filter``
+        setting (see :py:mod:`pycstbox.hal.filters`), the small variations threshold
+        being ignored in this case.
+
+        The values of an output can also be aggregated over windows of reads by its
+        ``aggregate`` setting (see :py:mod:`pycstbox.hal.aggregation`), only the aggregates
+        being processed as described above. The time to live of the events is thus checked
+        at the end of the windows only.
+
+        Devices having many outputs can return their values as a NumPy array, the
+        position of the outputs in the array being given by :py:attr:`array_outputs`.
+        The change detection is then vectorized, and only the events of the changed
+        outputs are built.
 
         :param tuple output_values:
             a tuple containing the values produced by the output(s) of the
-            device. Output values set to None are silently ignored
+            device. Output values set to None (NaN in arrays) are silently ignored
 
         :returns list: a (possibly empty) list of events to be emitted
         """
+        plan = self._plan or self.get_outputs_plan()
+        if type(output_values) is not plan.values_type:
+            plan.bind(type(output_values), self.array_outputs)
+        now = self.clock()
+        events_ttl = self._events_ttl if self.ttl_refresh else None
+
+        if plan.vectorized:
+            changed, values = plan.process_array(output_values, now, events_ttl)
+            outputs = plan.outputs
+            events = []
+            for i, value in zip(changed, values):
+                var_type, var_name, units = outputs[i][:3]
+                events.append(evts.BasicEvent(
+                    var_type, var_name, {_VALUE: value, _UNIT: units} if units else {_VALUE: value}
+                ))
+            return events
+
+        if plan.array:
+            output_values = [None if v != v else v for v in output_values.tolist()]
+        elif not plan.indexed:
+            output_values = [getattr(output_values, name) for name in plan.names]
+
+        prev_values, event_times = plan.prev_values, plan.event_times
         events = []
 
-        for output, output_cfg in [
-            (k, v) for k,v in self._cfg.outputs.iteritems() if v['enabled']
-        ]:
-            try:
-                prev = self._prev_values[output]
-            except KeyError:
-                prev = None
-
-            raw_value = getattr(output_values, output)
+        for i, index, var_type, var_name, units, prec, delta_min, output_filter, aggregator in plan.entries:
+            raw_value = output_values[index]
             if raw_value is None:
                 continue
+            if aggregator is not None:
+                raw_value = aggregator.add(raw_value, now)
+                if raw_value is None:
+                    continue
 
-            value = round(raw_value, output_cfg['prec'])
-            var_type, units = self.get_output_data_definition(output)
-            var_name = output_cfg['varname']
+            value = round(raw_value, prec)
+            prev = prev_values[i]
 
             # Small variations filtering
 
@@ -141,25 +402,99 @@ class HalDevice(object):    #pylint: disable=R0922
             # ignoring the new one.
             # This is done so that the event time to live mechanism is not
             # altered by the filtering.
-            delta_min = output_cfg['delta_min']
-            if delta_min and prev is not None and abs(value - prev) <= delta_min:
-                value = prev
-
-            # compute the age of last event we sent for this variable
-            now = time.time()
-            evt_age = now - self._last_event_times.get(var_name, 0)
+            if output_filter is not None:
+                # the filter decides alone, and can notify the same value again
+                value = output_filter.update(value, now, prev, event_times[i])
+                changed = value is not None
+                if not changed:
+                    value = prev
+            else:
+                if delta_min and prev is not None and abs(value - prev) <= delta_min:
+                    value = prev
+                changed = value != prev
 
             # if the value has changed since last time, or if last
             # notification is too old, add an event to the send list
-            if value != prev or (
-                self._events_ttl is not None and evt_age >= self._events_ttl
-            ):
-                events.append(evts.make_basic_event(var_type, var_name, value, units))
-                self._prev_values[output] = value
-                self._last_event_times[var_name] = now
+            if changed or (events_ttl is not None and now - event_times[i] >= events_ttl):
+                events.append(evts.BasicEvent(
+                    var_type, var_name, {_VALUE: value, _UNIT: units} if units else {_VALUE: value}
+                ))
+                prev_values[i] = value
+                event_times[i] = now
 
         return events
 
+    def get_outputs_plan(self):
+        """ Returns the processing plan of the device outputs, compiling it from the device
+        configuration if not yet done.
+
+        :rtype: OutputsPlan
+        """
+        if not self._plan:
+            names, outputs = [], []
+            for output, output_cfg in self._cfg.outputs.iteritems():
+                if output_cfg['enabled']:
+                    var_type, units = self.get_output_data_definition(output)
+                    names.append(output)
+                    outputs.append((
+                        var_type, output_cfg['varname'], units, output_cfg['prec'], output_cfg['delta_min'],
+                        self._filters.get(output), self._aggregators.get(output)
+                    ))
+            self._plan = OutputsPlan(tuple(names), tuple(outputs))
+        return self._plan
+
+    def inherit_outputs_state(self, other):
+        """ Takes over the notification state of the outputs from another instance of the device.
+
+        Used when a device is replaced by a reconfigured instance, so that unchanged values are
+        not notified again. The filters and aggregators of the outputs which settings have not
+        changed are taken over too, so that their pending state (filter reference values,
+        current aggregation windows) is not lost. Outputs which are not there anymore are ignored.
+
+        :param HalDevice other: the replaced instance
+        """
+        for setting, own, others in (
+            (ConfigurationParms.FILTER, self._filters, other._filters),
+            (ConfigurationParms.AGGREGATE, self._aggregators, other._aggregators)
+        ):
+            for output in own.keys():
+                if output in others and \
+                        self._cfg.outputs[output].get(setting) == other._cfg.outputs[output].get(setting):
+                    own[output] = others[output]
+        # the plan refers to the filters and aggregators
+        self._plan = None
+        self.get_outputs_plan().set_state(other.get_outputs_plan().get_state())
+
+    def get_filters_stats(self):
+        """ Returns the stats of the output filters.
+
+        :returns dict: the stats of each filtered output (see :py:meth:`pycstbox.hal.filters.OutputFilter.as_dict`)
+        """
+        return {output: output_filter.as_dict() for output, output_filter in self._filters.iteritems()}
+
+    def get_aggregators_stats(self):
+        """ Returns the stats of the output aggregators.
+
+        :returns dict: the stats of each aggregated output
+            (see :py:meth:`pycstbox.hal.aggregation.Aggregator.as_dict`)
+        """
+        return {output: aggregator.as_dict() for output, aggregator in self._aggregators.iteritems()}
+
+    def get_output_value(self, output_values, output):
+        """ Returns the value of an output among the values read from the device.
+
+        :param output_values: the output values, as returned by the HW device poll
+        :param str output: the name of the output
+        :returns: the value, or None if not available
+        """
+        if numpy is not None and isinstance(output_values, numpy.ndarray):
+            try:
+                value = output_values[self.array_outputs.index(output)].item()
+            except (AttributeError, ValueError, IndexError):
+                return None
+            return None if value != value else value
+        return getattr(output_values, output, None)
+
     @classmethod
     def get_output_data_definition(cls, output):
         """ Returns the type of the data and its units (if any) for a given
@@ -219,15 +554,39 @@ class PolledDevice(HalDevice):  #pylint: disable=W0223
         (and will be no more polled) if not compliant.
     """
 
+    BUS_GAP = None
+    """ Minimum silence required on the bus after a transaction with the device (in seconds).
+    Drivers of devices having such a requirement override it, the one of the coordinator
+    being used otherwise. """
+
     def __init__(self, coord_cfg, dev_cfg):
         """ Refer to :py:class:`pycstbox.hal.device.HalDevice` for parameters definition."""
         super(PolledDevice, self).__init__(coord_cfg, dev_cfg)
         self._hwdev = None
         self._is_checked = self._is_valid = False
+        # last output values read from the device, and when they have been read
+        self.last_outputs = self.last_read_time = None
+        # the pycstbox.hal.replay.PollRecorder the read output values are recorded by, if any
+        self.recorder = None
 
     def poll(self):
         """ Refer to :py:class:`pycstbox.hal.device.HalDevice` for details."""
+        output_values = self.read_outputs()
+        if output_values is None:
+            return
+        return self.process_outputs(output_values)
+
+    def read_outputs(self):
+        """ Reads the outputs of the device, without processing them.
 
+        This is the part of the poll dialoging with the equipment, which is the one the
+        coordinator supervises when a polling timeout is defined, the processing of the
+        values being done by :py:meth:`process_outputs` once they are read.
+
+        :returns: the output values, as returned by the HW device poll, or None if the device
+            is not valid
+        :raises CommunicationError: if the communication with the device failed
+        """
         # check that the sub-class has properly initialized the HW device
         # interface with a valid instance, and invalidates the device otherwise
         if not self._is_checked:
@@ -254,14 +613,62 @@ class PolledDevice(HalDevice):  #pylint: disable=W0223
             raise CommunicationError(self._cfg.uid, e)
 
         else:
-            if output_values:
-                # build the corresponding event list
+            return output_values
 
-                # emit events for all enabled outputs for which the value has changed
-                # since last time
-                return self.create_events(output_values)
-            else:
-                return []
+    def process_outputs(self, output_values):
+        """ Returns the events corresponding to the output values read from the device.
+
+        The output values are also kept as :py:attr:`last_outputs`, for answering the on-demand
+        reads without polling the device again, and recorded if a :py:attr:`recorder` is attached.
+
+        :param output_values: the output values, as returned by the HW device poll
+        :returns list: a (possibly empty) list of events to be emitted
+        """
+        if numpy is not None and isinstance(output_values, numpy.ndarray):
+            has_values = output_values.size > 0
+        else:
+            has_values = bool(output_values)
+
+        if has_values:
+            self.last_outputs, self.last_read_time = output_values, self.clock()
+            if self.recorder:
+                self.recorder.record(
+                    self._cfg.uid, self.last_read_time, output_values, self._cfg.outputs, self.get_output_value
+                )
+
+            # build the corresponding event list
+
+            # emit events for all enabled outputs for which the value has changed
+            # since last time
+            return self.create_events(output_values)
+        else:
+            return []
+
+    def batch_key(self):
+        """ Returns the key identifying the devices which can be read together with this one
+        in a single request.
+
+        Devices attached to the same bus and returning the same key will be grouped by the
+        polling scheduler when due at the same time, and read by :py:meth:`batch_poll`.
+
+        The default implementation returns None, which means that the device does not
+        support batched reads.
+        """
+        return None
+
+    def batch_poll(self, devices):
+        """ Reads the outputs of several devices in a single request.
+
+        Invoked on one of the devices of the batch, which all share the same :py:meth:`batch_key`.
+        Must be implemented by sub-classes returning a batch key.
+
+        :param list devices: the devices to be read, this one included
+        :returns list: the output values of each device (as returned by the HW device poll), in the
+            same order as the devices. An item can be an exception instance if the read failed
+            for the corresponding device only.
+        :raises IOError: if the request failed as a whole
+        """
+        raise NotImplementedError()
 
     def terminate(self):
         """ Sends a termination signal to the device, to let it gently stops if needed
@@ -287,3 +694,8 @@ class PollingError(Exception):
 class CommunicationError(PollingError):
     def _get_message(self):
         return 'communication error'
+
+
+class PollTimeoutError(PollingError):
+    def _get_message(self):
+        return 'poll timeout'
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Filters reducing the count of events produced for the outputs of the devices.
+
+The ``delta_min`` setting of the outputs ignores the variations under an absolute threshold.
+The filters provide other reduction strategies, and are selected by the ``filter`` setting
+of the outputs, given as ``<type>:<parameters>``:
+
+``deadband:<delta>``
+    the variations under an absolute threshold are ignored
+``percent:<percent>[,<delta>]``
+    the variations under a percentage of the last notified value are ignored, the threshold
+    being not less than `delta` (default: 0)
+``hysteresis:<delta>[,<reversal>]``
+    the variations under `delta` are ignored, and so are the ones under `reversal`
+    (default: 2 x `delta`) if they reverse the direction of the last notified one
+``integrating:<area>``
+    a value is notified when the integral of its deviation from the last notified one
+    exceeds `area` (in value units x seconds)
+``swinging_door:<error>``
+    swinging door compression: the notified values are the end points of segments from
+    which the values read in between do not deviate by more than `error`
+
+Each filter counts the values it has processed and the ones it has notified, their ratio
+being its compression ratio, reported in the polling stats.
+"""
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+
+class OutputFilter(object):
+    """ Root class of the output filters.
+
+    The values to be notified are decided by :py:meth:`_filter`, which is not invoked for the
+    first value read, since always notified.
+    """
+    __slots__ = ('samples', 'notified')
+
+    TYPE = None
+    """ Type name of the filter, as used in the configuration """
+
+    def __init__(self):
+        self.samples = self.notified = 0
+
+    def update(self, value, now, prev, prev_time):
+        """ Processes a value read from the device.
+
+        :param float value: the value (rounded to the precision of the output)
+        :param float now: the time of the read
+        :param prev: the last notified value, or None if nothing notified yet
+        :param float prev_time: the time of the last notification
+        :returns: the value to be notified, or None if the value must be filtered out
+        """
+        self.samples += 1
+        if prev is None:
+            self._reset(value, now)
+        else:
+            value = self._filter(value, now, prev, prev_time)
+            if value is None:
+                return None
+        self.notified += 1
+        return value
+
+    def _reset(self, value, now):
+        """ Initializes the state of the filter when the first value is notified."""
+        pass
+
+    def _filter(self, value, now, prev, prev_time):
+        """ Returns the value to be notified, or None if the read value must be filtered out.
+
+        See :py:meth:`update` for the parameters.
+        """
+        raise NotImplementedError()
+
+    @property
+    def compression_ratio(self):
+        return float(self.samples) / self.notified if self.notified else 0.
+
+    def as_dict(self):
+        return {
+            'type': self.TYPE,
+            'samples': self.samples,
+            'notified': self.notified,
+            'ratio': round(self.compression_ratio, 2)
+        }
+
+
+class Deadband(OutputFilter):
+    """ Absolute deadband filter."""
+    __slots__ = ('delta',)
+
+    TYPE = 'deadband'
+
+    def __init__(self, delta):
+        super(Deadband, self).__init__()
+        self.delta = delta
+
+    def _filter(self, value, now, prev, prev_time):
+        return value if abs(value - prev) > self.delta else None
+
+
+class PercentDeadband(OutputFilter):
+    """ Deadband filter which threshold is a percentage of the last notified value."""
+    __slots__ = ('ratio', 'delta')
+
+    TYPE = 'percent'
+
+    def __init__(self, percent, delta=0.):
+        super(PercentDeadband, self).__init__()
+        self.ratio = percent / 100.
+        self.delta = delta
+
+    def _filter(self, value, now, prev, prev_time):
+        return value if abs(value - prev) > max(abs(prev) * self.ratio, self.delta) else None
+
+
+class Hysteresis(OutputFilter):
+    """ Deadband filter requiring a larger variation for reversing the direction of the
+    notified values, so that a signal oscillating around a value does not flood the bus.
+    """
+    __slots__ = ('delta', 'reversal', 'direction')
+
+    TYPE = 'hysteresis'
+
+    def __init__(self, delta, reversal=None):
+        super(Hysteresis, self).__init__()
+        self.delta = delta
+        self.reversal = reversal if reversal is not None else 2 * delta
+        self.direction = 0
+
+    def _reset(self, value, now):
+        self.direction = 0
+
+    def _filter(self, value, now, prev, prev_time):
+        change = value - prev
+        if not change:
+            return None
+        direction = 1 if change > 0 else -1
+        threshold = self.delta if self.direction in (0, direction) else self.reversal
+        if abs(change) <= threshold:
+            return None
+        self.direction = direction
+        return value
+
+
+class IntegratingDeadband(OutputFilter):
+    """ Filter notifying a value when the accumulated deviation from the last notified one
+    exceeds a given area, so that small but lasting deviations are notified too.
+    """
+    __slots__ = ('area', 'accumulated', 'last_time')
+
+    TYPE = 'integrating'
+
+    def __init__(self, area):
+        super(IntegratingDeadband, self).__init__()
+        self.area = area
+        self.accumulated = 0.
+        self.last_time = None
+
+    def _reset(self, value, now):
+        self.accumulated = 0.
+        self.last_time = now
+
+    def _filter(self, value, now, prev, prev_time):
+        last_time = self.last_time if self.last_time is not None else prev_time
+        self.last_time = now
+        self.accumulated += abs(value - prev) * max(now - last_time, 0)
+        if self.accumulated <= self.area:
+            return None
+        self.accumulated = 0.
+        return value
+
+
+class SwingingDoor(OutputFilter):
+    """ Swinging door compression.
+
+    The values are notified so that the linear interpolation between the notified ones does
+    not deviate from the read ones by more than the error bound. Since the end point of a
+    segment is known when the next read value breaks the door, it is notified at that time,
+    ie one poll period after it has been read.
+    """
+    __slots__ = ('error', 'origin', 'last', 'low', 'high')
+
+    TYPE = 'swinging_door'
+
+    def __init__(self, error):
+        super(SwingingDoor, self).__init__()
+        self.error = error
+        self.origin = self.last = None
+        self.low = self.high = 0.
+
+    def _reset(self, value, now):
+        self.origin, self.last = (now, value), None
+
+    def _open(self, value, now):
+        """ Opens the door from the current origin with a read value.
+
+        The door is the range of the slopes of the segments starting from the origin which
+        pass within the error bound of the values read since then.
+        """
+        origin_time, origin_value = self.origin
+        dt = now - origin_time
+        self.low = (value - self.error - origin_value) / dt
+        self.high = (value + self.error - origin_value) / dt
+        self.last = (now, value)
+
+    def _filter(self, value, now, prev, prev_time):
+        if self.origin is None:
+            # the previous notification has been done by another instance of the device
+            self.origin = (prev_time, prev)
+        if now <= self.origin[0]:
+            return None
+        if self.last is None:
+            self._open(value, now)
+            return None
+
+        # the read value can end the segment if it is within the door
+        origin_time, origin_value = self.origin
+        dt = now - origin_time
+        if self.low <= (value - origin_value) / dt <= self.high:
+            self.low = max(self.low, (value - self.error - origin_value) / dt)
+            self.high = min(self.high, (value + self.error - origin_value) / dt)
+            self.last = (now, value)
+            return None
+
+        # otherwise the last read value ends the segment and starts the next one
+        self.origin = self.last
+        self._open(value, now)
+        return self.origin[1]
+
+
+FILTER_CLASSES = {cls.TYPE: cls for cls in (Deadband, PercentDeadband, Hysteresis, IntegratingDeadband, SwingingDoor)}
+
+
+def make_filter(spec):
+    """ Creates a filter from its specification.
+
+    :param str spec: the filter specification, as ``<type>:<parameters>``, the parameters being
+        separated by commas
+    :rtype: OutputFilter
+    :raises ValueError: if the specification is invalid
+    """
+    filter_type, _, parms = spec.partition(':')
+    try:
+        cls = FILTER_CLASSES[filter_type.strip()]
+    except KeyError:
+        raise ValueError('unknown filter type : %s' % filter_type)
+    try:
+        return cls(*[float(p) for p in parms.split(',') if p.strip()])
+    except (TypeError, ValueError):
+        raise ValueError('invalid filter parameters : %s' % spec)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Coordinator level refresh of the variables which value does not change.
+
+Without it, the last event of a variable is emitted again by the device when polled after
+the events time to live of the device has expired. All the variables of a device thus
+being refreshed together, and devices being often configured the same way, the refreshes
+come in bursts. Devices which are not polled are never refreshed.
+
+The heartbeat tracks the last emission of each variable of the coordinator, and emits a
+keep-alive when its time to live is about to expire. The keep-alive deadlines are spread
+over the second half of the time to live, based on the variable name, so that variables
+notified together are not refreshed together.
+
+The keep-alive can be the last event of the variable, or a single "still alive" event
+listing all the variables refreshed at the same time, for the consumers supporting them.
+"""
+
+import json
+import threading
+import time
+
+from pycstbox.hal.scheduler import PollScheduler, hash_phase
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+HEARTBEAT_OFF = 'off'
+HEARTBEAT_ON = 'on'
+HEARTBEAT_BATCH = 'batch'
+HEARTBEAT_MODES = (HEARTBEAT_OFF, HEARTBEAT_ON, HEARTBEAT_BATCH)
+
+ALIVE_VAR_TYPE = 'alive'
+""" Variable type of the "still alive" events, which var name is the coordinator id and
+which data contain the list of the refreshed variables """
+
+TICK = 1.
+""" Period of the check of the due keep-alives (in seconds) """
+
+
+class Heartbeat(object):
+    """ Keep-alive scheduler of the variables of a coordinator.
+
+    It is thread safe, since the emitted events can be notified by the polling thread
+    while the keep-alives are sent by the main loop.
+    """
+    SPREAD = 0.5
+    """ Fraction of the time to live over which the keep-alive deadlines are spread """
+
+    MAX_BATCH = 100
+    """ Maximum count of variables listed in a "still alive" event """
+
+    def __init__(self, coordinator_id, emit, batch=False, clock=time.time):
+        """
+        :param str coordinator_id: the id of the coordinator
+        :param callable emit: the function emitting an event, called with the variable type,
+            the variable name and the JSON data of the event
+        :param bool batch: if True, the keep-alives are sent as "still alive" events
+        :param callable clock: the time source
+        """
+        self._cid = coordinator_id
+        self._emit = emit
+        self._batch = batch
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._scheduler = PollScheduler()
+        self._ttls = {}
+        self._refreshes = 0
+
+    def set_variables(self, ttls):
+        """ Defines the variables to be kept alive.
+
+        The variables which are not part of the new set are forgotten.
+
+        :param dict ttls: the time to live of the variables, keyed by variable name
+        """
+        with self._lock:
+            for var_name in [k for k in self._ttls if k not in ttls]:
+                self._scheduler.cancel(var_name)
+            self._ttls = dict(ttls)
+
+    def notified(self, var_type, var_name, data):
+        """ Records the emission of an event, and schedules the keep-alive of its variable.
+
+        Events of unknown variables are ignored.
+
+        :param str var_type: the variable type
+        :param str var_name: the variable name
+        :param str data: the JSON data of the event
+        """
+        with self._lock:
+            self._schedule((var_type, var_name, data), self._clock())
+
+    def _schedule(self, event, now):
+        var_name = event[1]
+        try:
+            ttl = self._ttls[var_name]
+        except KeyError:
+            return
+        spread = ttl * self.SPREAD
+        self._scheduler.schedule(var_name, now + ttl - spread + hash_phase(var_name, spread), event)
+
+    def refresh(self):
+        """ Emits the keep-alives which are due.
+
+        :returns int: the count of refreshed variables
+        """
+        now = self._clock()
+        due = []
+        with self._lock:
+            while True:
+                schedule = self._scheduler.pop_due(now)
+                if not schedule:
+                    break
+                due.append(schedule.task)
+                self._schedule(schedule.task, now)
+            self._refreshes += len(due)
+
+        if self._batch:
+            for i in xrange(0, len(due), self.MAX_BATCH):
+                self._emit(ALIVE_VAR_TYPE, self._cid, json.dumps({'vars': [e[1] for e in due[i:i + self.MAX_BATCH]]}))
+        else:
+            for event in due:
+                self._emit(*event)
+        return len(due)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'variables': len(self._ttls),
+                'tracked': len(self._scheduler),
+                'refreshes': self._refreshes,
+                'next': self._scheduler.next_time()
+            }
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Synthetic devices used by the ``cbx-loadgen`` script for putting load on the HAL and
+the events chain without any hardware.
+
+They are not part of the drivers package nor described in the metadata, so that they are
+never offered on a real box. They are registered by :py:class:`LoadGenCoordinatorServiceObject`
+when the load generator creates its coordinators.
+"""
+
+import time
+
+from pycstbox.hal.device import PolledDevice, EventDataDef
+from pycstbox.hal.drivers import get_hal_device_classes
+from pycstbox.hal.network import DetachableCoordinatorServiceObject
+from pycstbox.hal.simulation import SyntheticHwDevice
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+COORDINATOR_TYPE = 'loadgen'
+DEVICE_TYPE = 'synthetic'
+
+
+class SyntheticLoadDevice(PolledDevice):
+    """ Device producing random walk values, polled in real time.
+
+    Any number of outputs can be configured, all of them producing values of the type
+    of the ``value`` output. The change rate of the values, the noise added to them, the
+    failures ratio and the duration of the polls are taken from the device configuration.
+    """
+    _OUTPUTS_TO_EVENTS_MAPPING = {'value': EventDataDef('temperature', 'degC')}
+
+    def __init__(self, coord_cfg, dev_cfg):
+        super(SyntheticLoadDevice, self).__init__(coord_cfg, dev_cfg)
+        self._hwdev = SyntheticHwDevice(
+            time,
+            latency=float(getattr(dev_cfg, 'latency', 0.01)),
+            change_ratio=float(getattr(dev_cfg, 'change_ratio', 0.1)),
+            failure_ratio=float(getattr(dev_cfg, 'failure_ratio', 0)),
+            seed=dev_cfg.uid,
+            outputs=tuple(sorted(dev_cfg.outputs)),
+            noise=float(getattr(dev_cfg, 'noise', 0))
+        )
+
+    @classmethod
+    def get_output_data_definition(cls, output):
+        return cls._OUTPUTS_TO_EVENTS_MAPPING['value']
+
+
+class LoadGenCoordinatorServiceObject(DetachableCoordinatorServiceObject):
+    """ Coordinator of the synthetic devices.
+
+    The synthetic devices do not use D-Bus, and can thus be polled in worker processes.
+    Their driver is registered when the coordinator is created, in the worker process
+    too if any.
+    """
+    def __init__(self, cid):
+        get_hal_device_classes()[DEVICE_TYPE] = SyntheticLoadDevice
+        super(LoadGenCoordinatorServiceObject, self).__init__(cid)
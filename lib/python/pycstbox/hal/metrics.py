@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Lightweight metrics used for the polling statistics.
+
+They are designed to be updated at each poll with a negligible cost, and to be
+serialized as plain dictionaries for persistence and D-Bus publication.
+"""
+
+import bisect
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+
+class Histogram(object):
+    """ Fixed buckets histogram of durations.
+
+    Bucket `i` counts the values less than or equal to ``BOUNDS[i]`` and greater than
+    the previous bound. An extra last bucket counts the values above the last bound.
+    """
+    __slots__ = ['counts', 'count', 'sum', 'max']
+
+    BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1., 2., 5., 10., 30.)
+    """ Upper bounds of the buckets (in seconds) """
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+
+    def add(self, value):
+        """ Adds a value to the histogram.
+
+        :param float value: the value (in seconds)
+        """
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """ Adds the values of another histogram to this one.
+
+        :param Histogram other: the histogram to be merged
+        """
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.sum += other.sum
+        if other.max > self.max:
+            self.max = other.max
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.
+
+    def percentile(self, p):
+        """ Returns an upper estimation of a percentile, i.e. the bound of the bucket containing it
+        (or the maximum value if lower).
+
+        :param float p: the percentile (in [0, 100])
+        :returns: the estimated value, or 0 if the histogram is empty
+        """
+        if not self.count:
+            return 0.
+        threshold = self.count * p / 100.
+        cumulated = 0
+        for i, n in enumerate(self.counts):
+            cumulated += n
+            if cumulated >= threshold:
+                return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+        return self.max
+
+    def __str__(self):
+        return "count=%d mean=%.3f p95=%.3f max=%.3f" % (self.count, self.mean, self.percentile(95), self.max)
+
+    def as_dict(self):
+        # the counts are copied, since the result is serialized after the stats lock is released
+        return {
+            'bounds': self.BOUNDS,
+            'counts': list(self.counts),
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        inst = cls()
+        # ignore saved data if the buckets have changed since
+        if len(d.get('counts', [])) == len(inst.counts):
+            inst.counts = list(d['counts'])
+            inst.count, inst.sum, inst.max = d['count'], d['sum'], d['max']
+        return inst
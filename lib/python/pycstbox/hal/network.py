@@ -33,25 +33,48 @@ sub-system of the equipment support software pick only the devices and coordinat
 it knows how to handle.
 """
 
+import os
+import sys
 import threading
 import time
-from collections import namedtuple
+from collections import namedtuple, deque, defaultdict
+from functools import partial
+import itertools
 import json
+import Queue
+import multiprocessing
+import signal
+import subprocess
 
 import dbus.service
 from dbus.exceptions import DBusException
+import gobject
 
+from pycstbox import dbuslib
 from pycstbox.service import ServiceContainer
 from pycstbox.sysutils import parse_period
 import pycstbox.evtmgr
 from pycstbox.hal.drivers import get_hal_device_classes
 from pycstbox.hal import HalError
 from pycstbox.log import Loggable
-from pycstbox.hal.device import CommunicationError
+from pycstbox.hal.device import PolledDevice, CommunicationError, PollTimeoutError, get_events_ttl
 from pycstbox.hal.device import log_setLevel as haldev_log_setLevel
-from pycstbox.devcfg import Metadata, ConfigurationParms
+from pycstbox.hal.scheduler import PollScheduler, AdaptivePeriod, CircuitBreaker, BusPacer, plan_phases
+from pycstbox.hal.scheduler import PHASING_HASH, PHASING_MODES, CIRCUIT_CLOSED
+from pycstbox.hal.scheduler import PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_COMMAND, PRIORITY_CLASSES
+from pycstbox.hal.metrics import Histogram
+from pycstbox.hal.replay import PollRecorder, ReplayDevice, ReplayHwDevice, load_recording
+from pycstbox.hal.heartbeat import Heartbeat, HEARTBEAT_OFF, HEARTBEAT_BATCH, HEARTBEAT_MODES
+from pycstbox.hal.heartbeat import TICK as HEARTBEAT_TICK
+import pycstbox.cfgbroker
+from pycstbox.events import DataKeys
+from pycstbox.devcfg import Metadata, ConfigurationParms, Device, DevCfgObject, DevCfgError
 
 OBJECT_PATH = "/service"
+SERVICE_INTERFACE = dbuslib.make_interface_name('DeviceNetwork')
+
+# variable type of the polling statistics events published on the sysmon channel
+POLLING_STATS_VAR_TYPE = 'pollstats'
 
 
 class DeviceNetworkSvc(ServiceContainer):
@@ -61,8 +84,16 @@ class DeviceNetworkSvc(ServiceContainer):
     Each sub-network attached to a given interface is represented by an
     independent service object responsible for managing the connected
     equipments.
+
+    In multi-process mode, the coordinators are run in worker processes, so that
+    their polling is not limited to a single core by the GIL. Only the coordinators
+    which class is declared as detachable are concerned (see
+    :py:class:`DetachableCoordinatorServiceObject`). Coordinators sharing the same value
+    for their ``process`` configuration setting are run in the same worker, the others
+    having a dedicated one. The service process remains the D-Bus facade of the
+    coordinators (see :py:class:`CoordinatorWorker`).
     """
-    def __init__(self, conn, svc_name, coord_types=None, coord_typemap=None):
+    def __init__(self, conn, svc_name, coord_types=None, coord_typemap=None, multiprocess=False):
         """
         :param Connection conn:
             the D-Bus connection of the container
@@ -77,9 +108,12 @@ class DeviceNetworkSvc(ServiceContainer):
             a dictionary providing for each coordinator type the associated
             implementation class. If both coord_types and coord_typemap parameters
             are used, coord_types is discarded.
+        :param bool multiprocess:
+            if True, the coordinators are run in worker processes
         """
         super(DeviceNetworkSvc, self).__init__(svc_name, conn)
         self._loaded = False
+        self._multiprocess = multiprocess
 
         if coord_typemap:
             self._coord_types = coord_typemap
@@ -109,13 +143,21 @@ class DeviceNetworkSvc(ServiceContainer):
         # create a service object for each known hardware interface
         # and load the configuration of the devices connected to it
         cnt = 0
+        workers = {}
         for cid, cfg_coord in [
             (cid, cfg_coord) for cid, cfg_coord in cfg.iteritems()
             if cfg_coord.type in self._coord_types
         ]:
             coord_class = self._coord_types[cfg_coord.type]
-            self.log_info('creating coordinator id=%s class=%s', cid, coord_class.__name__)
-            so = coord_class(cid)
+            if self._multiprocess and coord_class.DETACHABLE:
+                process = getattr(cfg_coord, ConfigurationParms.PROCESS, None) or cid
+                self.log_info('creating coordinator id=%s class=%s process=%s', cid, coord_class.__name__, process)
+                if process not in workers:
+                    workers[process] = CoordinatorWorker(process)
+                so = CoordinatorProxy(cid, coord_class, workers[process])
+            else:
+                self.log_info('creating coordinator id=%s class=%s', cid, coord_class.__name__)
+                so = coord_class(cid)
             so.log_setLevel(self.log_getEffectiveLevel())
             try:
                 so.load_configuration(cfg_coord)
@@ -137,16 +179,68 @@ DeviceListEntry = namedtuple('DeviceListEntry', ['id_', 'cfg', 'haldev'])
 :key haldev: the instance of HalDevice implementing the abstraction for the device
 """
 
-PollTask = namedtuple('PollTask', ['dev', 'period'])
-""" Named tuple describing a polling task for a given device.
 
-:key dev: the instance of the related device
-:key period: the polling period (in seconds)
-"""
+class PollTask(object):
+    """ Polling task for a given device.
+
+    :ivar dev: the instance of the related device
+    :ivar period: the current polling period (in seconds)
+    :ivar bus: the identifier of the bus the device is reached through. Polls of devices
+        sharing the same bus are never executed concurrently.
+    :ivar adaptive: the :py:class:`pycstbox.hal.scheduler.AdaptivePeriod` instance driving
+        the period if adaptive polling is configured for the device, None otherwise
+    :ivar breaker: the :py:class:`pycstbox.hal.scheduler.CircuitBreaker` handling the
+        device failures
+    :ivar priority: the priority class of the task (see
+        :py:data:`pycstbox.hal.scheduler.PRIORITY_CLASSES`)
+    :ivar batch_key: the key grouping the devices of the bus which can be read in a single
+        request (None if the device does not support batched reads)
+    :ivar timeout: the delay after which a poll in progress is abandoned (in seconds, None
+        if the polls are not time limited)
+    :ivar gap: the minimum silence on the bus after a poll of the device (in seconds)
+    """
+    __slots__ = ['dev', 'period', 'bus', 'adaptive', 'breaker', 'priority', 'batch_key', 'timeout', 'gap']
+
+    def __init__(self, dev, period, bus, adaptive=None, breaker=None, priority=PRIORITY_NORMAL, batch_key=None,
+                 timeout=None, gap=0.):
+        self.dev, self.period, self.bus, self.adaptive = dev, period, bus, adaptive
+        self.breaker = breaker or CircuitBreaker()
+        self.priority = priority
+        self.batch_key = batch_key
+        self.timeout = timeout
+        self.gap = gap
+        if adaptive:
+            self.period = adaptive.period
+
+
+class CommandTask(object):
+    """ Command waiting to be applied to a control of a device.
+
+    :ivar dev: the instance of the related device
+    :ivar control: the name of the control
+    :ivar value: the value to be applied (the latest received one if several commands have
+        been coalesced)
+    :ivar bus: the identifier of the bus the device is reached through
+    :ivar issued: the time the command has been issued (used for measuring its latency)
+    :ivar gap: the minimum silence on the bus after the command (in seconds)
+    :ivar timeout: the delay after which the command is abandoned (in seconds, None if
+        not time limited)
+    """
+    __slots__ = ['dev', 'control', 'value', 'bus', 'issued', 'gap', 'timeout']
+
+    # commands are never batched with the polls
+    batch_key = None
+
+    def __init__(self, dev, control, value, bus, issued, gap=0., timeout=None):
+        self.dev, self.control, self.value, self.bus, self.issued = dev, control, value, bus, issued
+        self.gap, self.timeout = gap, timeout
+
 
 DFLT_POLL_PERIOD = 1                # secs
 DFLT_POLL_REQ_INTERVAL = 0          # secs
+DFLT_BACKOFF_MAX = 600              # secs
 DEFAULT_EVENTS_MAX_AGE = 2 * 3600   # 2 hours
+DFLT_READ_TIMEOUT = 10              # secs
 
 
 class CoordinatorServiceObject(dbus.service.Object, Loggable):
@@ -166,6 +260,12 @@ class CoordinatorServiceObject(dbus.service.Object, Loggable):
     dealing with network communicating through a serial port in a centralized
     way.
     """
+    DETACHABLE = False
+    """ Tells if the coordinator can be run in a worker process (see :py:class:`CoordinatorWorker`).
+
+    Coordinators must opt in explicitly, since neither them nor their drivers can use D-Bus
+    when run in a worker process. """
+
     def __init__(self, cid):
         """
         :param str cid: coordinator id
@@ -176,6 +276,28 @@ class CoordinatorServiceObject(dbus.service.Object, Loggable):
         self._evtmgr = None
         self._polling_thread = None
         self._poll_req_interval = None
+        self._poll_workers = 0
+        self._poll_phasing = PHASING_HASH
+        self._poll_timeout = 0
+        self._bus_gap = 0
+        self._bus_rate = 0
+        self._bus_burst = 1
+        self._backoff_max = DFLT_BACKOFF_MAX
+        self._stats_publish_period = 0
+        self._stats_publish_source = None
+        self._heartbeat_mode = HEARTBEAT_OFF
+        self._heartbeat = None
+        self._heartbeat_source = None
+        self._cfgchg_receiver = None
+        self._event_relay = None
+        self._control_receiver = None
+        self._record_path = self._replay_path = None
+        self._replay_speed = 1.
+        self._recorder = None
+        # the replayed reads of the devices, keyed by device id (None if not replaying)
+        self._replay_reads = None
+        # the device id and control name of the controls, keyed by variable name
+        self._controls = {}
         self._devices = {}
         self._error_count = 0
 
@@ -189,6 +311,21 @@ class CoordinatorServiceObject(dbus.service.Object, Loggable):
     def poll_req_interval(self):
         return self._poll_req_interval
 
+    @property
+    def bus_rate(self):
+        """ The maximum transactions rate of the buses (per second, 0 if not limited)."""
+        return self._bus_rate
+
+    @property
+    def bus_burst(self):
+        """ The number of transactions which can be sent in a row on an idle bus."""
+        return self._bus_burst
+
+    @property
+    def poll_workers(self):
+        """ The size of the polling workers pool (0 if devices are polled serially)."""
+        return self._poll_workers
+
     def __str__(self):
         return 'SO:' + self._cid
 
@@ -221,6 +358,7 @@ class CoordinatorServiceObject(dbus.service.Object, Loggable):
         self._cfg = cfg
         self._configure_coordinator(self._cfg)
         self._devices = self._configure_devices(self._cfg)
+        self._index_variables()
         self.log_info(hline)
         if self._error_count == 0:
             self.log_info("devices configuration successfully loaded")
@@ -251,6 +389,106 @@ class CoordinatorServiceObject(dbus.service.Object, Loggable):
         else:
             self.log_warn("no polling request interval specified")
 
+        # pacing of the buses : minimum silence after a transaction (defaulted to the
+        # polling request interval) and optional transactions rate limit
+        try:
+            self._bus_gap = parse_period(str(getattr(cfg, ConfigurationParms.BUS_GAP, ''))) or \
+                self._poll_req_interval
+        except ValueError as e:
+            self.log_error('%s -> bus gap defaulted to %ss', e, self._poll_req_interval)
+            self._bus_gap = self._poll_req_interval
+        try:
+            self._bus_rate = float(getattr(cfg, ConfigurationParms.BUS_RATE, 0))
+            if not 0 <= self._bus_rate < float('inf'):
+                raise ValueError()
+        except (TypeError, ValueError):
+            self.log_error(
+                'invalid bus transactions rate (%s) -> not limited', getattr(cfg, ConfigurationParms.BUS_RATE)
+            )
+            self._bus_rate = 0
+        try:
+            self._bus_burst = int(getattr(cfg, ConfigurationParms.BUS_BURST, 1))
+            if self._bus_burst < 1:
+                raise ValueError()
+        except (TypeError, ValueError):
+            self.log_error(
+                'invalid bus burst size (%s) -> defaulted to 1', getattr(cfg, ConfigurationParms.BUS_BURST)
+            )
+            self._bus_burst = 1
+        self.log_info('bus pacing : gap=%ss rate=%s/s burst=%d', self._bus_gap, self._bus_rate or '-', self._bus_burst)
+
+        # concurrent polling is opt-in, since only relevant for devices which can be
+        # reached independently (TCP gateways, devices on separate ports,...)
+        try:
+            self._poll_workers = int(getattr(cfg, ConfigurationParms.POLL_WORKERS, 0))
+            if self._poll_workers < 0:
+                raise ValueError()
+        except (TypeError, ValueError):
+            self.log_error(
+                'invalid polling workers count (%s) -> concurrent polling disabled',
+                getattr(cfg, ConfigurationParms.POLL_WORKERS)
+            )
+            self._poll_workers = 0
+        if self._poll_workers:
+            self.log_info('concurrent polling enabled (workers=%d)', self._poll_workers)
+
+        # initial phase of the polling tasks
+        phasing = getattr(cfg, ConfigurationParms.POLL_PHASING, PHASING_HASH)
+        if phasing in PHASING_MODES:
+            self._poll_phasing = phasing
+        else:
+            self.log_error('invalid polling phasing mode (%s) -> defaulted to %s', phasing, PHASING_HASH)
+        self.log_info('polling phasing mode : %s', self._poll_phasing)
+
+        # delay after which a poll in progress is abandoned (disabled if not set)
+        try:
+            self._poll_timeout = parse_period(str(getattr(cfg, ConfigurationParms.POLL_TIMEOUT, '')))
+        except ValueError as e:
+            self.log_error('%s -> polling timeout disabled', e)
+        if self._poll_timeout:
+            self.log_info('polling timeout : %ss', self._poll_timeout)
+
+        # upper limit of the delay between attempts to poll a failing device
+        try:
+            self._backoff_max = parse_period(str(getattr(cfg, ConfigurationParms.BACKOFF_MAX, ''))) or DFLT_BACKOFF_MAX
+        except (TypeError, ValueError) as e:
+            self.log_error('%s -> backoff limit defaulted to %ss', e, DFLT_BACKOFF_MAX)
+            self._backoff_max = DFLT_BACKOFF_MAX
+        self.log_info('failing devices backoff limit : %ss', self._backoff_max)
+
+        # period of the polling stats publication on the sysmon channel (disabled if not set)
+        try:
+            self._stats_publish_period = parse_period(str(getattr(cfg, ConfigurationParms.STATS_PUBLISH, '')))
+        except ValueError as e:
+            self.log_error('%s -> polling stats publication disabled', e)
+        if self._stats_publish_period:
+            self.log_info('polling stats published every %ss', self._stats_publish_period)
+
+        # refresh of the unchanged variables by the coordinator instead of the devices
+        heartbeat = str(getattr(cfg, ConfigurationParms.HEARTBEAT, '') or HEARTBEAT_OFF)
+        if heartbeat in HEARTBEAT_MODES:
+            self._heartbeat_mode = heartbeat
+        else:
+            self.log_error('invalid heartbeat mode (%s) -> defaulted to %s', heartbeat, HEARTBEAT_OFF)
+        self.log_info('heartbeat mode : %s', self._heartbeat_mode)
+
+        # recording of the devices reads, or replay of a recording instead of polling the devices
+        self._record_path = getattr(cfg, ConfigurationParms.RECORD, None)
+        self._replay_path = getattr(cfg, ConfigurationParms.REPLAY, None)
+        try:
+            self._replay_speed = float(getattr(cfg, ConfigurationParms.REPLAY_SPEED, 1))
+            if not 0 <= self._replay_speed < float('inf'):
+                raise ValueError()
+        except (TypeError, ValueError):
+            self.log_error(
+                'invalid replay speed (%s) -> defaulted to 1', getattr(cfg, ConfigurationParms.REPLAY_SPEED)
+            )
+            self._replay_speed = 1.
+        if self._record_path:
+            self.log_info('devices reads recorded in %s', self._record_path)
+        if self._replay_path:
+            self.log_info('devices reads replayed from %s (speed=%s)', self._replay_path, self._replay_speed or 'max')
+
     def _configure_devices(self, cfg):
         """ Load the configuration of the devices connected to this
         coordinator.
@@ -262,39 +500,116 @@ class CoordinatorServiceObject(dbus.service.Object, Loggable):
 
         :param dict cfg: coordinator's attached devices configuration (keyed by the device ids)
         :returns: the dictionary of device abstraction object instances, keyed by device ids
+        :raises HalError: if the recording to be replayed cannot be loaded
         """
+        if self._replay_path:
+            try:
+                self._replay_reads = load_recording(self._replay_path)
+            except (IOError, ValueError) as e:
+                raise HalError('cannot load recording %s : %s' % (self._replay_path, e))
+        elif self._record_path:
+            try:
+                self._recorder = PollRecorder(self._record_path)
+            except IOError as e:
+                self.log_error('cannot open recording %s : %s -> recording disabled', self._record_path, e)
+
         devices = {}
-        devclasses = get_hal_device_classes()
         for id_, cfg_dev in [(k, v) for k, v in cfg.iteritems() if v.enabled]:
-            self.log_info('loading configuration for device id=%s' % id_)
-            self.log_debug('- configuration : %s' % cfg_dev.js_dict())
-            _protocol, devtype = cfg_dev.type.split(':')
-            self.log_info('- device type : %s' % devtype)
-            if devtype in devclasses:
-                class_ = devclasses[devtype]
-                self.log_info('- driver class : %s' % class_.__name__)
+            dev = self._create_device(id_, cfg_dev)
+            if dev:
+                devices[id_] = dev
+            else:
+                self._error_count += 1
+        return devices
 
-                try:
-                    self.log_info('[%s] creating HW device instance', id_)
-                    haldev = class_(self._cfg, cfg_dev)
-                except Exception as e:
-                    if isinstance(e, HalError):
-                        self.log_error("[%s] %s", id_, e)
-                    else:
-                        self.log_exception("[%s] unexpected error : %s", id_, e)
-                    self.log_error('[%s] device ignored', id_)
-                    self._error_count += 1
-                else:
-                    hw_dev = haldev._hwdev
-                    if isinstance(hw_dev, Loggable):
-                        hw_dev.log_setLevel(self.log_getEffectiveLevel())
-                    hw_dev.poll_req_interval = self._poll_req_interval
-                    devices[id_] = DeviceListEntry(id_, cfg_dev, haldev)
-                    self.log_info('[%s] device registered', id_)
+    def _create_device(self, id_, cfg_dev):
+        """ Creates the abstraction object of a device.
 
+        :param str id_: the device id
+        :param devcfg.Device cfg_dev: the device configuration data
+        :returns: the :py:class:`DeviceListEntry` of the device, or None if it could not be created
+        """
+        self.log_info('loading configuration for device id=%s' % id_)
+        self.log_debug('- configuration : %s' % cfg_dev.js_dict())
+        _protocol, devtype = cfg_dev.type.split(':')
+        self.log_info('- device type : %s' % devtype)
+        devclasses = get_hal_device_classes()
+        if devtype not in devclasses:
+            self.log_error("[%s] no driver found for device type '%s'", id_, devtype)
+            return None
+
+        class_ = devclasses[devtype]
+        args = ()
+        if self._replay_reads is not None:
+            try:
+                reads = self._replay_reads[id_]
+            except KeyError:
+                self.log_error('[%s] device not found in replayed recording', id_)
+                return None
+            class_ = ReplayDevice.replaying(class_)
+            args = (ReplayHwDevice(reads, self._replay_speed),)
+        self.log_info('- driver class : %s' % class_.__name__)
+        try:
+            self.log_info('[%s] creating HW device instance', id_)
+            haldev = class_(self._cfg, cfg_dev, *args)
+        except Exception as e:
+            if isinstance(e, HalError):
+                self.log_error("[%s] %s", id_, e)
             else:
-                self.log_error("[%s] no driver found for device type '%s'", id_, devtype)
-        return devices
+                self.log_exception("[%s] unexpected error : %s", id_, e)
+            self.log_error('[%s] device ignored', id_)
+            return None
+
+        hw_dev = haldev._hwdev
+        if isinstance(hw_dev, Loggable):
+            hw_dev.log_setLevel(self.log_getEffectiveLevel())
+        hw_dev.poll_req_interval = self._poll_req_interval
+        if self._recorder and isinstance(haldev, PolledDevice):
+            haldev.recorder = self._recorder
+        if self._heartbeat_mode != HEARTBEAT_OFF:
+            haldev.ttl_refresh = False
+        self.log_info('[%s] device registered', id_)
+        return DeviceListEntry(id_, cfg_dev, haldev)
+
+    def _index_variables(self):
+        """ Updates the indexes of the variables of the devices, after a configuration change."""
+        self._index_controls()
+        if self._heartbeat:
+            self._heartbeat.set_variables(self._get_variables_ttl())
+
+    def _get_variables_ttl(self):
+        """ Returns the events time to live of the output variables of the devices, keyed by
+        variable name.
+        """
+        ttls = {}
+        for cfg_dev in (v for v in self._cfg.itervalues() if v.enabled):
+            ttl = get_events_ttl(cfg_dev)
+            cfg_outputs = getattr(cfg_dev, ConfigurationParms.DEVICE_OUTPUTS_SECTION, None) or {}
+            for cfg_output in cfg_outputs.itervalues():
+                if cfg_output.get('varname') and cfg_output.get('enabled', True):
+                    ttls[cfg_output['varname']] = ttl
+        return ttls
+
+    def _index_controls(self):
+        """ Builds the index used for routing the commands received on the control channel
+        to the devices, based on the ``controls`` section of their configuration.
+        """
+        controls = {}
+        for dev_id, cfg_dev in ((k, v) for k, v in self._cfg.iteritems() if v.enabled):
+            cfg_controls = getattr(cfg_dev, ConfigurationParms.DEVICE_CONTROLS_SECTION, None) or {}
+            for control, cfg_ctl in cfg_controls.iteritems():
+                var_name = cfg_ctl.get('varname')
+                if not var_name or not cfg_ctl.get('enabled', True):
+                    continue
+                if var_name in controls:
+                    self.log_error('[%s] control variable %s already used by %s -> ignored',
+                                   dev_id, var_name, controls[var_name][0])
+                    continue
+                controls[var_name] = (dev_id, control)
+        # replaced as a whole, since looked up from the main loop
+        self._controls = controls
+        if controls:
+            self.log_info('controls : %s', ', '.join(sorted(controls)))
 
     def send_command(self, command, callback=None):
         """ Provision for outbounds communication.
@@ -309,11 +624,42 @@ class CoordinatorServiceObject(dbus.service.Object, Loggable):
         """
         raise NotImplementedError()
 
+    def batch_poll(self, devices):
+        """ Reads a batch of devices attached to the same bus and sharing the same batch key
+        in a single request.
+
+        The default implementation delegates to the
+        :py:meth:`pycstbox.hal.device.PolledDevice.batch_poll` method of the first device.
+        Can be overridden by sub-classes for building requests at the bus level.
+
+        :param list devices: the :py:class:`DeviceListEntry` of the devices to be read
+        :returns list: the output values of each device, in the same order (see
+            :py:meth:`pycstbox.hal.device.PolledDevice.batch_poll`)
+        :raises NotImplementedError: if batched reads are not supported for these devices
+        """
+        haldevs = [d.haldev for d in devices]
+        return haldevs[0].batch_poll(haldevs)
+
+    def create_scheduler(self):
+        """ Returns the scheduler to be used by the polling thread.
+
+        Can be overridden by sub-classes to plug a specific implementation, which must
+        provide the same interface as :py:class:`pycstbox.hal.scheduler.PollScheduler`.
+        """
+        return PollScheduler()
+
     def start(self):    #pylint: disable=R0912
         """ Processing to be done when the service objet is started.
 
         Called automatically by the framework when the service is started.
         """
+        if self._event_relay:
+            # running in a worker process : D-Bus is handled by the service process
+            self._evtmgr = self._event_relay
+            self._start_devices()
+            self.log_info('started')
+            return
+
         try:
             self._evtmgr = pycstbox.evtmgr.get_object(pycstbox.evtmgr.SENSOR_EVENT_CHANNEL)
         except DBusException as e:
@@ -321,12 +667,73 @@ class CoordinatorServiceObject(dbus.service.Object, Loggable):
         else:
             self.log_info('connected to Event Manager')
 
-        # Build the polling scheduling list.
-        # List items are tuples composed of :
-        # - the device to be polled
-        # - the polling period of the device
-        # The list is sorted by increasing periods
-        sched_tasks = []
+        if self._heartbeat_mode != HEARTBEAT_OFF:
+            self._heartbeat = Heartbeat(self._cid, self._emit_keepalive, batch=self._heartbeat_mode == HEARTBEAT_BATCH)
+            self._heartbeat.set_variables(self._get_variables_ttl())
+            self._heartbeat_source = gobject.timeout_add(int(HEARTBEAT_TICK * 1000), self._refresh_variables)
+
+        self._start_devices()
+
+        if self._stats_publish_period:
+            self._stats_publish_source = gobject.timeout_add(
+                int(self._stats_publish_period * 1000), self._publish_polling_stats
+            )
+
+        # track the devices configuration changes, so that they can be applied without restarting
+        try:
+            self._cfgchg_receiver = dbuslib.get_bus().add_signal_receiver(
+                self._configuration_changed,
+                signal_name='changed',
+                dbus_interface=pycstbox.cfgbroker.SERVICE_INTERFACE
+            )
+        except DBusException as e:
+            self.log_error('cannot track configuration changes : %s', e)
+
+        # listen to the commands addressed to the devices controls
+        try:
+            self._control_receiver = dbuslib.get_bus().add_signal_receiver(
+                self._control_event,
+                signal_name='onCSTBoxEvent',
+                dbus_interface=pycstbox.evtmgr.SERVICE_INTERFACE,
+                path='/' + pycstbox.evtmgr.CONTROL_EVENT_CHANNEL
+            )
+        except DBusException as e:
+            self.log_error('cannot listen to the control channel : %s', e)
+
+        self.log_info('started')
+
+    def _start_devices(self):
+        """ Starts polling the devices."""
+        # Build the polling scheduling list, sorted by increasing periods
+        sched_tasks = filter(None, (self._create_poll_task(dev) for dev in self._devices.itervalues()))
+        if sched_tasks or self._controls:
+            sched_tasks.sort(key=lambda t: t.period)
+            self._start_polling(sched_tasks)
+        else:
+            self.log_info('no device to be scheduled')
+
+    def set_event_relay(self, relay):
+        """ Makes the coordinator emit its events to a given object instead of the Event Manager,
+        and not use D-Bus at all.
+
+        This is used when running the coordinator in a worker process (see :py:class:`CoordinatorWorker`).
+
+        :param relay: an object providing the ``emitEvent`` method of the Event Manager
+        """
+        self._event_relay = relay
+
+    def _create_poll_task(self, dev):
+        """ Creates the polling task of a device, based on its configuration.
+
+        :param DeviceListEntry dev: the device
+        :returns: the :py:class:`PollTask` of the device, or None if it is not a polled one
+        """
+        self.log_info(
+            'processing polling settings for device : %s' % dev.id_
+        )
+        if not dev.haldev.is_pollable():
+            self.log_info('- not a polled device')
+            return None
 
         def get_duration_setting(name, default_value):
             try:
@@ -342,43 +749,117 @@ class CoordinatorServiceObject(dbus.service.Object, Loggable):
                     self.log_error('- invalid value (%s) for "%s" -> defaulted to %s', s, name, default_value)
                     return default_value
 
-        for dev in self._devices.itervalues():
-            self.log_info(
-                'processing polling settings for device : %s' % dev.id_
-            )
-            if dev.haldev.is_pollable():
-                period = get_duration_setting(ConfigurationParms.POLL_PERIOD, DFLT_POLL_PERIOD)
+        period = get_duration_setting(ConfigurationParms.POLL_PERIOD, DFLT_POLL_PERIOD)
+        if period <= 0:
+            self.log_error('- invalid polling period (%s) -> defaulted to %s', period, DFLT_POLL_PERIOD)
+            period = DFLT_POLL_PERIOD
+
+        # adaptive polling is enabled by providing at least one of the period bounds
+        adaptive = None
+        if hasattr(dev.cfg, ConfigurationParms.POLL_PERIOD_MIN) or \
+                hasattr(dev.cfg, ConfigurationParms.POLL_PERIOD_MAX):
+            min_period = get_duration_setting(ConfigurationParms.POLL_PERIOD_MIN, period)
+            max_period = get_duration_setting(ConfigurationParms.POLL_PERIOD_MAX, period)
+            try:
+                adaptive = AdaptivePeriod(min_period, max_period, period)
+            except ValueError as e:
+                self.log_error('- %s -> adaptive polling disabled', e)
+            else:
+                self.log_info('- adaptive polling period in [%s, %s]', min_period, max_period)
 
-                # set the device poll request interval in case it uses multiple low level requests
-                dev.haldev.poll_req_interval = self._poll_req_interval
+        # set the device poll request interval in case it uses multiple low level requests
+        dev.haldev.poll_req_interval = self._poll_req_interval
 
-                sched_tasks.append(PollTask(dev, period))
+        bus = self._device_bus(dev)
+        if self._poll_workers:
+            self.log_info('- bus : %s', bus)
 
-            else:
-                self.log_info('- not a polled device')
+        # polls of higher priority devices are served first when the bus is late
+        priority_class = getattr(dev.cfg, ConfigurationParms.POLL_PRIORITY, 'normal')
+        try:
+            priority = PRIORITY_CLASSES[priority_class]
+        except KeyError:
+            self.log_error('- invalid priority (%s) -> defaulted to normal', priority_class)
+            priority = PRIORITY_NORMAL
+        else:
+            if priority != PRIORITY_NORMAL:
+                self.log_info('- priority : %s', priority_class)
+
+        # devices which can be read together with others of the same bus in a single request
+        batch_key = dev.haldev.batch_key() if hasattr(dev.haldev, 'batch_key') else None
+        if batch_key is not None:
+            self.log_info('- batch key : %s', batch_key)
+
+        # a poll which does not complete in time is abandoned, so that a hung driver does not
+        # block the others
+        timeout = self._poll_timeout
+        if hasattr(dev.cfg, ConfigurationParms.POLL_TIMEOUT):
+            timeout = get_duration_setting(ConfigurationParms.POLL_TIMEOUT, timeout)
+
+        # silence required on the bus after polling the device, which can depend on its type
+        gap = getattr(dev.haldev, 'BUS_GAP', None)
+        if gap is None:
+            gap = self._bus_gap
+        if hasattr(dev.cfg, ConfigurationParms.BUS_GAP):
+            gap = get_duration_setting(ConfigurationParms.BUS_GAP, gap)
+
+        return PollTask(dev, period, bus, adaptive, CircuitBreaker(self._backoff_max), priority, batch_key,
+                        timeout or None, gap)
+
+    def _device_bus(self, dev):
+        """ Returns the identifier of the bus a device is reached through.
+
+        The bus is the one declared at the device level, or else at the coordinator one,
+        or else the default one (see :py:meth:`_default_bus`).
+        """
+        return getattr(dev.cfg, ConfigurationParms.BUS, None) or \
+            getattr(self._cfg, ConfigurationParms.BUS, None) or \
+            self._default_bus(dev)
 
-        if sched_tasks:
-            # Sort the list
-            sched_tasks.sort(cmp=lambda x, y: x.period - y.period)
+    def _default_bus(self, dev):
+        """ Returns the bus of a device for which none is declared.
 
-            # Start the scheduler worker task
-            self._polling_thread = _PollingThread(
-                owner=self,
-                tasks=sched_tasks
-            )
-            self._polling_thread.log_setLevel(self.log_getEffectiveLevel())
-            self._polling_thread.start()
+        By default the devices share the line of the coordinator, so that the polling request
+        interval is observed between the polls of different devices, as for serial links.
+        When concurrent polling is enabled, they are supposed to be reachable independently
+        of the others.
+        """
+        return dev.id_ if self._poll_workers else self._cid
 
-        else:
-            self.log_info('no device to be scheduled')
+    def _start_polling(self, tasks):
+        """ Starts the polling thread.
 
-        self.log_info('started')
+        :param list tasks: the initial polling tasks
+        """
+        self._polling_thread = _PollingThread(
+            owner=self,
+            tasks=tasks,
+            scheduler=self.create_scheduler(),
+            workers=self._poll_workers,
+            phasing=self._poll_phasing
+        )
+        self._polling_thread.log_setLevel(self.log_getEffectiveLevel())
+        self._polling_thread.start()
 
     def stop(self):
         """ Processing to be done when the service object is stopped.
 
         Called automatically by the framework when the service is stopped.
         """
+        for receiver in (self._cfgchg_receiver, self._control_receiver):
+            if receiver:
+                receiver.remove()
+        self._cfgchg_receiver = self._control_receiver = None
+
+        if self._stats_publish_source:
+            gobject.source_remove(self._stats_publish_source)
+            self._stats_publish_source = None
+
+        if self._heartbeat_source:
+            gobject.source_remove(self._heartbeat_source)
+            self._heartbeat_source = None
+        self._heartbeat = None
+
         if self._polling_thread:
             self._polling_thread.terminate()
 
@@ -387,243 +868,1870 @@ class CoordinatorServiceObject(dbus.service.Object, Loggable):
                 self.log_info('sending termination signal to device %s', haldev)
                 haldev.terminate()
 
-            self._polling_thread.join(self._polling_thread.period * 2)
+            self._polling_thread.join(_PollingThread.TERMINATION_TIMEOUT)
             self._evtmgr = None
             self.log_info('stopped')
 
+        if self._recorder:
+            self._recorder.close()
+
     def emit_event(self, *args):
         self._evtmgr.emitEvent(*args)
+        if self._heartbeat:
+            self._heartbeat.notified(*args)
 
+    def _emit_keepalive(self, *args):
+        try:
+            self._evtmgr.emitEvent(*args)
+        except DBusException as e:
+            self.log_error('cannot emit keep-alive : %s', e)
 
-class DeviceNetworkError(Exception):
-    """ Specialized exception for device network related errors.
+    def _refresh_variables(self):
+        """ Emits the keep-alives of the variables which are due.
+
+        Called periodically by the main loop when the heartbeat is enabled.
+        """
+        if self._evtmgr:
+            self._heartbeat.refresh()
+
+        # keep the timer active
+        return True
+
+    def _configuration_changed(self, chgtype, resid):
+        """ Handler of the configuration broker `changed` signal.
+
+        Only device level changes concerning this coordinator are processed. The configuration
+        of the added or updated device is retrieved from the broker.
+
+        :param str chgtype: the change type (see :py:mod:`pycstbox.cfgbroker` CFGCHG_xx constants)
+        :param str resid: the uid of the changed resource
+        """
+        if len(chgtype) != 2 or chgtype[0] != pycstbox.cfgbroker.CFGCHG_OBJ_DEVICE or not resid:
+            return
+        try:
+            cid, dev_id = DevCfgObject.split_uid(resid)
+        except ValueError:
+            self.log_error('invalid device uid in configuration change : %s', resid)
+            return
+        if cid != self._cid:
+            return
+
+        op = chgtype[1]
+        self.log_info('configuration change notified : op=%s device=%s', op, dev_id)
+        if op == pycstbox.cfgbroker.CFGCHG_OP_DELETED:
+            self.remove_device(dev_id)
+            return
+
+        try:
+            js_dict = json.loads(pycstbox.cfgbroker.get_object().get_device(cid, dev_id))
+            cfg_dev = Device(dev_id, **{str(k): v for k, v in js_dict.iteritems()})
+        except (DBusException, DevCfgError, ValueError, TypeError) as e:
+            self.log_error('[%s] cannot retrieve device configuration : (%s) %s', dev_id, e.__class__.__name__, e)
+        else:
+            self.update_device(cfg_dev)
+
+    def update_device(self, cfg_dev):
+        """ Adds a device to the running coordinator, or replaces it if it already exists.
+
+        The device abstraction object is re-created from the configuration. When replacing an
+        existing device, its last output values are carried over, so that the change detection
+        goes on as if nothing happened. The other devices are not affected.
+
+        If the new instance cannot be created, the device is removed from the coordinator, so
+        that no stale entry is left for it.
+
+        :param devcfg.Device cfg_dev: the device configuration
+        """
+        dev_id = cfg_dev.uid
+        old = self._devices.get(dev_id, None)
+
+        # the old instance is stopped in any case, since it is replaced by the new one or
+        # the device is now disabled
+        if old:
+            self._drop_device(old)
+
+        if not cfg_dev.enabled:
+            self.log_info('[%s] device disabled', dev_id)
+            self._forget_device(dev_id)
+            return
+
+        dev = self._create_device(dev_id, cfg_dev)
+        if not dev:
+            if old:
+                self._forget_device(dev_id)
+                self.log_error('[%s] device removed, since it could not be re-created', dev_id)
+            return
+
+        if old:
+            dev.haldev.inherit_outputs_state(old.haldev)
+
+        self._cfg[dev_id] = cfg_dev
+        # copy on write, since the devices dictionary can be browsed by other threads
+        devices = dict(self._devices)
+        devices[dev_id] = dev
+        self._devices = devices
+        self._index_variables()
+
+        task = self._create_poll_task(dev)
+        if self._polling_thread:
+            if task:
+                self._polling_thread.add_task(task)
+        elif task or self._controls:
+            self._start_polling(filter(None, [task]))
+        self.log_info('[%s] device %s', dev_id, 'updated' if old else 'added')
+
+    def remove_device(self, dev_id):
+        """ Removes a device from the running coordinator.
+
+        :param str dev_id: the device id
+        """
+        try:
+            dev = self._devices[dev_id]
+        except KeyError:
+            self.log_warn('[%s] cannot remove unknown device', dev_id)
+            return
+
+        self._drop_device(dev)
+        self._forget_device(dev_id)
+        self.log_info('[%s] device removed', dev_id)
+
+    def _drop_device(self, dev):
+        """ Stops polling a device and lets it terminate gently."""
+        if dev.haldev.is_pollable():
+            if self._polling_thread:
+                self._polling_thread.remove_task(dev.id_)
+            dev.haldev.terminate()
+
+    def _forget_device(self, dev_id):
+        """ Removes all the traces of a device already dropped : its entry, its configuration,
+        its stats and its variables.
+        """
+        if self._polling_thread:
+            self._polling_thread.forget_device(dev_id)
+        self._cfg.pop(dev_id, None)
+        if dev_id in self._devices:
+            # copy on write, since the devices dictionary can be browsed by other threads
+            devices = dict(self._devices)
+            del devices[dev_id]
+            self._devices = devices
+        self._index_variables()
+
+    def get_polling_stats(self):
+        """ Returns the polling statistics of the coordinator and its devices.
+
+        :returns: a dictionary containing the coordinator level figures, the utilization
+            of each bus, the compression achieved by the output filters and aggregates, the
+            heartbeat figures if enabled and the stats of each device (see :py:class:`PollingStats`)
+        """
+        if self._polling_thread:
+            stats = self._polling_thread.get_stats()
+        else:
+            stats = {'coordinator': self._cid, 'devices': {}, 'buses': {}}
+        return self._add_heartbeat_stats(stats)
+
+    def _add_heartbeat_stats(self, stats):
+        if self._heartbeat:
+            stats['heartbeat'] = self._heartbeat.get_stats()
+        return stats
+
+    def request_polling_stats(self, callback):
+        """ Requests the polling statistics of the coordinator and its devices.
+
+        Used from the main loop when the stats may not be available immediately, such as
+        for coordinators run in a worker process.
+
+        :param callable callback: invoked with the stats (see :py:meth:`get_polling_stats`)
+            when available
+        """
+        callback(self.get_polling_stats())
+
+    @dbus.service.method(SERVICE_INTERFACE, out_signature='s',
+                         async_callbacks=('reply_handler', 'error_handler'))
+    def getPollingStats(self, reply_handler, error_handler):   #pylint: disable=W0613
+        """ Returns the polling statistics of the coordinator and its devices.
+
+        :returns str: JSON representation of the stats (see :py:meth:`get_polling_stats`)
+        """
+        self.request_polling_stats(lambda stats: reply_handler(json.dumps(stats)))
+
+    def read_device(self, dev_id, max_age, callback):
+        """ Reads the outputs of a device, polling it only if the last read ones are too old.
+
+        :param str dev_id: the device id
+        :param float max_age: the maximum age of the last read outputs for being returned
+            without polling the device (in seconds)
+        :param callable callback: invoked with the result as a dictionary containing the device
+            id, the read time, the age and the values of the outputs, or with None and the error
+            message. It can be invoked from the polling thread.
+        :raises DeviceNetworkError: if the device cannot be read
+        """
+        try:
+            dev = self._devices[dev_id]
+        except KeyError:
+            raise DeviceNetworkError('unknown device : %s' % dev_id)
+        if not dev.haldev.is_pollable():
+            raise DeviceNetworkError('not a polled device : %s' % dev_id)
+
+        def result():
+            haldev = dev.haldev
+            if haldev.last_read_time is None:
+                return None
+            return {
+                'device': dev_id,
+                'timestamp': haldev.last_read_time,
+                'age': max(haldev.clock() - haldev.last_read_time, 0),
+                'outputs': {k: haldev.get_output_value(haldev.last_outputs, k) for k in dev.cfg.outputs}
+            }
+
+        fresh = result()
+        if fresh and fresh['age'] <= max_age:
+            callback(fresh)
+            return
+
+        def polled(error):
+            polled_result = None if error else result()
+            if polled_result:
+                callback(polled_result)
+            else:
+                callback(None, error or 'no output values')
+
+        try:
+            self._polling_thread.request_poll(dev_id, polled)
+        except (AttributeError, KeyError):
+            raise DeviceNetworkError('device not polled : %s' % dev_id)
+
+    @dbus.service.method(SERVICE_INTERFACE, in_signature='sd', out_signature='s',
+                         async_callbacks=('reply_handler', 'error_handler'))
+    def readDevice(self, dev_id, max_age, reply_handler, error_handler):
+        """ Returns the current outputs of a device.
+
+        The last read outputs are returned if not older than `max_age`. Otherwise the device
+        is polled immediately, and the reply is sent when the poll is completed.
+
+        :param str dev_id: the device id
+        :param float max_age: the maximum age of the returned outputs (in seconds)
+        :returns str: JSON representation of the result (see :py:meth:`read_device`)
+        """
+        state = {}
+
+        def reply(result, error=None):
+            # replies are sent from the main loop, whatever the thread the result comes from
+            gobject.idle_add(send_reply, result, error)
+
+        def send_reply(result, error):
+            if state.get('done'):
+                return False
+            state['done'] = True
+            if state.get('timer'):
+                gobject.source_remove(state['timer'])
+            if error:
+                error_handler(DeviceNetworkError(error))
+            else:
+                reply_handler(json.dumps(result))
+            return False
+
+        state['timer'] = gobject.timeout_add(DFLT_READ_TIMEOUT * 1000, send_reply, None, 'no reply from device')
+        try:
+            self.read_device(str(dev_id), float(max_age), reply)
+        except DeviceNetworkError as e:
+            send_reply(None, str(e))
+
+    def _control_event(self, timestamp, var_type, var_name, data):
+        """ Handler of the events of the control channel.
+
+        Only the events which variable is a control of one of our devices are processed,
+        the value conveyed by the event being applied to the control.
+
+        :param timestamp: the event time stamp (in milliseconds since Epoch)
+        :param str var_type: the variable type
+        :param str var_name: the variable name
+        :param str data: JSON representation of the event payload
+        """
+        try:
+            dev_id, control = self._controls[var_name]
+        except KeyError:
+            return
+        try:
+            value = json.loads(data)[DataKeys.VALUE]
+        except (ValueError, TypeError, KeyError):
+            self.log_error('invalid command for %s : %s', var_name, data)
+            return
+        self.submit_command(dev_id, control, value, timestamp / 1000. if timestamp else None)
+
+    def submit_command(self, dev_id, control, value, issued=None):
+        """ Queues a command to be applied to a control of a device.
+
+        Commands are sent on the bus of the device ahead of the pending polls. A command
+        still waiting when a new one is submitted for the same control is updated with
+        the new value instead of being sent twice.
+
+        :param str dev_id: the device id
+        :param str control: the name of the control
+        :param value: the value to be applied
+        :param float issued: the time the command has been issued (default: now)
+        """
+        try:
+            dev = self._devices[dev_id]
+        except KeyError:
+            self.log_error('[%s] command ignored (unknown device)', dev_id)
+            return
+        if not self._polling_thread:
+            self.log_error('[%s] command ignored (polling not started)', dev_id)
+            return
+        self._polling_thread.submit_command(
+            dev, control, value, issued or time.time(),
+            self._device_bus(dev), self._bus_gap, self._poll_timeout or None
+        )
+
+    def _publish_polling_stats(self):
+        """ Publishes the coordinator level polling stats on the sysmon channel.
+
+        Called periodically by the main loop. Devices level details are not included,
+        since they can be retrieved with :py:meth:`getPollingStats` if needed.
+        """
+        self.request_polling_stats(self._send_polling_stats)
+
+        # keep the timer active
+        return True
+
+    def _send_polling_stats(self, stats):
+        stats = dict(stats)
+        stats.pop('devices', None)
+        try:
+            sysmon = pycstbox.evtmgr.get_object(pycstbox.evtmgr.SYSMON_EVENT_CHANNEL)
+            sysmon.emitEvent(POLLING_STATS_VAR_TYPE, self._cid, json.dumps(stats))
+        except DBusException as e:
+            self.log_error('cannot publish polling stats : %s', e)
+
+
+class DetachableCoordinatorServiceObject(CoordinatorServiceObject):
+    """ Generic coordinator which can be run in a worker process in multi-process mode.
+
+    To be used in the coordinator types map of :py:class:`DeviceNetworkSvc` for the types
+    which drivers do not use D-Bus.
     """
+    DETACHABLE = True
 
-Schedule = namedtuple('Schedule', ['when', 'task'])
-""" Named tuple describing a task schedule.
 
-:key long when: schedule time (in second count from asbolute time origin)
-:key task: the instance of the task to be executed
-"""
+class CoordinatorProxy(CoordinatorServiceObject):
+    """ Stands in the service process for a coordinator run by a :py:class:`CoordinatorWorker`.
 
+    It provides the D-Bus interface of the coordinator, publishes its polling stats and
+    tracks the configuration changes of its devices, forwarding the requests to the worker.
+    """
+    def __init__(self, cid, coord_class, worker):
+        """
+        :param str cid: coordinator id
+        :param type coord_class: the class of the coordinator
+        :param CoordinatorWorker worker: the worker running the coordinator
+        """
+        super(CoordinatorProxy, self).__init__(cid)
+        self._coord_class = coord_class
+        self._worker = worker
+        self._last_stats = None
+
+    def log_setLevel(self, level):
+        super(CoordinatorProxy, self).log_setLevel(level)
+        self._worker.log_setLevel(level)
+
+    def load_configuration(self, cfg):
+        """ Keeps the configuration for the worker, the devices being loaded by the latter."""
+        if not cfg:
+            raise ValueError('configuration cannot be None or empty')
+        self._cfg = cfg
+        self._configure_coordinator(cfg)
+        self._index_variables()
+        self._worker.add_coordinator(self._cid, self._coord_class, cfg)
+
+    def _start_devices(self):
+        self._worker.attach(self)
+
+    def stop(self):
+        super(CoordinatorProxy, self).stop()
+        self._worker.detach(self)
+
+    def update_device(self, cfg_dev):
+        if cfg_dev.enabled:
+            self._cfg[cfg_dev.uid] = cfg_dev
+        else:
+            self._cfg.pop(cfg_dev.uid, None)
+        self._index_variables()
+        self._worker.send('update', self._cid, cfg_dev)
+
+    def remove_device(self, dev_id):
+        self._cfg.pop(dev_id, None)
+        self._index_variables()
+        self._worker.send('remove', self._cid, dev_id)
+
+    def submit_command(self, dev_id, control, value, issued=None):
+        self._worker.send('command', self._cid, (dev_id, control, value, issued or time.time()))
+
+    def get_polling_stats(self):
+        """ Returns the last polling stats received from the worker, since waiting for the
+        current ones would block the main loop (see :py:meth:`request_polling_stats`).
+        """
+        if self._last_stats:
+            return self._add_heartbeat_stats(dict(self._last_stats))
+        return super(CoordinatorProxy, self).get_polling_stats()
+
+    def request_polling_stats(self, callback):
+        def received(stats):
+            if stats:
+                self._last_stats = stats
+            callback(self.get_polling_stats())
+
+        self._worker.request_polling_stats(self._cid, received)
+
+    def read_device(self, dev_id, max_age, callback):
+        self._worker.read_device(self._cid, dev_id, max_age, callback)
+
+
+class CoordinatorWorker(Loggable):
+    """ Worker process running one or several coordinators.
+
+    The worker does not use D-Bus, which cannot be shared with the service process. The events
+    produced by its coordinators are sent back to the service process through a pipe, and
+    emitted by the :py:class:`CoordinatorProxy` of the coordinators. Device configuration
+    changes, commands and stats requests are sent the other way. The replies are processed
+    by the main loop of the service process, which never waits for them.
+
+    The worker process is a new interpreter rather than a fork of the service process, which
+    has threads, a main loop and a D-Bus connection, the state of which would be inherited
+    in an inconsistent way (locks held by other threads for instance). It is supervised
+    from the main loop, and restarted if it dies, after a delay increasing with the number
+    of successive crashes.
+    """
+    RESTART_DELAY = 5
+    RESTART_DELAY_MAX = 300
+    STABLE_RUN_TIME = 60
+    """ Run time after which a crash is not considered as a successive one """
+    REQUEST_TIMEOUT = 5
+
+    def __init__(self, name):
+        """
+        :param str name: the name of the worker
+        """
+        Loggable.__init__(self, logname='Wkr:%s' % name)
+        self._name = name
+        self._coordinators = []
+        self._proxies = {}
+        self._log_level = None
+        self._process = None
+        self._conn = None
+        self._watch = None
+        self._child_watch = None
+        self._started_at = None
+        self._crashes = 0
+        self._restart_source = None
+        # callbacks of the on-demand reads in progress, keyed by request id
+        self._reads = {}
+        self._read_ids = itertools.count()
+        # callbacks and timeout timers of the stats requests in progress, keyed by request id
+        self._stats_requests = {}
+        self._stats_ids = itertools.count()
+
+    def add_coordinator(self, cid, coord_class, cfg):
+        """ Adds a coordinator to be run by the worker."""
+        self._coordinators.append((cid, coord_class, cfg))
+
+    def log_setLevel(self, level):
+        Loggable.log_setLevel(self, level)
+        self._log_level = level
+        if self._process:
+            self.send('log', None, level)
+
+    def attach(self, proxy):
+        """ Registers the proxy of a coordinator, and starts the worker process if not yet done."""
+        self._proxies[proxy.coordinator_id] = proxy
+        if not self._process:
+            self._spawn()
+
+    def detach(self, proxy):
+        """ Unregisters the proxy of a coordinator, and stops the worker process when none is left."""
+        self._proxies.pop(proxy.coordinator_id, None)
+        if not self._proxies:
+            self._shutdown()
+
+    def _spawn(self):
+        # the connection with the worker is its standard input, all other descriptors being closed
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self._started_at = time.time()
+        try:
+            self._process = subprocess.Popen(
+                [sys.executable, '-c', _WORKER_BOOTSTRAP, 'cbx-hal-' + self._name],
+                stdin=child_conn.fileno(), close_fds=True,
+                env=dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+            )
+        except OSError as e:
+            parent_conn.close()
+            self.log_error('cannot start worker process : %s', e)
+            self._schedule_restart()
+            return
+        finally:
+            child_conn.close()
+
+        self._conn = parent_conn
+        self._child_watch = gobject.child_watch_add(self._process.pid, self._worker_exited)
+        self._watch = gobject.io_add_watch(
+            parent_conn.fileno(), gobject.IO_IN | gobject.IO_HUP | gobject.IO_ERR, self._data_available
+        )
+        self.send('start', None, (self._coordinators, self._log_level))
+        self.log_info('worker process started (pid=%d, coordinators=%s)',
+                      self._process.pid, [c[0] for c in self._coordinators])
+
+    def _shutdown(self):
+        if self._restart_source:
+            gobject.source_remove(self._restart_source)
+            self._restart_source = None
+        if not self._process:
+            return
+        if self._child_watch:
+            gobject.source_remove(self._child_watch)
+            self._child_watch = None
+        if self._conn:
+            try:
+                self._conn.send(('stop', None, None))
+            except (IOError, EOFError):
+                pass
+            self._connection_lost()
+
+        # the service is stopping, so waiting for the worker does not delay anything else
+        deadline = time.time() + _PollingThread.TERMINATION_TIMEOUT * 2
+        while self._process.poll() is None and time.time() < deadline:
+            time.sleep(0.1)
+        if self._process.poll() is None:
+            self.log_warn('worker process not terminated -> killed')
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+        self.log_info('worker process stopped')
+
+    def send(self, cmd, cid, arg):
+        """ Sends a request to the worker process.
+
+        :param str cmd: the request
+        :param str cid: the id of the coordinator concerned by the request
+        :param arg: the argument of the request
+        """
+        if not self._conn:
+            self.log_error('worker process not running -> %s request ignored', cmd)
+            return
+        try:
+            self._conn.send((cmd, cid, arg))
+        except (IOError, EOFError) as e:
+            self.log_error('cannot send %s request to worker process : %s', cmd, e)
+
+    def request_polling_stats(self, cid, callback):
+        """ Requests the polling stats of a coordinator to the worker process.
+
+        :param str cid: the coordinator id
+        :param callable callback: invoked from the main loop with the stats, or with None if
+            the worker does not reply in time
+        """
+        if not self._conn:
+            callback(None)
+            return
+        req_id = next(self._stats_ids)
+        timer = gobject.timeout_add(self.REQUEST_TIMEOUT * 1000, self._stats_timed_out, req_id)
+        self._stats_requests[req_id] = (callback, timer)
+        self.send('stats', cid, req_id)
+
+    def _stats_timed_out(self, req_id):
+        request = self._stats_requests.pop(req_id, None)
+        if request:
+            self.log_error('no stats received from worker process')
+            request[0](None)
+        return False
+
+    def read_device(self, cid, dev_id, max_age, callback):
+        """ Forwards an on-demand read to the worker process.
+
+        See :py:meth:`CoordinatorServiceObject.read_device`.
+        """
+        if not self._conn:
+            raise DeviceNetworkError('worker process not running')
+        req_id = next(self._read_ids)
+        self._reads[req_id] = callback
+        self.send('read', cid, (req_id, dev_id, max_age))
+
+    def _receive(self):
+        try:
+            return self._conn.recv()
+        except (IOError, EOFError):
+            self._connection_lost()
+            return None
+
+    def _data_available(self, source, condition):
+        while self._conn and self._conn.poll():
+            msg = self._receive()
+            if msg:
+                self._dispatch(msg)
+        if self._conn and condition & (gobject.IO_HUP | gobject.IO_ERR):
+            self._connection_lost()
+        return self._conn is not None
+
+    def _dispatch(self, msg):
+        cmd, cid, arg = msg
+        if cmd == 'evt':
+            proxy = self._proxies.get(cid)
+            if proxy:
+                try:
+                    proxy.emit_event(*arg)
+                except DBusException as e:
+                    self.log_error('[%s] cannot emit event : %s', cid, e)
+        elif cmd == 'read':
+            req_id, result, error = arg
+            callback = self._reads.pop(req_id, None)
+            if callback:
+                callback(result, error)
+        elif cmd == 'stats':
+            req_id, stats = arg
+            request = self._stats_requests.pop(req_id, None)
+            if request:
+                gobject.source_remove(request[1])
+                request[0](stats)
+        else:
+            self.log_warn('unexpected message from worker process : %s', cmd)
+
+    def _connection_lost(self):
+        """ Closes the connection with the worker process, and fails the requests in progress."""
+        if self._watch:
+            gobject.source_remove(self._watch)
+            self._watch = None
+        self._conn.close()
+        self._conn = None
+
+        reads, self._reads = self._reads, {}
+        for callback in reads.itervalues():
+            callback(None, 'worker process died')
+        requests, self._stats_requests = self._stats_requests, {}
+        for callback, timer in requests.itervalues():
+            gobject.source_remove(timer)
+            callback(None)
+
+    def _worker_exited(self, pid, status):
+        """ Called by the main loop when the worker process has exited, and has been reaped."""
+        self._child_watch = None
+        if not self._process or pid != self._process.pid:
+            return False
+        # the process has been reaped by the main loop, not by the Popen instance
+        self._process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        exitcode = self._process.returncode
+        self._process = None
+        if self._conn:
+            self._connection_lost()
+
+        self.log_error('worker process died (exit code=%s)', exitcode)
+        self._schedule_restart()
+        return False
+
+    def _schedule_restart(self):
+        if time.time() - self._started_at < self.STABLE_RUN_TIME:
+            self._crashes += 1
+        else:
+            self._crashes = 1
+        delay = min(self.RESTART_DELAY * 2 ** (self._crashes - 1), self.RESTART_DELAY_MAX)
+        self.log_error('worker process to be restarted in %ds', delay)
+        self._restart_source = gobject.timeout_add(delay * 1000, self._restart)
+
+    def _restart(self):
+        self._restart_source = None
+        if self._proxies and not self._process:
+            self._spawn()
+        return False
+
+
+class _EventRelay(object):
+    """ Stands for the Event Manager in a worker process, sending the events to the service process."""
+    def __init__(self, conn, cid, lock):
+        self._conn, self._cid, self._lock = conn, cid, lock
+
+    def emitEvent(self, var_type, var_name, data):  #pylint: disable=C0103
+        with self._lock:
+            self._conn.send(('evt', self._cid, (var_type, var_name, data)))
+
+
+def _send_read_result(conn, lock, cid, req_id, result, error=None):
+    with lock:
+        conn.send(('read', cid, (req_id, result, error)))
+
+
+_WORKER_BOOTSTRAP = 'from pycstbox.hal.network import _worker_main; _worker_main()'
+""" Code run by the interpreter of the worker processes """
 
-class PollingStats(object):
-    __slots__ = ['total_poll', 'comm_errs', 'crc_errs', 'unexp_errs', 'recovered']
 
-    def __init__(self, total_poll=0, comm_errs=0, crc_errs=0, unexp_errs=0, recovered=0):
+def _worker_main():
+    """ Entry point of the worker processes, which connection with the service process is
+    their standard input.
+    """
+    from _multiprocessing import Connection
+    from pycstbox.log import setup_logging
+
+    setup_logging(sys.argv[-1])
+    conn = Connection(os.dup(0))
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+
+    try:
+        cmd, _, arg = conn.recv()
+    except (IOError, EOFError):
+        return
+    if cmd == 'start':
+        coordinators, log_level = arg
+        _run_worker(conn, coordinators, log_level)
+
+
+def _run_worker(conn, coordinators, log_level):
+    """ Main function of the worker processes.
+
+    :param conn: the connection with the service process
+    :param list coordinators: the coordinators to be run, as (id, class, configuration) tuples
+    :param log_level: the logging level of the coordinators
+    """
+    # termination is driven by the service process
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    lock = threading.Lock()
+    objects = {}
+    for cid, coord_class, cfg in coordinators:
+        so = coord_class(cid)
+        if log_level is not None:
+            so.log_setLevel(log_level)
+        try:
+            so.load_configuration(cfg)
+            so.set_event_relay(_EventRelay(conn, cid, lock))
+            so.start()
+        except Exception as e:  #pylint: disable=W0703
+            so.log_exception(e)
+        else:
+            objects[cid] = so
+
+    try:
+        while True:
+            try:
+                cmd, cid, arg = conn.recv()
+            except (IOError, EOFError):
+                break
+
+            if cmd == 'stop':
+                break
+            elif cmd == 'log':
+                for so in objects.itervalues():
+                    so.log_setLevel(arg)
+                continue
+
+            so = objects.get(cid)
+            if not so:
+                continue
+            if cmd == 'update':
+                so.update_device(arg)
+            elif cmd == 'remove':
+                so.remove_device(arg)
+            elif cmd == 'command':
+                so.submit_command(*arg)
+            elif cmd == 'stats':
+                stats = so.get_polling_stats()
+                with lock:
+                    conn.send(('stats', cid, (arg, stats)))
+            elif cmd == 'read':
+                req_id, dev_id, max_age = arg
+                reply = partial(_send_read_result, conn, lock, cid, req_id)
+                try:
+                    so.read_device(dev_id, max_age, reply)
+                except DeviceNetworkError as e:
+                    reply(None, str(e))
+
+    finally:
+        for so in objects.itervalues():
+            so.stop()
+
+
+class DeviceNetworkError(Exception):
+    """ Specialized exception for device network related errors.
+    """
+
+
+class PollingStats(object):
+    __slots__ = [
+        'total_poll', 'comm_errs', 'crc_errs', 'unexp_errs', 'recovered', 'period', 'circuit', 'trips',
+        'events', 'latency', 'lag', 'late', 'missed', 'timeouts'
+    ]
+    _HISTOGRAMS = ('latency', 'lag')
+
+    def __init__(self, total_poll=0, comm_errs=0, crc_errs=0, unexp_errs=0, recovered=0, period=0,
+                 circuit=CIRCUIT_CLOSED, trips=0, events=0, late=0, missed=0, timeouts=0):
         self.total_poll, self.comm_errs, self.crc_errs, self.unexp_errs, self.recovered = \
             total_poll, comm_errs, crc_errs, unexp_errs, recovered
+        # current polling period of the device
+        self.period = period
+        # circuit breaker state, and number of times it has been opened
+        self.circuit, self.trips = circuit, trips
+        # total count of events produced by the polls
+        self.events = events
+        # duration of the polls, and delay between their planned and actual start times
+        self.latency, self.lag = Histogram(), Histogram()
+        # polls started later than their tolerance, and planned polls skipped because of the lag
+        self.late, self.missed = late, missed
+        # polls abandoned because not completed in time
+        self.timeouts = timeouts
 
     def __str__(self):
-        return "total_polls=%d, comm_errs=%d, crc_errs=%d, unexp_errs=%d, recovered=%d" % (
-            self.total_poll, self.comm_errs, self.crc_errs, self.unexp_errs, self.recovered
-        )
+        return "total_polls=%d, comm_errs=%d, crc_errs=%d, unexp_errs=%d, recovered=%d, period=%s, " \
+               "circuit=%s, trips=%d, events=%d, latency=(%s), lag=(%s), late=%d, missed=%d, timeouts=%d" % (
+                   self.total_poll, self.comm_errs, self.crc_errs, self.unexp_errs, self.recovered, self.period,
+                   self.circuit, self.trips, self.events, self.latency, self.lag, self.late, self.missed,
+                   self.timeouts
+               )
 
     def as_dict(self):
-        return {k: getattr(self, k) for k in self.__slots__}
+        d = {k: getattr(self, k) for k in self.__slots__}
+        for k in self._HISTOGRAMS:
+            d[k] = d[k].as_dict()
+        return d
 
     @classmethod
     def from_dict(cls, d):
         inst = PollingStats()
-        for k in inst.__slots__:
-            setattr(inst, k, d[k])
+        # be tolerant with stats saved by previous versions
+        for k in (k for k in inst.__slots__ if k in d):
+            if k in cls._HISTOGRAMS:
+                setattr(inst, k, Histogram.from_dict(d[k]))
+            else:
+                setattr(inst, k, d[k])
         return inst
 
 
-class _PollingThread(threading.Thread, Loggable):
-    """ Thread managing devices polling."""
-    DFLT_TASK_CHECKING_PERIOD = 1
+class _PollingEngine(Loggable):
+    """ Polling machinery shared by the different ways of running the polls.
+
+    It holds the polling tasks and their schedules, and handles everything which happens
+    before and after a device is polled : stats, errors handling, events emission and
+    re-scheduling. Sub-classes are in charge of dequeuing the due tasks and of executing
+    the polls.
+    """
+    TERMINATION_TIMEOUT = 2
     STATS_INTERVAL = 1000
+    LATE_TOLERANCE = 0.1
+    """ Lag (as a fraction of the polling period) above which a poll is counted as late """
     STATS_STORAGE_PATH = '/var/db/cstbox/polling_stats-%s.dat'
+    """ Stats persistence file path pattern (None for disabling the persistence) """
 
-    def __init__(self, owner, tasks):
+    def __init__(self, owner, tasks, scheduler=None, phasing=PHASING_HASH, clock=None):
         """
         :param CoordinatorServiceObject owner: the coordinator in charge of the polling tasks
         :param tasks: the list of tasks corresponding to polling actions to be managed
+        :param scheduler: the scheduler holding the tasks schedules (default: a :py:class:`PollScheduler`)
+        :param str phasing: the initial phase planning mode (see :py:func:`pycstbox.hal.scheduler.plan_phases`)
+        :param callable clock: the function returning the current time (default: `time.time`)
         """
-        threading.Thread.__init__(self)
-
         self._owner = owner
-        self._tasks = tasks
+        # tasks keyed by device id
+        self._tasks = {t.dev.id_: t for t in tasks}
+        # ids of devices which can be read in a single request, keyed by (bus, batch key)
+        self._batches = defaultdict(set)
+        for task in tasks:
+            self._register_batch(task)
+        self._scheduler = scheduler if scheduler is not None else PollScheduler()
+        self._phasing = phasing
         self._terminate = False
-        self._task_trigger_checking_period = self.DFLT_TASK_CHECKING_PERIOD
-        self._stats_file_path = self.STATS_STORAGE_PATH % self._owner.coordinator_id
+        # a plain lock is enough since never re-entered, and much cheaper than the default RLock
+        self._wakeup = threading.Condition(threading.Lock())
+        self._clock = clock or time.time
+        self._stats_file_path = \
+            self.STATS_STORAGE_PATH % self._owner.coordinator_id if self.STATS_STORAGE_PATH else None
+        self._stats_lock = threading.Lock()
+        self._stats_writer = None
+        self._start_time = None
+        # time spent in polls, and waiting for the pacing of the bus, keyed by bus id
+        self._bus_busy = {}
+        self._bus_paced = {}
+        # pacing of the buses, keyed by bus id
+        self._pacers = {}
+
+        # polling stats (keyed by device id)
+        self._dev_stats = {}
+        # accumulator for device errors (keyed by device id) used for reporting
+        self._errors = {}
+        # devices polled at least once
+        self._polled_devs = set()
+        # callbacks of the polls requested out of schedule, keyed by device id
+        self._poll_waiters = {}
+        # commands waiting to be sent, keyed by (device id, control)
+        self._commands = {}
+        # commands counters, and delay between their issue and their application
+        self._command_counts = {'received': 0, 'coalesced': 0, 'applied': 0, 'failed': 0}
+        self._command_latency = Histogram()
 
         Loggable.__init__(self, logname='Poll:%s' % self._owner.coordinator_id)
 
-    @property
-    def period(self):
-        return self._task_trigger_checking_period
+    def schedule(self, task, when, priority=None):
+        """ Schedules a task, waking up the polling loop so that the new deadline is taken in account.
 
-    def run(self):  #pylint: disable=R0912
-        """  Enqueues and activates tasks based on their periods.
+        Can be called from any thread. The schedule is ignored if the task has been removed
+        or replaced in the meantime.
 
-        The queue contains tuples, composed of :
-         - the next schedule time
-         - the task description, as provided by the task list
-         """
-        if not self._tasks:
-            raise PollingThreadError('empty task list')
-
-        sched_queue = []
-        poll_req_interval = self._owner.poll_req_interval
-
-        def at(_when, _task):
-            """ Mimics the system `at` command to schedule an action at a future time
-            :param long _when: the schedule time (in absolute time)
-            :param PollTask _task: the task to be executed
-            """
-            schedule = Schedule(_when, _task)
-
-            if sched_queue:
-                # find the right insert position of the schedule to maintain
-                # the queue chronologically sorted, optimizing the trivial cases
-                if sched_queue[-1].when <= _when:
-                    sched_queue.append(schedule)
-                else:
-                    for i, sched in enumerate(sched_queue):
-                        if sched.when > _when:
-                            sched_queue.insert(i, schedule)
-                            break
+        :param PollTask task: the task to be executed
+        :param float when: the schedule time (in absolute time)
+        :param int priority: the priority of this execution (default: the one of the task)
+        """
+        dev_id = task.dev.id_
+        with self._wakeup:
+            if self._tasks.get(dev_id) is not task:
+                return
+            self._scheduler.schedule(dev_id, when, task, task.priority if priority is None else priority)
+            self._wakeup.notify()
+        self.log_debug('schedule added : when=%s dev=%s', when, dev_id)
+
+    def add_task(self, task):
+        """ Adds a task to the running thread, replacing the one of the same device if any.
+
+        The first poll of the task is scheduled immediately. The stats of the device are kept
+        if it was already known.
+
+        :param PollTask task: the task to be added
+        """
+        with self._wakeup:
+            old = self._tasks.get(task.dev.id_, None)
+            if old:
+                self._unregister_batch(old)
+            self._tasks[task.dev.id_] = task
+            self._register_batch(task)
+        self.schedule(task, self._clock())
+
+    def remove_task(self, dev_id):
+        """ Removes the task of a device from the running thread.
+
+        A poll of the device in progress is completed, but the task will not be re-scheduled.
+
+        :param str dev_id: the device id
+        """
+        with self._wakeup:
+            task = self._tasks.pop(dev_id, None)
+            if task:
+                self._unregister_batch(task)
+            self._scheduler.cancel(dev_id)
+        self._notify_poll_waiters(dev_id, 'device removed')
+
+    def request_poll(self, dev_id, callback):
+        """ Polls a device as soon as possible, ahead of its schedule.
+
+        Concurrent requests for the same device are served by the same poll, as are the
+        requests made while the device is being polled. The next scheduled poll of the
+        device is planned one period after this one.
+
+        :param str dev_id: the device id
+        :param callable callback: invoked when the poll is completed, with the error message if
+            it failed and None otherwise. It is invoked from the thread executing the poll.
+        :raises KeyError: if the device is not polled
+        """
+        with self._wakeup:
+            task = self._tasks[dev_id]
+            waiters = self._poll_waiters.setdefault(dev_id, [])
+            waiters.append(callback)
+            served = len(waiters) > 1 or dev_id not in self._scheduler
+        if not served:
+            self.schedule(task, self._clock(), PRIORITY_HIGH)
+
+    def submit_command(self, dev, control, value, issued, bus, gap=0., timeout=None):
+        """ Queues a command to be applied to a control of a device.
+
+        Commands are scheduled immediately with a priority above all the polls, so that they
+        are sent as soon as the bus of the device is free. Can be called from any thread.
+
+        If a command for the same control is still waiting, its value is replaced by the new
+        one, since only the latest set-point matters.
+
+        :param DeviceListEntry dev: the device
+        :param str control: the name of the control
+        :param value: the value to be applied
+        :param float issued: the time the command has been issued
+        :param bus: the bus of the device, for devices which are not polled
+        :param float gap: the minimum silence on the bus after the command, for devices which
+            are not polled
+        :param float timeout: the delay after which the command is abandoned, for devices which
+            are not polled
+        """
+        key = (dev.id_, control)
+        with self._wakeup:
+            self._command_counts['received'] += 1
+            cmd = self._commands.get(key)
+            if cmd:
+                cmd.value, cmd.issued = value, issued
+                self._command_counts['coalesced'] += 1
+                return
+
+            # polled devices share the bus settings of their polling task
+            task = self._tasks.get(dev.id_)
+            if task:
+                bus, gap, timeout = task.bus, task.gap, task.timeout
+            cmd = self._commands[key] = CommandTask(dev, control, value, bus, issued, gap, timeout)
+            self._scheduler.schedule(key, self._clock(), cmd, PRIORITY_COMMAND)
+            self._wakeup.notify()
+        self.log_debug('[%s] command queued : %s=%s', dev.id_, control, value)
+
+    def _apply_command(self, cmd, execute=None):
+        """ Applies a command to its device and updates the commands stats.
+
+        Failed commands are not retried, since a newer set-point is likely to be issued
+        in the meantime.
+
+        :param CommandTask cmd: the command
+        :param callable execute: the function invoked with the command action for executing
+            it (default: the action is invoked directly)
+        """
+        dev_id = cmd.dev.id_
+        with self._wakeup:
+            # the commands received from now on are not coalesced with this one anymore
+            if self._commands.get((dev_id, cmd.control)) is cmd:
+                del self._commands[(dev_id, cmd.control)]
+            value = cmd.value
+
+        action = partial(cmd.dev.haldev.set_control, cmd.control, value)
+        start = self._clock()
+        error = None
+        try:
+            if execute:
+                execute(action)
             else:
-                sched_queue.append(schedule)
+                action()
+        except NotImplementedError:
+            error = 'control not supported'
+        except (CommunicationError, PollTimeoutError, ValueError, TypeError) as e:
+            error = e.message or str(e)
+        except Exception as e:  #pylint: disable=W0703
+            # a faulty driver must not stop the thread applying the commands
+            self.log_exception('[%s] unexpected command error : %s', dev_id, e)
+            error = str(e) or e.__class__.__name__
+        end = self._clock()
+
+        with self._stats_lock:
+            self._bus_busy[cmd.bus] = self._bus_busy.get(cmd.bus, 0) + end - start
+            if error:
+                self._command_counts['failed'] += 1
+            else:
+                self._command_counts['applied'] += 1
+                self._command_latency.add(max(end - cmd.issued, 0))
+        if error:
+            self.log_error('[%s] command %s=%s failed : %s', dev_id, cmd.control, value, error)
+        else:
+            self.log_debug('[%s] command applied : %s=%s', dev_id, cmd.control, value)
 
-            self.log_debug('schedule added : when=%s dev=%s', schedule.when, schedule.task.dev.id_)
+    def _notify_poll_waiters(self, dev_id, error):
+        with self._wakeup:
+            waiters = self._poll_waiters.pop(dev_id, None)
+        for callback in waiters or ():
+            try:
+                callback(error)
+            except Exception as e:  #pylint: disable=W0703
+                self.log_exception(e)
 
-        # For all the devices to be polled at starting time, we add them
-        # with a next time set to 0.
-        for task in self._tasks:
-            at(0, task)
+    def _register_batch(self, task):
+        if task.batch_key is not None:
+            self._batches[(task.bus, task.batch_key)].add(task.dev.id_)
 
-        # Enter the scheduling loop.
-        # Current time is checked every second and queued tasks having
-        # reached their schedule are executed, then moved to the end of the
-        # scheduling queue
+    def _unregister_batch(self, task):
+        if task.batch_key is not None:
+            key = (task.bus, task.batch_key)
+            self._batches[key].discard(task.dev.id_)
+            if not self._batches[key]:
+                del self._batches[key]
 
-        self.log_info('entering run loop')
-        self._terminate = False
+    def forget_device(self, dev_id):
+        """ Removes the task and discards the stats of a device.
+
+        :param str dev_id: the device id
+        """
+        self.remove_task(dev_id)
+        with self._stats_lock:
+            self._dev_stats.pop(dev_id, None)
+            self._errors.pop(dev_id, None)
+        self._polled_devs.discard(dev_id)
+
+    def _start_polling(self):
+        """ Schedules the first poll of all the tasks and starts the stats persistence.
 
-        # try to load previously saved stats if any.
+        The first polls are spread over their period depending on the phasing mode, so that
+        devices sharing the same period do not stay aligned for their whole life.
+        """
+        start_time = self._clock()
+        with self._wakeup:
+            tasks = self._tasks.values()
+        offsets = plan_phases(tasks, self._phasing)
+
+        # devices which can be read in a single request are aligned instead, so that they are
+        # due at the same time as long as they share the same period
+        batch_offsets = {}
+        for task in (t for t in tasks if t.batch_key is not None):
+            dev_id = task.dev.id_
+            offsets[dev_id] = batch_offsets.setdefault((task.bus, task.batch_key, task.period), offsets[dev_id])
+
+        for task in tasks:
+            self.schedule(task, start_time + offsets[task.dev.id_])
+
+        self._terminate = False
+        self._start_time = start_time
+
+        if self._stats_file_path:
+            self._load_stats()
+            self._stats_writer = _StatsWriter(self._owner.coordinator_id, self._stats_file_path, self._stats_snapshot)
+            self._stats_writer.log_setLevel(self.log_getEffectiveLevel())
+            self._stats_writer.start()
+
+    def _stop_polling(self):
+        """ Flushes the stats."""
+        if self._stats_writer:
+            self._stats_writer.terminate()
+            self._stats_writer.join(self.TERMINATION_TIMEOUT)
+
+    def _load_stats(self):
+        """ Loads previously saved stats if any."""
         try:
             with open(self._stats_file_path) as fp:
                 d = json.load(fp)
         except (IOError, ValueError):
-            dev_stats = {}
+            pass
         else:
-            dev_stats = {k: PollingStats.from_dict(v) for k, v in d.iteritems()}
+            self._dev_stats = {k: PollingStats.from_dict(v) for k, v in d.iteritems()}
             self.log_info('previously recorded stats:')
-            for dev_id, stats in dev_stats.iteritems():
+            for dev_id, stats in self._dev_stats.iteritems():
                 self.log_info('- [%s] %s', dev_id, stats)
 
-        # accumulator for device errors (keyed by device id) used for reporting
-        errors = {}
+    def _stats_snapshot(self):
+        """ Returns the stats of all the devices, in their persisted form."""
+        with self._stats_lock:
+            return {k: v.as_dict() for k, v in self._dev_stats.iteritems()}
 
-        polled_devs = []
-        while not self._terminate:
-            polling_start_time = time.time()
-            if sched_queue:
-                retried = []
-
-                # process all the tasks which schedule is now or older, checking the termination
-                # request while doing this
-                while not self._terminate and sched_queue[0].when <= polling_start_time:
-                    # dequeue the task and process it
-                    when, task = sched_queue.pop(0)
-
-                    dev, period = task
-                    dev_id = dev.id_
-
-                    # logs the polling operation in an optimized way, so that not
-                    # to fill up the log with recurrent messages
-                    if dev_id not in polled_devs:
-                        self.log_info('[%s] first polling', dev_id)
-                        polled_devs.append(dev_id)
-                    else:
-                        self.log_debug('[%s] polling device', dev_id)
+    def get_stats(self):
+        """ Returns a snapshot of the polling stats.
 
-                    # stats, err_level, in_error = dev_stats.get(dev_id, (PollingStats(), 0, False))
-                    stats = dev_stats.get(dev_id, PollingStats())
-                    try:
-                        # requests the device driver to execute the polling procedure
-                        # and return us the list of events corresponding to the reply
-                        # received in return
-                        stats.total_poll += 1
-                        events = dev.haldev.poll()
+        See :py:meth:`CoordinatorServiceObject.get_polling_stats`.
+        """
+        now = self._clock()
+        elapsed = now - self._start_time if self._start_time is not None else 0
+        with self._stats_lock:
+            devices = {k: v.as_dict() for k, v in self._dev_stats.iteritems()}
+            bus_busy = dict(self._bus_busy)
+            bus_paced = dict(self._bus_paced)
+            commands = dict(self._command_counts, latency=self._command_latency.as_dict())
+
+        def utilization(busy):
+            return round(busy / elapsed, 4) if elapsed else 0.
+
+        priority_names = {v: k for k, v in PRIORITY_CLASSES.iteritems()}
+        classes = {}
+        filters = {'samples': 0, 'notified': 0}
+        aggregates = {'samples': 0, 'windows': 0}
+        with self._wakeup:
+            tasks = self._tasks.values()
+        for task in tasks:
+            try:
+                d = devices[task.dev.id_]
+            except KeyError:
+                continue
+            dev_filters = task.dev.haldev.get_filters_stats()
+            if dev_filters:
+                d['filters'] = dev_filters
+                for f in dev_filters.itervalues():
+                    filters['samples'] += f['samples']
+                    filters['notified'] += f['notified']
+            dev_aggregates = task.dev.haldev.get_aggregators_stats()
+            if dev_aggregates:
+                d['aggregates'] = dev_aggregates
+                for a in dev_aggregates.itervalues():
+                    aggregates['samples'] += a['samples']
+                    aggregates['windows'] += a['windows']
+            c = classes.setdefault(priority_names.get(task.priority, str(task.priority)),
+                                   {'devices': 0, 'total_poll': 0, 'late': 0, 'missed': 0})
+            c['devices'] += 1
+            for k in ('total_poll', 'late', 'missed'):
+                c[k] += d.get(k, 0)
+        for c in classes.itervalues():
+            c['late_ratio'] = round(float(c['late']) / c['total_poll'], 4) if c['total_poll'] else 0.
+        filters['ratio'] = round(float(filters['samples']) / filters['notified'], 2) if filters['notified'] else 0.
+        aggregates['ratio'] = \
+            round(float(aggregates['samples']) / aggregates['windows'], 2) if aggregates['windows'] else 0.
+
+        return {
+            'coordinator': self._owner.coordinator_id,
+            'timestamp': now,
+            'uptime': elapsed,
+            'total_poll': sum(d['total_poll'] for d in devices.itervalues()),
+            'events': sum(d['events'] for d in devices.itervalues()),
+            'utilization': utilization(sum(bus_busy.itervalues())),
+            'buses': {
+                bus: {'busy': busy, 'utilization': utilization(busy), 'paced': bus_paced.get(bus, 0)}
+                for bus, busy in bus_busy.iteritems()
+            },
+            'classes': classes,
+            'commands': commands,
+            'filters': filters,
+            'aggregates': aggregates,
+            'devices': devices
+        }
+
+    def _poll_started(self, task, when):
+        """ Updates the stats of a device before it is polled.
+
+        :param PollTask task: the polling task
+        :param float when: the planned time of the poll
+        :returns: the stats of the device, and the poll start time
+        """
+        dev_id = task.dev.id_
 
-                    except CommunicationError as e:
-                        stats.comm_errs += 1
-                        errors[dev_id] = e.message
+        # logs the polling operation in an optimized way, so that not
+        # to fill up the log with recurrent messages
+        if dev_id not in self._polled_devs:
+            self.log_info('[%s] first polling', dev_id)
+            self._polled_devs.add(dev_id)
+        else:
+            self.log_debug('[%s] polling device', dev_id)
 
-                    except ValueError:
-                        stats.crc_errs += 1
-                        errors[dev_id] = 'CRC error'
+        with self._stats_lock:
+            try:
+                stats = self._dev_stats[dev_id]
+            except KeyError:
+                stats = self._dev_stats[dev_id] = PollingStats()
+
+        task.breaker.probe()
+        poll_start = self._clock()
+        lag = max(poll_start - when, 0)
+        stats.lag.add(lag)
+        if lag > task.period * self.LATE_TOLERANCE:
+            stats.late += 1
+        stats.total_poll += 1
+        return stats, poll_start
+
+    def _poll_completed(self, task, when, stats, events=None, error=None):
+        """ Processes the outcome of a poll, emits the resulting events and re-schedules the task.
+
+        :param PollTask task: the polling task
+        :param float when: the planned time of the poll
+        :param PollingStats stats: the stats of the device
+        :param list events: the events produced by the poll
+        :param Exception error: the error raised by the poll if it failed
+        """
+        dev_id = task.dev.id_
+        errors = self._errors
+        breaker = task.breaker
 
-                    except TypeError as e:
-                        stats.unexp_errs += 1
-                        errors[dev_id] = e.message
+        if isinstance(error, PollTimeoutError):
+            stats.timeouts += 1
+            errors[dev_id] = error.message
 
-                    else:
-                        if dev_id in errors:
-                            self.log_info('[%s] recovered from %s', dev_id, errors[dev_id])
-                            del errors[dev_id]
-                            stats.recovered += 1
-
-                        try:
-                            for evt in events:
-                                if self._terminate:
-                                    break
-                                self.log_debug('emitting ' + str(evt))
-                                self._owner.emit_event(
-                                    evt.var_type, evt.var_name, json.dumps(evt.data)
-                                )
-                        except DBusException as e:
-                            if not self._terminate:
-                                self.log_exception(e)
-
-                    dev_stats[dev_id] = stats
-                    error = errors.get(dev_id, None)
-                    if stats.total_poll % self.STATS_INTERVAL == 0:
-                        self.log_info('[%s] %s error=%s', dev_id, stats, error)
-                        # save stats on disk
-                        with open(self._stats_file_path, 'w') as fp:
-                            d = {k: v.as_dict() for k, v in dev_stats.iteritems()}
-                            json.dump(d, fp, indent=4)
-
-                    # In case of error, and if it is the first one, let's give it a second chance for this task
-                    # by re-enqueing it with the same scheduling time.
-                    # Re-schedule it after the normal period otherwise (no error or not the first one)
-                    if error:
-                        if dev_id not in retried:
-                            self.log_debug("... second chance given")
-                            retried.append(dev_id)
-                            period = 0
-                        else:
-                            self.log_error("[%s] non recovered error : %s", dev_id, error)
-
-                    next_time = polling_start_time + period
-                    at(next_time, task)
-
-                    # if we need to calm down successive low level requests, wait a bit before polling next guy
-                    if poll_req_interval:
-                        self.log_debug('pausing %.1fs before polling next device...', poll_req_interval)
-                        time.sleep(poll_req_interval)
-
-            # wait until next checking, if we have not been requested to
+        elif isinstance(error, CommunicationError):
+            stats.comm_errs += 1
+            errors[dev_id] = error.message
+
+        elif isinstance(error, ValueError):
+            stats.crc_errs += 1
+            errors[dev_id] = 'CRC error'
+
+        elif error is not None:
+            stats.unexp_errs += 1
+            errors[dev_id] = error.message
+
+        else:
+            events = events or []
+            if dev_id in errors:
+                self.log_info('[%s] recovered from %s', dev_id, errors[dev_id])
+                del errors[dev_id]
+                stats.recovered += 1
+
+            stats.events += len(events)
+            if task.adaptive:
+                task.period = task.adaptive.update(len(events))
+
+            try:
+                for evt in events:
+                    if self._terminate:
+                        break
+                    self.log_debug('emitting ' + str(evt))
+                    self._owner.emit_event(
+                        evt.var_type, evt.var_name, json.dumps(evt.data)
+                    )
+            except DBusException as e:
+                if not self._terminate:
+                    self.log_exception(e)
+
+        # In case of error, the circuit breaker gives it an immediate second chance if it
+        # is the first one, and backs off otherwise so that the failing device does not
+        # eat the bus time of the healthy ones.
+        # Re-schedule it after the normal period if no error.
+        period = task.period
+        error = errors.get(dev_id, None)
+        if error:
+            period = breaker.failure(task.period)
+            if breaker.state == CIRCUIT_CLOSED:
+                self.log_debug("... second chance given")
+            else:
+                self.log_error("[%s] non recovered error : %s (next attempt in %.1fs)", dev_id, error, period)
+        else:
+            breaker.success()
+
+        if dev_id in self._poll_waiters:
+            self._notify_poll_waiters(dev_id, error)
+
+        stats.period = task.period
+        stats.circuit, stats.trips = breaker.state, breaker.trips
+        if stats.total_poll % self.STATS_INTERVAL == 0:
+            self.log_info('[%s] %s error=%s', dev_id, stats, error)
+            if self._stats_writer:
+                self._stats_writer.request()
+
+        # Re-schedule relative to the planned time, so that the phase of the device is kept
+        # and the lag can be measured. If we are so late that the next deadline is already
+        # passed, the missed ones are skipped instead of being caught up in a burst.
+        if not self._terminate:
+            next_time = when + period
+            now = self._clock()
+            if next_time <= now:
+                if not error:
+                    stats.missed += int((now - when) // period)
+                next_time = now + period
+            self.schedule(task, next_time)
+
+    def _pacer(self, bus):
+        """ Returns the pacer of a bus."""
+        try:
+            return self._pacers[bus]
+        except KeyError:
+            return self._pacers.setdefault(bus, BusPacer(self._owner.bus_rate, self._owner.bus_burst))
+
+    def _account_pacing(self, bus, delay):
+        """ Updates the bus stats with a delay imposed by its pacing."""
+        with self._stats_lock:
+            self._bus_paced[bus] = self._bus_paced.get(bus, 0) + delay
+
+    def _account_poll_time(self, task, stats, latency):
+        """ Updates the device and bus stats with the duration of a poll."""
+        stats.latency.add(latency)
+        with self._stats_lock:
+            self._bus_busy[task.bus] = self._bus_busy.get(task.bus, 0) + latency
+
+    def terminate(self):
+        """ Notifies the thread that it must terminate."""
+        self.log_info('terminate request received')
+        with self._wakeup:
+            self._terminate = True
+            self._wakeup.notify()
+            pending = self._poll_waiters.keys()
+        for dev_id in pending:
+            self._notify_poll_waiters(dev_id, 'polling stopped')
+
+
+class _PollingThread(threading.Thread, _PollingEngine):
+    """ Thread managing devices polling.
+
+    The thread sleeps until the next schedule deadline, on a condition which is notified
+    when new schedules are added from other threads or when the termination is requested.
+
+    By default, due polls are executed one after the other by the thread itself. If a number
+    of workers is specified, they are dispatched to a :py:class:`_PollWorkerPool` instead, and
+    only polls of devices sharing the same bus are serialized.
+
+    Polls of tasks having a timeout are executed by a :py:class:`_PollSupervisor`, so that a
+    hung driver is abandoned instead of blocking the thread. The same goes for the commands
+    sent to the devices, which are queued in the same scheduler with a higher priority.
+
+    The time source can be replaced by providing a clock and a sleeper, the latter being then
+    used for waiting for the next deadline instead of the condition. This is intended for running
+    the polling in simulated time (see :py:mod:`pycstbox.hal.simulation`), and supposes that
+    the devices are polled serially.
+    """
+    def __init__(self, owner, tasks, scheduler=None, workers=0, phasing=PHASING_HASH, clock=None, sleeper=None):
+        """
+        :param int workers: the size of the polling workers pool (0 for polling the devices serially)
+        :param callable sleeper: the function used to wait for a given delay (default: real time waits)
+
+        See :py:class:`_PollingEngine` for the other parameters.
+        """
+        threading.Thread.__init__(self)
+        _PollingEngine.__init__(self, owner, tasks, scheduler, phasing, clock)
+        self._workers = workers
+        self._pool = None
+        self._sleeper = sleeper
+        self._supervisor = _PollSupervisor(owner.coordinator_id)
+
+    def run(self):  #pylint: disable=R0912
+        """ Enqueues and activates tasks based on their periods.
+
+        The scheduler is keyed by the device ids, and holds for each one
+        the next schedule time and the task description, as provided by the task list.
+         """
+        scheduler = self._scheduler
+        self._start_polling()
+
+        # Enter the scheduling loop.
+        # Queued tasks having reached their schedule are executed and re-scheduled,
+        # then the thread sleeps until the next deadline
+        self.log_info('entering run loop')
+
+        if self._workers:
+            self._pool = _PollWorkerPool(self._owner.coordinator_id, self._workers)
+            self._pool.log_setLevel(self.log_getEffectiveLevel())
+            self._pool.start()
+            self.log_info('concurrent polling enabled (workers=%d)', self._workers)
+
+        while not self._terminate:
+            # process all the tasks which schedule is now or older, most urgent first, checking
+            # the termination request while doing this
+            while not self._terminate:
+                # dequeue the task and process it
+                now = self._clock()
+                with self._wakeup:
+                    schedule = scheduler.pop_due(now)
+                if not schedule:
+                    break
+
+                when, task = schedule
+                batch = self._collect_batch(task, when, now) if task.batch_key is not None else None
+                if isinstance(task, CommandTask):
+                    job = (self._command_task, task)
+                elif batch:
+                    job = (self._poll_batch, batch)
+                else:
+                    job = (self._poll_task, task, when)
+                if self._pool:
+                    self._pool.submit(task.bus, *job)
+                else:
+                    job[0](*job[1:])
+
+            # wait until next deadline, if we have not been requested to
             # terminate in the meantime
-            if self._terminate:
+            with self._wakeup:
+                if self._terminate:
+                    break
+
+                next_time = scheduler.next_time()
+                if not self._sleeper:
+                    if next_time is None:
+                        self._wakeup.wait()
+                    else:
+                        remaining_delay = next_time - self._clock()
+                        if remaining_delay > 0:
+                            self._wakeup.wait(remaining_delay)
+                    continue
+
+            # simulated time : nobody else can add schedules, so just jump to the next deadline
+            if next_time is None:
                 break
+            self._sleeper(max(next_time - self._clock(), 0))
+
+        if self._pool:
+            self._pool.terminate()
+            self._pool.join(self.TERMINATION_TIMEOUT)
+        self._supervisor.terminate()
 
-            elapsed = time.time() - polling_start_time
-            remaining_delay = self._task_trigger_checking_period - elapsed
-            if remaining_delay > 0:
-                time.sleep(remaining_delay)
+        self._stop_polling()
 
         self.log_info('terminated')
 
+    def _collect_batch(self, task, when, now):
+        """ Dequeues the due tasks which can be polled in the same request as a given one.
+
+        :param PollTask task: the task being executed
+        :param float when: the planned time of the task
+        :param float now: the current time
+        :returns: the list of (task, planned time) of the batch, or None if the task is alone
+        """
+        scheduler = self._scheduler
+        batch = [(task, when)]
+        with self._wakeup:
+            for dev_id in self._batches.get((task.bus, task.batch_key), ()):
+                if dev_id in scheduler and scheduler.when(dev_id) <= now:
+                    other_when, other_task = scheduler.pop(dev_id)
+                    batch.append((other_task, other_when))
+        return batch if len(batch) > 1 else None
+
+    def _poll_task(self, task, when):
+        """ Polls a single device.
+
+        :param PollTask task: the polling task
+        :param float when: the planned time of the poll
+        """
+        self._wait_bus(task.bus)
+        self._execute(task, when)
+        self._pacer(task.bus).release(self._clock(), task.gap)
+
+    def _command_task(self, cmd):
+        """ Applies a command to a device.
+
+        :param CommandTask cmd: the command
+        """
+        self._wait_bus(cmd.bus)
+        execute = partial(self._supervisor.call, cmd.dev.id_, timeout=cmd.timeout) if cmd.timeout else None
+        self._apply_command(cmd, execute)
+        self._pacer(cmd.bus).release(self._clock(), cmd.gap)
+
+    def _poll_batch(self, batch):
+        """ Polls a batch of devices in a single request, and processes the result of each one
+        as if it had been polled separately.
+
+        :param list batch: the list of (task, planned time) of the devices
+        """
+        tasks = [task for task, _ in batch]
+        self.log_debug('batch polling of %s', [t.dev.id_ for t in tasks])
+        bus = tasks[0].bus
+        self._wait_bus(bus)
+        start = self._clock()
+        try:
+            timeouts = [t.timeout for t in tasks if t.timeout]
+            if timeouts:
+                results = self._supervisor.call(
+                    tasks[0].dev.id_, partial(self._owner.batch_poll, [t.dev for t in tasks]), min(timeouts)
+                )
+            else:
+                results = self._owner.batch_poll([t.dev for t in tasks])
+            if len(results) != len(tasks):
+                raise TypeError('batch poll returned %d results for %d devices' % (len(results), len(tasks)))
+
+        except NotImplementedError:
+            self.log_error('batched reads not supported for %s -> disabled', [t.dev.id_ for t in tasks])
+            with self._wakeup:
+                for task in tasks:
+                    self._unregister_batch(task)
+                    task.batch_key = None
+            for task, when in batch:
+                self._poll_task(task, when)
+            return
+
+        except PollTimeoutError as e:
+            results = [PollTimeoutError(t.dev.id_, e.error) for t in tasks]
+
+        except (IOError, CommunicationError, ValueError, TypeError) as e:
+            # the request failed as a whole, which is reported for each device
+            results = [e] * len(tasks)
+
+        except Exception as e:  #pylint: disable=W0703
+            # the tasks must be re-scheduled whatever happened, otherwise the devices are
+            # never polled again
+            self.log_exception('%s unexpected batch poll error : %s', [t.dev.id_ for t in tasks], e)
+            results = [e] * len(tasks)
+
+        # the request duration is shared between the devices of the batch
+        end = self._clock()
+        self._pacer(bus).release(end, max(t.gap for t in tasks))
+        cost = (end - start) / len(tasks)
+        for (task, when), result in zip(batch, results):
+            self._execute(task, when, partial(self._demux_batch_result, task.dev, result), cost)
+
+    def _supervised_poll(self, task):
+        """ Returns the poll function of a device which read is limited in time.
+
+        Only the read of the device is done by the supervisor, its outputs being processed
+        by the polling thread. This way, the result of a read completed after the timeout
+        is simply dropped, and cannot alter the notification state of the device, nor race
+        with its next poll. Devices overriding the poll method as a whole are supervised
+        as a whole.
+
+        :param PollTask task: the polling task
+        :rtype: callable
+        """
+        haldev = task.dev.haldev
+        supervise = partial(self._supervisor.call, task.dev.id_, timeout=task.timeout)
+        if getattr(type(haldev).poll, '__func__', None) is not PolledDevice.poll.__func__:
+            return partial(supervise, haldev.poll)
+
+        def poll():
+            output_values = supervise(haldev.read_outputs)
+            return haldev.process_outputs(output_values) if output_values is not None else None
+        return poll
+
+    @staticmethod
+    def _demux_batch_result(dev, result):
+        """ Returns the events corresponding to the result of a device in a batched read."""
+        if isinstance(result, IOError):
+            raise CommunicationError(dev.id_, result)
+        if isinstance(result, Exception):
+            raise result
+        return dev.haldev.process_outputs(result)
+
+    def _wait_bus(self, bus):
+        """ Waits until the pacing of a bus allows a new transaction, and starts it."""
+        pacer = self._pacer(bus)
+        delay = pacer.delay(self._clock())
+        if delay:
+            self.log_debug('waiting %.3fs for bus %s...', delay, bus)
+            (self._sleeper or time.sleep)(delay)
+            self._account_pacing(bus, delay)
+        pacer.acquire(self._clock())
+
+    def _execute(self, task, when, poll=None, cost=0.):
+        """ Polls a device, emits the resulting events and re-schedules the task.
+
+        :param PollTask task: the polling task
+        :param float when: the planned time of the poll
+        :param callable poll: the function returning the events of the device (default: its
+            :py:meth:`pycstbox.hal.device.PolledDevice.poll` method)
+        :param float cost: the time spent in reading the device which is not included in
+            the `poll` call (in case of batched reads)
+        """
+        if poll is None:
+            poll = task.dev.haldev.poll
+            if task.timeout:
+                poll = self._supervised_poll(task)
+
+        stats, poll_start = self._poll_started(task, when)
+        try:
+            # requests the device driver to execute the polling procedure
+            # and return us the list of events corresponding to the reply
+            # received in return
+            try:
+                events = poll() or []
+            finally:
+                self._account_poll_time(task, stats, self._clock() - poll_start + cost)
+
+        except (CommunicationError, PollTimeoutError, ValueError, TypeError) as e:
+            self._poll_completed(task, when, stats, error=e)
+
+        except Exception as e:  #pylint: disable=W0703
+            # the task must be re-scheduled whatever happened, otherwise the device is
+            # never polled again
+            self.log_exception('[%s] unexpected poll error : %s', task.dev.id_, e)
+            self._poll_completed(task, when, stats, error=e)
+
+        else:
+            self._poll_completed(task, when, stats, events)
+
+
+class _StatsWriter(threading.Thread, Loggable):
+    """ Thread saving the polling stats in the background, so that the polling never
+    waits for the storage.
+
+    Save requests are coalesced, and the file is written at most every `MIN_INTERVAL`
+    seconds, whatever the number of devices requesting it. The file is replaced
+    atomically, by writing a temporary file which is renamed once synced, so that a
+    power cut never leaves a truncated file behind. Pending stats are flushed
+    when the writer is terminated.
+    """
+    MIN_INTERVAL = 10
+
+    def __init__(self, cid, path, snapshot):
+        """
+        :param str cid: the id of the owning coordinator
+        :param str path: the path of the stats file
+        :param callable snapshot: a callable returning the stats to be saved, as a JSON serializable object
+        """
+        threading.Thread.__init__(self, name='stats-' + cid)
+        self.daemon = True
+
+        self._path = path
+        self._snapshot = snapshot
+        self._requested = threading.Event()
+        self._stopped = threading.Event()
+
+        Loggable.__init__(self, logname='Stats:%s' % cid)
+
+    def request(self):
+        """ Requests the stats to be saved. Never blocks."""
+        self._requested.set()
+
+    def run(self):
+        while True:
+            self._requested.wait()
+            self._requested.clear()
+            self._save(self._snapshot())
+
+            if self._stopped.is_set():
+                break
+            # let the requests accumulate for a while
+            self._stopped.wait(self.MIN_INTERVAL)
+
+    def _save(self, data):
+        tmp_path = self._path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as fp:
+                json.dump(data, fp, indent=4)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.rename(tmp_path, self._path)
+        except (IOError, OSError) as e:
+            self.log_error('cannot save polling stats : %s', e)
+        else:
+            self.log_debug('polling stats saved')
+
     def terminate(self):
-        """ Notifies the thread that it must terminate."""
-        self.log_info('terminate request received')
-        self._terminate = True
+        """ Requests the writer to save the pending stats and stop."""
+        self._stopped.set()
+        self._requested.set()
+
+
+class _PollWorkerPool(Loggable):
+    """ Bounded pool of threads executing polling jobs concurrently.
+
+    Each job is submitted with the identifier of the bus it uses. Jobs sharing
+    the same bus are never executed at the same time, but queued until the bus
+    is released, so that they do not hold a worker while waiting for it.
+    """
+    def __init__(self, cid, size):
+        """
+        :param str cid: the id of the owning coordinator
+        :param int size: the number of worker threads
+        """
+        Loggable.__init__(self, logname='Pool:%s' % cid)
+
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        # jobs waiting for their bus to be released, keyed by the ids of the busy buses
+        self._pending = {}
+        self._threads = [
+            threading.Thread(target=self._work, name='poll-%s-%d' % (cid, i))
+            for i in range(size)
+        ]
+        for thread in self._threads:
+            thread.daemon = True
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, bus, fn, *args):
+        """ Submits a job for execution as soon as a worker and its bus are available.
+
+        :param bus: the identifier of the bus used by the job
+        :param callable fn: the job
+        :param args: the positional arguments of the job
+        """
+        with self._lock:
+            if bus in self._pending:
+                self._pending[bus].append((fn, args))
+                return
+            self._pending[bus] = deque()
+        self._queue.put((bus, fn, args))
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+
+            bus, fn, args = job
+            try:
+                fn(*args)
+            except Exception as e:  #pylint: disable=W0703
+                self.log_exception(e)
+            finally:
+                self._release(bus)
+
+    def _release(self, bus):
+        with self._lock:
+            pending = self._pending[bus]
+            if not pending:
+                del self._pending[bus]
+                return
+            fn, args = pending.popleft()
+        self._queue.put((bus, fn, args))
+
+    def terminate(self):
+        """ Requests the workers to stop once the already queued jobs are executed."""
+        for _ in self._threads:
+            self._queue.put(None)
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+class _PollSupervisor(Loggable):
+    """ Executes polls in worker threads, waiting for their completion for a limited time.
+
+    A worker which poll is not completed in time is abandoned : its result will be
+    discarded, and it exits as soon as the poll returns, if ever. Since a thread cannot
+    be killed, it is up to the driver to give up at some point. Idle workers are reused
+    for the next polls, and new ones are created when none is available.
+    """
+    def __init__(self, cid):
+        """
+        :param str cid: the id of the owning coordinator
+        """
+        Loggable.__init__(self, logname='Sup:%s' % cid)
+
+        self._cid = cid
+        self._lock = threading.Lock()
+        self._idle = []
+        self._created = 0
+        self._abandoned = 0
+
+    def call(self, dev_id, fn, timeout):
+        """ Executes a poll, and returns its result.
+
+        :param str dev_id: the id of the polled device
+        :param callable fn: the poll
+        :param float timeout: the maximum duration of the poll (in seconds)
+        :returns: the result of the poll
+        :raises PollTimeoutError: if the poll is not completed in time
+        """
+        with self._lock:
+            if self._idle:
+                worker = self._idle.pop()
+            else:
+                self._created += 1
+                worker = _SupervisedWorker('sup-%s-%d' % (self._cid, self._created))
+                worker.start()
+
+        if not worker.execute(fn, timeout):
+            worker.abandon()
+            with self._lock:
+                self._abandoned += 1
+                abandoned = self._abandoned
+            self.log_error('[%s] poll not completed after %ss -> abandoned (total abandoned: %d)',
+                           dev_id, timeout, abandoned)
+            raise PollTimeoutError(dev_id, IOError('no reply after %ss' % timeout))
+
+        with self._lock:
+            self._idle.append(worker)
+        return worker.result()
+
+    def terminate(self):
+        """ Stops the idle workers."""
+        with self._lock:
+            for worker in self._idle:
+                worker.abandon()
+            self._idle = []
+
+
+class _SupervisedWorker(threading.Thread):
+    """ Worker thread of a :py:class:`_PollSupervisor`."""
+    def __init__(self, name):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self._jobs = Queue.Queue()
+        self._done = threading.Event()
+        self._result = self._exc_info = None
+
+    def run(self):
+        while True:
+            fn = self._jobs.get()
+            if fn is None:
+                break
+            try:
+                self._result = fn()
+            except Exception:   #pylint: disable=W0703
+                self._exc_info = sys.exc_info()
+            self._done.set()
+
+    def execute(self, fn, timeout):
+        """ Submits a job and waits for its completion.
+
+        :returns: True if the job is completed in time
+        """
+        self._done.clear()
+        self._result = self._exc_info = None
+        self._jobs.put(fn)
+        return self._done.wait(timeout)
+
+    def result(self):
+        """ Returns the result of the last job, or raises the exception it raised."""
+        if self._exc_info:
+            exc_info, self._exc_info = self._exc_info, None
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return self._result
+
+    def abandon(self):
+        """ Requests the worker to exit once its current job is completed."""
+        self._jobs.put(None)
 
 
 class PollingThreadError(Exception):
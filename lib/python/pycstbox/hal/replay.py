@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Recording of the devices polls, and their replay without the hardware.
+
+A coordinator configured with a ``record`` path stores the output values read from each
+of its polled devices in a recording file. A coordinator configured with a ``replay``
+path uses instead :py:class:`ReplayDevice` instances, which feed back the recorded values
+to the events production process, in place of the real drivers.
+
+The recording is a gzip compressed file of JSON lines. The first line related to a device
+gives the names of the recorded outputs::
+
+    {"device": "<dev_id>", "fields": ["<output>", ...]}
+
+and each following one a read, as its time stamp (in seconds), the device id and the
+values of the outputs in the same order::
+
+    [<timestamp>, "<dev_id>", [<value>, ...]]
+
+Successive recording sessions are appended to the same file. The compressed stream is
+flushed at regular intervals, so that a recording which has not been closed properly (ex:
+after a crash of the process) can be replayed up to its last flush.
+"""
+
+import gzip
+import json
+import logging
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+from pycstbox.hal.device import PolledDevice
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+_logger = logging.getLogger('hal.replay')
+
+
+class PollRecorder(object):
+    """ Records the output values read from the devices.
+
+    Can be shared by devices polled from different threads.
+    """
+    #: count of records between flushes of the file
+    FLUSH_RECORDS = 1000
+    #: maximum delay (in seconds) between a record and the flush of the file
+    FLUSH_INTERVAL = 10.
+
+    def __init__(self, path):
+        """
+        :param str path: the path of the recording file
+        :raises IOError: if the file cannot be opened
+        """
+        self._fp = gzip.open(path, 'ab')
+        self._lock = threading.Lock()
+        # names of the recorded outputs, keyed by device id
+        self._fields = {}
+        self._unflushed = 0
+        self._flush_time = time.time() + self.FLUSH_INTERVAL
+
+    def record(self, dev_id, timestamp, output_values, outputs, get_value=None):
+        """ Records a read of a device.
+
+        :param str dev_id: the device id
+        :param float timestamp: the time of the read
+        :param output_values: the output values, as returned by the HW device poll
+        :param outputs: the names of the outputs of the device
+        :param callable get_value: the function extracting the value of an output from the output
+            values (default: by attribute access)
+        """
+        with self._lock:
+            if not self._fp:
+                return
+            try:
+                fields = self._fields[dev_id]
+            except KeyError:
+                fields = self._fields[dev_id] = sorted(outputs)
+                self._write({'device': dev_id, 'fields': fields})
+            if get_value:
+                values = [get_value(output_values, f) for f in fields]
+            else:
+                values = [getattr(output_values, f, None) for f in fields]
+            self._write([round(timestamp, 3), dev_id, values])
+
+            self._unflushed += 1
+            if self._unflushed >= self.FLUSH_RECORDS or time.time() >= self._flush_time:
+                self._flush()
+
+    def _write(self, item):
+        self._fp.write(json.dumps(item, separators=(',', ':')) + '\n')
+
+    def _flush(self):
+        # a sync flush ends the compressed data on a byte boundary, so that all the records
+        # written so far can be decompressed even if the file is not closed properly
+        self._fp.flush(zlib.Z_SYNC_FLUSH)
+        self._unflushed = 0
+        self._flush_time = time.time() + self.FLUSH_INTERVAL
+
+    def close(self):
+        with self._lock:
+            if self._fp:
+                self._fp.close()
+                self._fp = None
+
+
+def load_recording(path):
+    """ Loads a recording file.
+
+    A truncated file, as left by a recording which has not been closed properly, is loaded
+    up to its last complete record.
+
+    :param str path: the path of the recording file
+    :returns: the reads of each device, keyed by device id, as lists of (timestamp, output
+        values) sorted by time, the output values being named tuples
+    :raises IOError: if the file cannot be read
+    :raises ValueError: if the file content is not valid
+    """
+    classes = {}
+    records = {}
+    with gzip.open(path, 'rb') as fp:
+        for line in _read_lines(fp, path):
+            item = json.loads(line)
+            if isinstance(item, dict):
+                dev_id = str(item['device'])
+                classes[dev_id] = namedtuple('RecordedOutputs', [str(f) for f in item['fields']])
+                records.setdefault(dev_id, [])
+            else:
+                timestamp, dev_id, values = item
+                try:
+                    records[dev_id].append((timestamp, classes[dev_id](*values)))
+                except (KeyError, TypeError):
+                    raise ValueError('invalid record for %s : %s' % (dev_id, line.strip()))
+
+    for reads in records.itervalues():
+        reads.sort(key=lambda r: r[0])
+    return records
+
+
+def _read_lines(fp, path):
+    """ Yields the complete lines of a recording file, stopping at its truncated tail if any."""
+    count = 0
+    try:
+        for line in fp:
+            if not line.endswith('\n'):
+                _logger.warning('recording %s ends with an incomplete record -> ignored', path)
+                return
+            count += 1
+            yield line
+    except (IOError, EOFError) as e:
+        # raised when the end of the compressed stream is missing or corrupted, or when the
+        # file is not a recording at all, which is not to be mistaken for an empty one
+        if not count:
+            raise
+        _logger.warning('recording %s is truncated (%s) -> loaded up to its last complete record', path, e)
+
+
+class ReplayHwDevice(object):
+    """ Low level interface replaying the recorded reads of a device.
+
+    With a positive speed, each poll returns the latest read recorded before the replay
+    position, which advances with the clock at the given speed factor (1 for replaying
+    at the recorded speed). With a null speed, each poll returns the next recorded read,
+    whatever the time elapsed, which gives a deterministic sequence for regression runs
+    and lets benchmarks go as fast as possible.
+
+    Once the end of the recording is reached, and unless the replay loops, polls return the
+    last read at a positive speed (the device keeps its final state), and None at a null speed.
+    """
+    def __init__(self, reads, speed=1., clock=time.time, loop=False):
+        """
+        :param list reads: the recorded reads, as returned by :py:func:`load_recording`
+        :param float speed: the replay speed factor (0 for replaying one read per poll)
+        :param callable clock: the time source
+        :param bool loop: if True, the replay restarts from the beginning when its end is reached
+        """
+        self._reads = reads
+        self._speed = speed
+        self._clock = clock
+        self._loop = loop
+        self._start = None
+        self._cycle = 0
+        self._next = 0
+        self.terminate = False
+        self.poll_req_interval = 0
+
+    def poll(self):
+        reads = self._reads
+        if not reads:
+            return None
+
+        if not self._speed:
+            if self._next >= len(reads):
+                if not self._loop:
+                    return None
+                self._next = 0
+            self._next += 1
+            return reads[self._next - 1][1]
+
+        now = self._clock()
+        if self._start is None:
+            self._start = now
+        elapsed = (now - self._start) * self._speed
+        if self._loop and len(reads) > 1:
+            # the last read lasts for the average interval between reads, as the others
+            span = float(reads[-1][0] - reads[0][0]) * len(reads) / (len(reads) - 1)
+        else:
+            span = 0
+        if span > 0:
+            cycle, elapsed = divmod(elapsed, span)
+            if cycle != self._cycle:
+                self._cycle, self._next = cycle, 0
+        position = reads[0][0] + elapsed
+        while self._next < len(reads) and reads[self._next][0] <= position:
+            self._next += 1
+        return reads[self._next - 1][1] if self._next else None
+
+
+class ReplayDevice(PolledDevice):
+    """ Device abstraction replaying the recorded reads of a device instead of polling it.
+
+    It stands for the driver of the recorded device, which output definitions are reused
+    so that the produced events are the same (see :py:meth:`replaying`).
+    """
+    _OUTPUTS_TO_EVENTS_MAPPING = {}
+
+    def __init__(self, coord_cfg, dev_cfg, hwdev):
+        """
+        :param ReplayHwDevice hwdev: the low level interface replaying the reads
+
+        Refer to :py:class:`pycstbox.hal.device.HalDevice` for the other parameters.
+        """
+        super(ReplayDevice, self).__init__(coord_cfg, dev_cfg)
+        self._hwdev = hwdev
+
+    @classmethod
+    def replaying(cls, driver_class):
+        """ Returns the replay device class standing for a given driver class.
+
+        :param type driver_class: the class of the driver of the recorded device
+        """
+        return type('Replay' + driver_class.__name__, (cls,), {
+            '_OUTPUTS_TO_EVENTS_MAPPING': getattr(driver_class, '_OUTPUTS_TO_EVENTS_MAPPING', {}),
+            'BUS_GAP': getattr(driver_class, 'BUS_GAP', None)
+        })
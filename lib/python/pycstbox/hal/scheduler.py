@@ -0,0 +1,486 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Polling tasks scheduling.
+
+This module provides the scheduler used by the device network polling thread
+to keep track of the next poll time of each device. It is implemented as a binary
+heap, with lazy removal of cancelled entries, so that insertion, cancellation and
+rescheduling are O(log n) whatever the number of devices attached to the coordinator.
+
+It also provides the planning of the initial phase of the tasks (see :py:func:`plan_phases`),
+so that devices sharing the same period are not polled back to back for their whole life.
+
+Coordinators can plug a different implementation by overriding
+:py:meth:`pycstbox.hal.network.CoordinatorServiceObject.create_scheduler`, as
+long as it provides the same public interface.
+
+When executed as a script, this module runs a small benchmark of the scheduler
+(use -h for options).
+"""
+
+import heapq
+import itertools
+import random
+import zlib
+from collections import namedtuple, defaultdict
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+Schedule = namedtuple('Schedule', ['when', 'task'])
+""" Named tuple describing a task schedule.
+
+:key long when: schedule time (in second count from asbolute time origin)
+:key task: the instance of the task to be executed
+"""
+
+# initial phase planning modes
+PHASING_NONE = 'none'
+PHASING_HASH = 'hash'
+PHASING_LEVEL = 'level'
+PHASING_MODES = (PHASING_NONE, PHASING_HASH, PHASING_LEVEL)
+
+# circuit breaker states
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half-open'
+
+# tasks priority classes
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_CLASSES = {
+    'high': PRIORITY_HIGH,
+    'normal': PRIORITY_NORMAL,
+    'low': PRIORITY_LOW
+}
+# reserved to the commands sent to the devices, which are served before any poll
+PRIORITY_COMMAND = -1
+
+# marker of cancelled heap entries
+_REMOVED = object()
+
+# heap entries fields indexes
+_WHEN, _SEQ, _KEY, _TASK, _PRIO = range(5)
+
+
+class PollScheduler(object):
+    """ Priority queue of scheduled tasks, ordered by schedule time.
+
+    Each task is identified by a key (the device id most of the time), and a given
+    key can only be scheduled once. Scheduling an already scheduled key moves it to
+    its new time.
+
+    Tasks are also given a priority (the lower, the more urgent). Among the tasks which
+    are due, the most urgent ones are returned first, so that when the bus is
+    oversubscribed, the low priority tasks are the ones which slip. Tasks sharing the
+    same priority are returned by schedule time, then in the order they have been scheduled.
+
+    The scheduler is not thread safe. Callers sharing it between threads must take
+    care of the locking.
+    """
+    # the heaps are rebuilt when cancelled entries outnumber valid ones by this factor
+    COMPACTION_RATIO = 2
+
+    def __init__(self):
+        # pending entries, ordered by time
+        self._heap = []
+        # due entries, ordered by priority
+        self._ready = []
+        self._entries = {}
+        self._seq = itertools.count()
+        self._removed = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def schedule(self, key, when, task, priority=PRIORITY_NORMAL):
+        """ Schedules a task, replacing any pending schedule for the same key.
+
+        :param key: the task key (must be hashable)
+        :param float when: the schedule time (in absolute time)
+        :param task: the task to be executed
+        :param int priority: the task priority (the lower, the more urgent)
+        """
+        if key in self._entries:
+            self._invalidate(self._entries.pop(key))
+        entry = [when, next(self._seq), key, task, priority]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+
+    def reschedule(self, key, when):
+        """ Moves the pending schedule of a task to another time.
+
+        :param key: the task key
+        :param float when: the new schedule time
+        :raises KeyError: if the task is not currently scheduled
+        """
+        entry = self._entries[key]
+        self.schedule(key, when, entry[_TASK], entry[_PRIO])
+
+    def cancel(self, key):
+        """ Removes the pending schedule of a task, if any.
+
+        :param key: the task key
+        :returns: True if a pending schedule has been cancelled
+        """
+        try:
+            entry = self._entries.pop(key)
+        except KeyError:
+            return False
+        self._invalidate(entry)
+        return True
+
+    def pop(self, key):
+        """ Dequeues the pending schedule of a given task, whatever its time is.
+
+        :param key: the task key
+        :returns: the :py:class:`Schedule` of the task, or None if it is not currently scheduled
+        """
+        try:
+            entry = self._entries.pop(key)
+        except KeyError:
+            return None
+        task = entry[_TASK]
+        self._invalidate(entry)
+        return Schedule(entry[_WHEN], task)
+
+    def when(self, key):
+        """ Returns the schedule time of a task.
+
+        :param key: the task key
+        :raises KeyError: if the task is not currently scheduled
+        """
+        return self._entries[key][_WHEN]
+
+    def next_time(self):
+        """ Returns the time of the earliest schedule, or None if the scheduler is empty.
+
+        If some tasks are already due, the returned time is the one of the most urgent
+        of them, which is in the past.
+        """
+        ready = self._ready
+        while ready and ready[0][-1][_TASK] is _REMOVED:
+            heapq.heappop(ready)
+            self._removed -= 1
+        if ready:
+            return ready[0][-1][_WHEN]
+
+        heap = self._heap
+        while heap and heap[0][_TASK] is _REMOVED:
+            heapq.heappop(heap)
+            self._removed -= 1
+        return heap[0][_WHEN] if heap else None
+
+    def pop_due(self, now):
+        """ Dequeues the most urgent of the schedules which time is reached.
+
+        :param float now: the current time
+        :returns: the due :py:class:`Schedule`, or None if nothing is due yet
+        """
+        heap, ready = self._heap, self._ready
+        while heap and heap[0][_WHEN] <= now:
+            entry = heapq.heappop(heap)
+            if entry[_TASK] is _REMOVED:
+                self._removed -= 1
+            else:
+                heapq.heappush(ready, (entry[_PRIO], entry[_WHEN], entry[_SEQ], entry))
+
+        while ready:
+            entry = heapq.heappop(ready)[-1]
+            if entry[_TASK] is _REMOVED:
+                self._removed -= 1
+            else:
+                del self._entries[entry[_KEY]]
+                return Schedule(entry[_WHEN], entry[_TASK])
+        return None
+
+    def clear(self):
+        """ Removes all pending schedules."""
+        del self._heap[:]
+        del self._ready[:]
+        self._entries.clear()
+        self._removed = 0
+
+    def _invalidate(self, entry):
+        entry[_TASK] = _REMOVED
+        self._removed += 1
+        if self._removed > self.COMPACTION_RATIO * len(self._entries) + 16:
+            self._heap = [e for e in self._heap if e[_TASK] is not _REMOVED]
+            heapq.heapify(self._heap)
+            self._ready = [r for r in self._ready if r[-1][_TASK] is not _REMOVED]
+            heapq.heapify(self._ready)
+            self._removed = 0
+
+
+class AdaptivePeriod(object):
+    """ Polling period adapting itself to the dynamics of the device outputs.
+
+    The period is narrowed as soon as a poll produces events (i.e. the values are
+    changing), and slowly widened as long as polls produce none, always staying
+    within the configured bounds. Stable devices thus end up being polled at the
+    maximum period, leaving the bus to the ones which need it.
+    """
+    __slots__ = ['min_period', 'max_period', 'period']
+
+    NARROWING_FACTOR = 0.5
+    WIDENING_FACTOR = 1.25
+
+    def __init__(self, min_period, max_period, period):
+        """
+        :param float min_period: the shortest allowed period
+        :param float max_period: the longest allowed period
+        :param float period: the initial period (clamped in the bounds)
+        :raises ValueError: if the bounds are not consistent
+        """
+        if not 0 < min_period <= max_period:
+            raise ValueError('invalid period bounds (%s, %s)' % (min_period, max_period))
+        self.min_period, self.max_period = min_period, max_period
+        self.period = min(max(period, min_period), max_period)
+
+    def update(self, event_count):
+        """ Adjusts the period according to the outcome of the last poll.
+
+        :param int event_count: the number of events produced by the poll
+        :returns: the new period
+        """
+        if event_count:
+            self.period = max(self.period * self.NARROWING_FACTOR, self.min_period)
+        else:
+            self.period = min(self.period * self.WIDENING_FACTOR, self.max_period)
+        return self.period
+
+
+class CircuitBreaker(object):
+    """ Per device circuit breaker, used to stop wasting bus time on failing devices.
+
+    While the circuit is closed, the device is polled normally, and a first failure
+    is given an immediate second chance. When failures go on, the circuit opens and
+    the device is no more polled until an exponentially growing backoff delay has elapsed.
+    The next poll is then a probe (half-open state): the circuit closes again if it
+    succeeds, or re-opens with a doubled delay otherwise.
+
+    Backoff delays are randomized by a jitter, so that devices which failed together
+    (ex: on a power cut) do not retry together.
+    """
+    __slots__ = ['state', 'failures', 'backoff', 'backoff_max', 'trips']
+
+    FAILURE_THRESHOLD = 2
+    BACKOFF_MIN = 1.
+    JITTER = 0.2
+
+    _random = random.Random()
+
+    def __init__(self, backoff_max=600):
+        """
+        :param float backoff_max: the upper limit of the backoff delay (in seconds)
+        """
+        self.backoff_max = backoff_max
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.backoff = 0
+        self.trips = 0
+
+    def probe(self):
+        """ Must be called when a poll starts, so that polls of an open circuit are
+        identified as probes."""
+        if self.state == CIRCUIT_OPEN:
+            self.state = CIRCUIT_HALF_OPEN
+
+    def success(self):
+        """ Records a successful poll, closing the circuit."""
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.backoff = 0
+
+    def failure(self, period):
+        """ Records a failed poll, and returns the delay before the next attempt.
+
+        :param float period: the normal polling period of the device
+        :returns: the delay before the next poll (in seconds)
+        """
+        self.failures += 1
+        if self.state == CIRCUIT_CLOSED:
+            if self.failures < self.FAILURE_THRESHOLD:
+                return 0
+            self.trips += 1
+            self.backoff = min(max(2 * period, self.BACKOFF_MIN), self.backoff_max)
+        else:
+            self.backoff = min(2 * self.backoff, self.backoff_max)
+
+        self.state = CIRCUIT_OPEN
+        return self.backoff * (1 + self._random.uniform(-self.JITTER, self.JITTER))
+
+
+class BusPacer(object):
+    """ Paces the transactions on a bus, so that they are sent as fast as the bus tolerates.
+
+    Two constraints can be combined :
+
+    - a gap, i.e. a minimum silence between the end of a transaction and the start of
+      the next one, which depends on the device involved in the last transaction
+    - a token bucket, limiting the transactions rate while allowing short bursts
+
+    Since the gap is measured from the end of the last transaction, a bus which is
+    idle does not delay the next transaction.
+    """
+    __slots__ = ['rate', 'burst', 'tokens', 'refill_time', 'free_time']
+
+    def __init__(self, rate=0., burst=1):
+        """
+        :param float rate: the maximum sustained transactions rate (per second, 0 for no limit)
+        :param int burst: the number of transactions which can be sent in a row when
+            the bus has been idle
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.refill_time = None
+        self.free_time = 0.
+
+    def _refill(self, now):
+        if self.refill_time is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.refill_time) * self.rate)
+        self.refill_time = now
+
+    def delay(self, now):
+        """ Returns the delay before the next transaction can be started.
+
+        :param float now: the current time
+        :returns: the delay (in seconds, 0 if the transaction can be started now)
+        """
+        delay = self.free_time - now
+        if self.rate:
+            self._refill(now)
+            if self.tokens < 1:
+                delay = max(delay, (1 - self.tokens) / self.rate)
+        return max(delay, 0.)
+
+    def acquire(self, now):
+        """ Must be called when a transaction starts.
+
+        :param float now: the current time
+        """
+        if self.rate:
+            self._refill(now)
+            self.tokens -= 1
+
+    def release(self, now, gap=0.):
+        """ Must be called when a transaction ends.
+
+        :param float now: the current time
+        :param float gap: the silence required before the next transaction (in seconds)
+        """
+        self.free_time = now + gap
+
+
+def hash_phase(key, period):
+    """ Returns a deterministic phase offset for a task, derived from its key.
+
+    The same key always gives the same offset, so that the polling time line of
+    a device does not change from a start to the next one.
+
+    :param key: the task key (the device id most of the time)
+    :param float period: the task period
+    :returns: an offset in the range [0, period)
+    """
+    return (zlib.crc32(str(key)) & 0xffffffff) / 4294967296. * period
+
+
+def plan_phases(tasks, mode=PHASING_HASH):
+    """ Computes the initial phase offset of a list of polling tasks.
+
+    The following modes are available:
+
+    - ``none``: all the tasks start immediately (offset 0)
+    - ``hash``: each task gets an offset within its period, derived from the hash of its
+      device id (see :py:func:`hash_phase`)
+    - ``level``: the tasks sharing the same bus are evenly spread over their period,
+      so that the bus occupancy is levelled. They are ordered by period and hash so that
+      the result is deterministic
+
+    :param tasks: the polling tasks, providing the `dev`, `period` and `bus` attributes
+    :param str mode: the planning mode
+    :returns: a dictionary giving the offset of each task, keyed by device id
+    :raises ValueError: if the mode is not valid
+    """
+    if mode == PHASING_NONE:
+        return {task.dev.id_: 0 for task in tasks}
+
+    if mode == PHASING_HASH:
+        return {task.dev.id_: hash_phase(task.dev.id_, task.period) for task in tasks}
+
+    if mode == PHASING_LEVEL:
+        buses = defaultdict(list)
+        for task in tasks:
+            buses[task.bus].append(task)
+
+        offsets = {}
+        for bus_tasks in buses.itervalues():
+            bus_tasks.sort(key=lambda t: (t.period, hash_phase(t.dev.id_, 1)))
+            count = len(bus_tasks)
+            for i, task in enumerate(bus_tasks):
+                offsets[task.dev.id_] = float(task.period) * i / count
+        return offsets
+
+    raise ValueError('invalid phasing mode (%s)' % mode)
+
+
+def benchmark(task_count, poll_count, period=60.):
+    """ Measures the cost of the scheduler operations in a steady polling situation.
+
+    `task_count` tasks are scheduled with the same period and evenly spread start
+    times, then `poll_count` dequeue/reschedule cycles are executed as the polling
+    thread would do.
+
+    :param int task_count: number of scheduled tasks (i.e. devices)
+    :param int poll_count: number of simulated polls
+    :param float period: polling period of the tasks
+    :returns: the mean cost of a poll cycle, in micro-seconds
+    """
+    import time
+
+    scheduler = PollScheduler()
+    for i in xrange(task_count):
+        scheduler.schedule(i, period * i / task_count, i)
+
+    now = 0.
+    start = time.time()
+    for _ in xrange(poll_count):
+        now = scheduler.next_time()
+        when, task = scheduler.pop_due(now)
+        scheduler.schedule(task, when + period, task)
+    elapsed = time.time() - start
+
+    return elapsed / poll_count * 1e6
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Polling scheduler benchmark')
+    parser.add_argument('-p', '--polls', type=int, default=100000, help='number of simulated polls')
+    parser.add_argument('counts', type=int, nargs='*', default=[10, 100, 1000, 10000, 100000],
+                        help='number of scheduled devices')
+    args = parser.parse_args()
+
+    for count in args.counts:
+        print "%7d devices : %.2f us/poll" % (count, benchmark(count, args.polls))
@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Simulated time harness for the devices polling.
+
+This module allows running the polling machinery of a coordinator against synthetic devices,
+in simulated time, in the spirit of the `simulate_time` mode of :py:class:`pycstbox.timedfsa.TimedFSA`.
+Hours of polling of thousands of devices can thus be run in a few seconds, which is used for
+benchmarking the scheduling overhead and checking that the polling keeps up with the load.
+
+It can be run as a script for producing a benchmark report::
+
+    $ python -m pycstbox.hal.simulation -d 10000 -t 1h
+"""
+
+import logging
+import random
+import sys
+import time
+from collections import namedtuple
+
+from pycstbox.devcfg import Device
+from pycstbox.hal import EventDataDef
+from pycstbox.hal.device import PolledDevice
+from pycstbox.hal.metrics import Histogram
+from pycstbox.hal.network import _PollingThread, PollTask, DeviceListEntry
+from pycstbox.hal.scheduler import CircuitBreaker, PHASING_HASH
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+
+class VirtualClock(object):
+    """ A clock which time only advances when explicitly requested.
+
+    Its :py:meth:`time` and :py:meth:`sleep` methods are drop-in replacements of
+    the ones of the `time` module.
+    """
+    def __init__(self, start=0.):
+        """
+        :param float start: the initial time
+        """
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, delay):
+        """ Advances the clock by a given delay.
+
+        :param float delay: the delay (in seconds)
+        """
+        if delay > 0:
+            self.now += delay
+
+
+SyntheticOutputs = namedtuple('SyntheticOutputs', ['value'])
+
+
+class SyntheticHwDevice(object):
+    """ Low level interface of a synthetic device.
+
+    Each poll returns values following random walks, and takes a given amount of simulated time.
+    Failures can be injected with a given probability.
+
+    Devices can be read in batches, the whole batch costing the latency of a single poll.
+    """
+    def __init__(self, clock, latency=0.01, change_ratio=0.1, failure_ratio=0., seed=None,
+                 outputs=('value',), noise=0.):
+        """
+        :param VirtualClock clock: the simulation clock (or the `time` module for running in real time)
+        :param float latency: the duration of a poll (in seconds)
+        :param float change_ratio: the probability for a value to change between two polls
+        :param float failure_ratio: the probability for a poll to fail
+        :param seed: the seed of the random generator (for reproducible runs)
+        :param tuple outputs: the names of the outputs
+        :param float noise: the standard deviation of the gaussian noise added to the values
+        """
+        self._clock = clock
+        self._latency = latency
+        self._change_ratio = change_ratio
+        self._failure_ratio = failure_ratio
+        self._noise = noise
+        self._random = random.Random(seed)
+        self._outputs_class = SyntheticOutputs if tuple(outputs) == SyntheticOutputs._fields else \
+            namedtuple('SyntheticOutputs', outputs)
+        self._values = [20.] * len(outputs)
+        self.terminate = False
+        self.poll_req_interval = 0
+
+    def poll(self):
+        self._clock.sleep(self._latency)
+        return self.read()
+
+    def batch_poll(self, hwdevs):
+        self._clock.sleep(self._latency)
+        results = []
+        for hwdev in hwdevs:
+            try:
+                results.append(hwdev.read())
+            except IOError as e:
+                results.append(e)
+        return results
+
+    def read(self):
+        rnd = self._random.random()
+        if rnd < self._failure_ratio:
+            raise IOError('simulated communication error')
+        values = self._values
+        for i in xrange(len(values)):
+            if i:
+                rnd = self._random.random()
+            if rnd < self._change_ratio:
+                values[i] += self._random.choice((-0.1, 0.1))
+        if self._noise:
+            return self._outputs_class(*(v + self._random.gauss(0, self._noise) for v in values))
+        return self._outputs_class(*values)
+
+
+class SyntheticDevice(PolledDevice):
+    """ Device abstraction based on a :py:class:`SyntheticHwDevice`.
+
+    It does not need to be registered nor described in the metadata, since it is
+    created directly by :py:func:`make_synthetic_devices`.
+    """
+    _OUTPUTS_TO_EVENTS_MAPPING = {'value': EventDataDef('temperature', 'degC')}
+
+    def __init__(self, coord_cfg, dev_cfg, hwdev, batch=None):
+        super(SyntheticDevice, self).__init__(coord_cfg, dev_cfg)
+        self._hwdev = hwdev
+        self._batch = batch
+        self.clock = hwdev._clock.time
+
+    @classmethod
+    def get_output_data_definition(cls, output):
+        return cls._OUTPUTS_TO_EVENTS_MAPPING['value']
+
+    def batch_key(self):
+        return self._batch
+
+    def batch_poll(self, devices):
+        return self._hwdev.batch_poll([d._hwdev for d in devices])
+
+
+def make_synthetic_devices(count, clock, latency=0.01, change_ratio=0.1, failure_ratio=0., seed=0, batch_size=1):
+    """ Creates a set of synthetic devices.
+
+    :param int count: the number of devices
+    :param VirtualClock clock: the simulation clock
+    :param seed: the base seed of the devices random generators
+    :param int batch_size: the size of the groups of devices which can be read in a single
+        request (1 for disabling batched reads)
+
+    See :py:class:`SyntheticHwDevice` for the other parameters.
+
+    :returns: the list of :py:class:`pycstbox.hal.network.DeviceListEntry` of the devices
+    """
+    devices = []
+    for i in xrange(count):
+        dev_id = 'sim%05d' % i
+        cfg = Device(
+            dev_id, address=str(i), location='simulation', enabled=True,
+            outputs={'value': {'enabled': True, 'varname': dev_id, 'prec': 1}}
+        )
+        hwdev = SyntheticHwDevice(clock, latency, change_ratio, failure_ratio, seed=(seed, i))
+        batch = 'grp%d' % (i // batch_size) if batch_size > 1 else None
+        devices.append(DeviceListEntry(dev_id, cfg, SyntheticDevice(None, cfg, hwdev, batch)))
+    return devices
+
+
+def benchmark_create_events(outputs, polls=10000, change_ratio=0.1, vectorized=False, noise=0., output_filter=None,
+                            aggregate=None):
+    """ Measures the cost of the events creation from the output values read from a device.
+
+    The output values are generated beforehand, so that only the processing done by
+    :py:meth:`pycstbox.hal.device.HalDevice.create_events` is measured.
+
+    :param int outputs: the number of outputs of the device
+    :param int polls: the number of processed reads
+    :param float change_ratio: the probability of a value change between two reads
+    :param bool vectorized: if True, the values are provided as NumPy arrays
+    :param float noise: the standard deviation of the noise added to the values
+    :param str output_filter: the specification of the filter of the outputs, if any
+        (see :py:mod:`pycstbox.hal.filters`)
+    :param str aggregate: the specification of the aggregation of the outputs, if any
+        (see :py:mod:`pycstbox.hal.aggregation`)
+    :returns: a tuple containing the mean cost per output (in seconds) and the count of created events
+    """
+    names = tuple('out%d' % i for i in xrange(outputs))
+    cfg = Device(
+        'bench', address='0', location='simulation', enabled=True,
+        outputs={
+            name: {
+                'enabled': True, 'varname': 'bench_' + name, 'prec': 2, 'filter': output_filter,
+                'aggregate': aggregate
+            }
+            for name in names
+        }
+    )
+    clock = VirtualClock()
+    hwdev = SyntheticHwDevice(clock, 0., change_ratio, seed=0, outputs=names, noise=noise)
+    device = SyntheticDevice(None, cfg, hwdev)
+    reads = [hwdev.read() for _ in xrange(polls)]
+    if vectorized:
+        import numpy
+        device.array_outputs = names
+        reads = [numpy.array(r) for r in reads]
+
+    events = 0
+    start = time.time()
+    for output_values in reads:
+        clock.sleep(1)
+        events += len(device.create_events(output_values))
+    return (time.time() - start) / (polls * outputs), events
+
+
+class _SimulationOwner(object):
+    """ Stands for the coordinator owning the polling thread, and counts the emitted events."""
+    poll_req_interval = 0
+    bus_rate, bus_burst = 0, 1
+
+    def __init__(self, cid):
+        self.coordinator_id = cid
+        self.events = 0
+
+    def emit_event(self, var_type, var_name, data):
+        self.events += 1
+
+    def batch_poll(self, devices):
+        haldevs = [d.haldev for d in devices]
+        return haldevs[0].batch_poll(haldevs)
+
+
+class _SimulatedPollingThread(_PollingThread):
+    STATS_STORAGE_PATH = None
+
+
+def run_simulation(devices, duration, periods=(60,), buses=1, phasing=PHASING_HASH, clock=None, gap=0.):
+    """ Runs the polling of devices for a given simulated duration.
+
+    The polling is executed synchronously in the calling thread.
+
+    :param list devices: the devices to be polled (see :py:func:`make_synthetic_devices`)
+    :param float duration: the simulated duration (in seconds)
+    :param periods: the polling periods, assigned to devices in a round robin way
+    :param int buses: the number of buses the devices are evenly spread on
+    :param str phasing: the initial phase planning mode
+    :param VirtualClock clock: the simulation clock (must be the one used by the devices)
+    :param float gap: the minimum silence on the bus after each poll (in seconds)
+    :returns: a dictionary containing the run report
+    """
+    clock = clock or VirtualClock()
+    owner = _SimulationOwner('sim')
+    tasks = [
+        PollTask(
+            dev, periods[i % len(periods)], 'bus%d' % (i % buses),
+            breaker=CircuitBreaker(), batch_key=dev.haldev.batch_key(), gap=gap
+        )
+        for i, dev in enumerate(devices)
+    ]
+
+    end_time = clock.time() + duration
+    thread = None
+    ended = []
+
+    # the simulated time advances during the polls too, so the end of the run is checked
+    # each time the time is read, otherwise an overloaded schedule would never end
+    def now():
+        t = clock.time()
+        if t >= end_time and not ended:
+            ended.append(t)
+            thread.terminate()
+        return t
+
+    def sleeper(delay):
+        clock.sleep(min(delay, end_time - clock.time()))
+        now()
+
+    thread = _SimulatedPollingThread(owner, tasks, phasing=phasing, clock=now, sleeper=sleeper)
+    thread.log_setLevel(logging.WARNING)
+
+    start = time.time()
+    thread.run()
+    wall_time = time.time() - start
+
+    stats = thread.get_stats()
+    lag = Histogram()
+    for d in thread._dev_stats.itervalues():
+        lag.merge(d.lag)
+    polls = stats['total_poll']
+
+    return {
+        'devices': len(devices),
+        'simulated_time': duration,
+        'wall_time': wall_time,
+        'polls': polls,
+        'events': owner.events,
+        'overhead_us': wall_time / polls * 1e6 if polls else 0.,
+        'lag_mean': lag.mean,
+        'lag_p50': lag.percentile(50),
+        'lag_p95': lag.percentile(95),
+        'lag_max': lag.max,
+        'late': sum(d.late for d in thread._dev_stats.itervalues()),
+        'missed': sum(d.missed for d in thread._dev_stats.itervalues()),
+        'utilization': stats['utilization'],
+        'paced': sum(b['paced'] for b in stats['buses'].itervalues()),
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    from pycstbox.sysutils import parse_period
+
+    parser = argparse.ArgumentParser(description="Polling benchmark in simulated time")
+    parser.add_argument('-d', '--devices', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='device counts')
+    parser.add_argument('-t', '--duration', default='1h',
+                        help='simulated duration')
+    parser.add_argument('-p', '--periods', nargs='+', default=['10s', '60s', '5m'],
+                        help='polling periods')
+    parser.add_argument('-l', '--latency', type=float, default=0.,
+                        help='simulated duration of a poll (in seconds)')
+    parser.add_argument('-c', '--change-ratio', type=float, default=0.1,
+                        help='probability of a value change between two polls')
+    parser.add_argument('-g', '--batch-size', type=int, default=1,
+                        help='size of the groups of devices read in a single request')
+    parser.add_argument('-G', '--gap', type=float, default=0.,
+                        help='minimum silence on the bus after each poll (in seconds)')
+    parser.add_argument('-E', '--events-bench', type=int, nargs='*',
+                        help='measure the events creation cost for the given output counts instead')
+    parser.add_argument('-V', '--vectorized', action='store_true',
+                        help='provide the values as NumPy arrays in the events creation benchmark')
+    parser.add_argument('-N', '--noise', type=float, default=0.,
+                        help='standard deviation of the noise added to the values in the events creation benchmark')
+    parser.add_argument('-F', '--filter',
+                        help='filter of the outputs in the events creation benchmark (ex: swinging_door:0.2)')
+    parser.add_argument('-A', '--aggregate',
+                        help='aggregation of the outputs in the events creation benchmark (ex: mean:10, max:1m)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    duration = parse_period(args.duration)
+    periods = [parse_period(p) for p in args.periods]
+
+    if args.events_bench is not None:
+        for count in args.events_bench or [1, 10, 100]:
+            cost, events = benchmark_create_events(
+                count, change_ratio=args.change_ratio, vectorized=args.vectorized, noise=args.noise,
+                output_filter=args.filter, aggregate=args.aggregate
+            )
+            print("%6d outputs : %.2f us/output - %.1f us/read (%d events)" % (
+                count, cost * 1e6, cost * count * 1e6, events
+            ))
+        sys.exit(0)
+
+    for count in args.devices:
+        vclock = VirtualClock()
+        report = run_simulation(
+            make_synthetic_devices(count, vclock, args.latency, args.change_ratio, batch_size=args.batch_size),
+            duration, periods, clock=vclock, gap=args.gap
+        )
+        print("%(devices)6d devices : %(polls)d polls / %(events)d events in %(wall_time).1fs "
+              "(%(overhead_us).1f us/poll) - lag p50=%(lag_p50).3f p95=%(lag_p95).3f max=%(lag_max).3f "
+              "- late=%(late)d missed=%(missed)d - utilization=%(utilization).3f paced=%(paced).1fs" % report)
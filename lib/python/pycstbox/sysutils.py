@@ -67,7 +67,7 @@ def str_2_bool(s):
         return False
     return s.lower() in ('true', 't', 'yes', 'y', '1')
 
-_period_re = re.compile(r'^([\d]+)([smh]?)$')
+_period_re = re.compile(r'^([\d]+)(ms|[smh]?)$')
 _tod_re = re.compile(r'^(?P<hours>[\d]+):(?P<minutes>[\d]+)(:(?P<seconds>[\d]+))?')
 
 
@@ -77,7 +77,7 @@ def parse_period(s):
 
     The accepted format is:
 
-        <nn> [ 's' | 'm' | 'h' ]
+        <nn> [ 'ms' | 's' | 'm' | 'h' ]
 
     with:
 
@@ -86,13 +86,15 @@ def parse_period(s):
     The suffix (if provided) indicates the units, with the following
     convention:
 
+        'ms' : milliseconds
         's' : seconds
         'm' : minutes
         'h' : hours
 
     If not provided, units are defaulted to seconds.
 
-    :returns: the corresponding number of seconds. If the parameter is None or an empty string, 0 is return.
+    :returns: the corresponding number of seconds, as a float for millisecond
+        periods (ex: "250ms" -> 0.25). If the parameter is None or an empty string, 0 is return.
     :raises ValueError: if input string is not valid
     """
     if not s:
@@ -104,6 +106,8 @@ def parse_period(s):
         unit = m.group(2)
         if unit in ('', 's'):
             period = value
+        elif unit == 'ms':
+            period = value / 1000.
         elif unit == 'm':
             period = value * 60
         elif unit == 'h':
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Unit tests of the aggregation of the output values."""
+
+import unittest
+
+from pycstbox.hal.aggregation import (
+    Aggregator, make_aggregator, AGGREGATE_MEAN, AGGREGATE_MIN, AGGREGATE_MAX, AGGREGATE_LAST
+)
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+
+def run_aggregator(aggregator, values, period=1.):
+    """ Feeds an aggregator with values read at a regular period.
+
+    :returns: the produced (time, aggregate) pairs
+    """
+    results = []
+    for i, value in enumerate(values):
+        now = i * period
+        result = aggregator.add(value, now)
+        if result is not None:
+            results.append((now, result))
+    return results
+
+
+class MakeAggregatorTestCase(unittest.TestCase):
+    def test_count_window(self):
+        aggregator = make_aggregator('mean:10')
+        self.assertEqual((aggregator.function, aggregator.size, aggregator.duration), (AGGREGATE_MEAN, 10, 0))
+
+    def test_duration_window(self):
+        aggregator = make_aggregator(' max : 5m ')
+        self.assertEqual((aggregator.function, aggregator.size, aggregator.duration), (AGGREGATE_MAX, 0, 300))
+
+    def test_invalid(self):
+        for spec in ('median:10', 'mean:0', 'mean:', 'mean:xx', 'mean'):
+            self.assertRaises(ValueError, make_aggregator, spec)
+
+
+class CountWindowTestCase(unittest.TestCase):
+    VALUES = [1, 5, 3, 2, 8, 4, 7]
+
+    def test_functions(self):
+        for function, expected in (
+            (AGGREGATE_MEAN, [3, 14 / 3.]),
+            (AGGREGATE_MIN, [1, 2]),
+            (AGGREGATE_MAX, [5, 8]),
+            (AGGREGATE_LAST, [3, 4])
+        ):
+            results = run_aggregator(Aggregator(function, size=3), self.VALUES)
+            self.assertEqual([t for t, _ in results], [2, 5])
+            for (_, result), value in zip(results, expected):
+                self.assertAlmostEqual(result, value)
+
+    def test_stats(self):
+        aggregator = Aggregator(AGGREGATE_MEAN, size=3)
+        run_aggregator(aggregator, self.VALUES)
+        self.assertEqual(aggregator.as_dict(), {
+            'function': AGGREGATE_MEAN, 'window': 3, 'samples': 7, 'windows': 2, 'ratio': 3.5
+        })
+
+
+class DurationWindowTestCase(unittest.TestCase):
+    def test_aligned_windows(self):
+        aggregator = Aggregator(AGGREGATE_MEAN, duration=10.)
+        # the values of a window are aggregated when the first value of the next one is read
+        results = [(now, aggregator.add(value, now)) for now, value in (
+            (3., 1), (8., 3), (12., 10), (19., 20), (21., 0)
+        )]
+        self.assertEqual(results, [(3., None), (8., None), (12., 2.), (19., None), (21., 15.)])
+
+    def test_empty_windows(self):
+        aggregator = Aggregator(AGGREGATE_LAST, duration=10.)
+        self.assertIsNone(aggregator.add(1, 5.))
+        # no aggregate is produced for the windows without values
+        self.assertEqual(aggregator.add(2, 45.), 1)
+        self.assertEqual(aggregator.add(3, 51.), 2)
+        self.assertEqual(aggregator.windows, 2)
+
+    def test_reduction_ratio(self):
+        aggregator = Aggregator(AGGREGATE_MAX, duration=5.)
+        run_aggregator(aggregator, range(21))
+        self.assertEqual(aggregator.windows, 4)
+        self.assertAlmostEqual(aggregator.reduction_ratio, 21 / 4.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Unit tests of the events creation of the devices."""
+
+import random
+import unittest
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pycstbox.devcfg import Device
+from pycstbox.hal import EventDataDef
+from pycstbox.hal.device import PolledDevice
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+OUTPUTS = ('temp', 'hum', 'power')
+Outputs = namedtuple('Outputs', OUTPUTS)
+
+
+class Values(object):
+    """ Output values which are not a named tuple, and are thus accessed by name."""
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+class TestDevice(PolledDevice):
+    _OUTPUTS_TO_EVENTS_MAPPING = {
+        'temp': EventDataDef('temperature', 'degC'),
+        'hum': EventDataDef('humidity', '%RH'),
+        'power': EventDataDef('power', 'W')
+    }
+    array_outputs = OUTPUTS
+
+    def __init__(self, outputs=None, **settings):
+        """
+        :param dict outputs: the settings of the outputs, by output name
+        :param settings: additional settings of the device configuration
+        """
+        outputs = outputs or {name: {} for name in OUTPUTS}
+        cfg = Device(
+            'd1', address='1', location='test', enabled=True, events_ttl='1h',
+            outputs={name: dict({'enabled': True, 'varname': name}, **s) for name, s in outputs.iteritems()},
+            **settings
+        )
+        super(TestDevice, self).__init__(None, cfg)
+        self.now = 0.
+        self.clock = lambda: self.now
+
+
+def notified(events):
+    """ Returns the notified values, by variable name."""
+    return {e.var_name: e.data['value'] for e in events}
+
+
+class OutputsPlanTestCase(unittest.TestCase):
+    def test_changes(self):
+        dev = TestDevice({'temp': {'prec': 1}, 'hum': {'prec': 0}})
+        self.assertEqual(notified(dev.create_events(Outputs(20.04, 50.2, 0))), {'temp': 20, 'hum': 50})
+        self.assertEqual(notified(dev.create_events(Outputs(20.01, 50.4, 0))), {})
+        self.assertEqual(notified(dev.create_events(Outputs(20.16, 50.4, 0))), {'temp': 20.2})
+        # outputs without value are ignored
+        self.assertEqual(notified(dev.create_events(Outputs(None, 52, 0))), {'hum': 52})
+
+    def test_events(self):
+        events = TestDevice().create_events(Outputs(20, 50, 1000))
+        event = [e for e in events if e.var_name == 'temp'][0]
+        self.assertEqual((event.var_type, event.data), ('temperature', {'value': 20, 'unit': 'degC'}))
+
+    def test_disabled_output(self):
+        dev = TestDevice({'temp': {}, 'hum': {'enabled': False}, 'power': {}})
+        self.assertEqual(set(notified(dev.create_events(Outputs(20, 50, 1000)))), {'temp', 'power'})
+        self.assertEqual(sorted(dev.get_outputs_plan().names), ['power', 'temp'])
+
+    def test_delta_min(self):
+        dev = TestDevice({'temp': {'prec': 1, 'delta_min': 0.5}})
+        values = [20, 20.3, 20.5, 20.6, 19.9]
+        self.assertEqual([notified(dev.create_events(Values(temp=v))).get('temp') for v in values],
+                         [20, None, None, 20.6, 19.9])
+
+    def test_events_ttl(self):
+        dev = TestDevice()
+        dev.create_events(Outputs(20, 50, 1000))
+        dev.now = 1800
+        self.assertEqual(dev.create_events(Outputs(20, 50, 1000)), [])
+        dev.now = 3600
+        self.assertEqual(notified(dev.create_events(Outputs(20, 50, 1000))), {'temp': 20, 'hum': 50, 'power': 1000})
+        # the unchanged values are not notified again if the coordinator takes care of it
+        dev.ttl_refresh = False
+        dev.now = 7200
+        self.assertEqual(dev.create_events(Outputs(20, 50, 1000)), [])
+
+    def test_values_type_change(self):
+        dev = TestDevice()
+        dev.create_events(Outputs(20, 50, 1000))
+        # the plan is bound again, keeping the notification state
+        self.assertEqual(notified(dev.create_events(Values(temp=21, hum=50, power=1000))), {'temp': 21})
+        self.assertEqual(notified(dev.create_events(Outputs(21, 50, 1001))), {'power': 1001})
+
+    def test_missing_output(self):
+        self.assertRaises(AttributeError, TestDevice().create_events, Values(temp=20))
+
+    def test_inherit_state(self):
+        old = TestDevice({'temp': {'prec': 1}, 'hum': {}})
+        old.create_events(Outputs(20, 50, 1000))
+        dev = TestDevice({'temp': {'prec': 1}, 'hum': {}, 'power': {}})
+        dev.inherit_outputs_state(old)
+        # unchanged values are not notified again, and the new outputs are
+        self.assertEqual(notified(dev.create_events(Outputs(20, 51, 1000))), {'hum': 51, 'power': 1000})
+        state = dev.get_outputs_plan().get_state()
+        self.assertEqual(state['temp'], (20, 0))
+
+
+@unittest.skipIf(numpy is None, 'NumPy not available')
+class VectorizedPlanTestCase(unittest.TestCase):
+    OUTPUTS_SETTINGS = {'temp': {'prec': 1}, 'hum': {'prec': 2, 'delta_min': 0.5}, 'power': {'prec': 0}}
+
+    def setUp(self):
+        # the same device, read as arrays and as named tuples
+        self.vector = TestDevice(self.OUTPUTS_SETTINGS)
+        self.scalar = TestDevice(self.OUTPUTS_SETTINGS)
+
+    def assertSameEvents(self, values, now=0.):
+        self.vector.now = self.scalar.now = now
+        events = self.vector.create_events(numpy.array(values, dtype=float))
+        expected = self.scalar.create_events(Outputs(*values))
+        self.assertEqual(notified(events), notified(expected), 'values : %s' % (values,))
+        self.assertEqual([e.data for e in events], [e.data for e in expected])
+
+    def test_vectorized(self):
+        self.vector.create_events(numpy.array([20., 50., 1000.]))
+        self.assertTrue(self.vector.get_outputs_plan().vectorized)
+
+    def test_half_way_values(self):
+        for value in (0.15, 0.35, 2.675, 1.005, -0.15, 0.25, -2.5, 0.5, 1.5, 1234.5, 0.45, 0.05):
+            for scale in (1, 10, 0.1):
+                # each value is compared with a different previous one
+                self.assertSameEvents([0., 0., 0.])
+                self.assertSameEvents([value * scale] * 3)
+
+    def test_random_values(self):
+        rnd = random.Random(0)
+        for i in range(500):
+            self.assertSameEvents([rnd.uniform(-100, 100) for _ in OUTPUTS], now=i * 60.)
+
+    def test_missing_values(self):
+        self.assertSameEvents([20., 50., 1000.])
+        self.vector.now = self.scalar.now = 3600.
+        events = self.vector.create_events(numpy.array([float('nan'), 51., float('nan')]))
+        self.assertEqual(notified(events), notified(self.scalar.create_events(Outputs(None, 51., None))))
+
+    def test_events_ttl(self):
+        for now in (0, 1800, 3600, 3700, 7200):
+            self.assertSameEvents([20., 50., 1000.], now=now)
+
+    def test_state(self):
+        self.assertSameEvents([20., 50., 1000.])
+        self.vector.create_events(Outputs(20., 50.3, 1000.))
+        # the state is kept when the type of the values changes
+        self.assertEqual(self.vector.get_outputs_plan().get_state(), self.scalar.get_outputs_plan().get_state())
+
+
+if __name__ == '__main__':
+    unittest.main()
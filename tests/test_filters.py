@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Unit tests of the output filters."""
+
+import unittest
+
+from pycstbox.hal.filters import (
+    make_filter, Deadband, PercentDeadband, Hysteresis, IntegratingDeadband, SwingingDoor
+)
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+
+def run_filter(output_filter, values, period=1.):
+    """ Feeds a filter with values read at a regular period, as the events creation does.
+
+    :returns: the notified (time, value) pairs
+    """
+    notified = []
+    prev = prev_time = None
+    for i, value in enumerate(values):
+        now = i * period
+        result = output_filter.update(value, now, prev, prev_time)
+        if result is not None:
+            notified.append((now, result))
+            prev, prev_time = result, now
+    return notified
+
+
+class MakeFilterTestCase(unittest.TestCase):
+    def test_types(self):
+        for spec, cls in (
+            ('deadband:0.5', Deadband),
+            ('percent:5', PercentDeadband),
+            ('hysteresis:1,3', Hysteresis),
+            ('integrating:10', IntegratingDeadband),
+            ('swinging_door:0.1', SwingingDoor)
+        ):
+            self.assertIsInstance(make_filter(spec), cls)
+
+    def test_parameters(self):
+        f = make_filter('percent: 5, 0.2')
+        self.assertAlmostEqual(f.ratio, 0.05)
+        self.assertEqual(f.delta, 0.2)
+        f = make_filter('hysteresis:1')
+        self.assertEqual((f.delta, f.reversal), (1, 2))
+
+    def test_invalid(self):
+        for spec in ('foo:1', 'deadband:x', 'deadband:', 'deadband:1,2,3', ''):
+            self.assertRaises(ValueError, make_filter, spec)
+
+
+class DeadbandTestCase(unittest.TestCase):
+    def test_filter(self):
+        notified = run_filter(Deadband(1.), [10, 10.5, 11, 11.2, 9.9, 9.9, 12])
+        self.assertEqual([v for _, v in notified], [10, 11.2, 9.9, 12])
+
+    def test_stats(self):
+        f = Deadband(1.)
+        run_filter(f, [10, 10, 10, 20])
+        self.assertEqual((f.samples, f.notified), (4, 2))
+        self.assertEqual(f.as_dict(), {'type': 'deadband', 'samples': 4, 'notified': 2, 'ratio': 2.})
+
+
+class PercentDeadbandTestCase(unittest.TestCase):
+    def test_filter(self):
+        notified = run_filter(PercentDeadband(10), [100, 109, 111, 120, 135])
+        self.assertEqual([v for _, v in notified], [100, 111, 135])
+
+    def test_minimum_delta(self):
+        notified = run_filter(PercentDeadband(10, 0.5), [0, 0.3, 0.6, 0.7])
+        self.assertEqual([v for _, v in notified], [0, 0.6])
+
+
+class HysteresisTestCase(unittest.TestCase):
+    def test_oscillation(self):
+        # the reversals under 3 are ignored once the signal has started to rise
+        notified = run_filter(Hysteresis(1, 3), [10, 12, 10, 12, 10, 8, 14])
+        self.assertEqual([v for _, v in notified], [10, 12, 8, 14])
+
+    def test_same_direction(self):
+        notified = run_filter(Hysteresis(1, 3), [10, 11.5, 13, 14.5])
+        self.assertEqual([v for _, v in notified], [10, 11.5, 13, 14.5])
+
+
+class IntegratingDeadbandTestCase(unittest.TestCase):
+    def test_lasting_deviation(self):
+        # a deviation of 1 is notified after it has lasted for more than 5 s
+        notified = run_filter(IntegratingDeadband(5), [10] + [11] * 10)
+        self.assertEqual(notified, [(0, 10), (6, 11)])
+
+    def test_transient(self):
+        notified = run_filter(IntegratingDeadband(5), [10, 12, 10, 10, 10, 10])
+        self.assertEqual(notified, [(0, 10)])
+
+
+class SwingingDoorTestCase(unittest.TestCase):
+    def test_linear(self):
+        # a ramp fits in a single segment, which end is not known yet
+        notified = run_filter(SwingingDoor(0.1), [float(i) for i in range(10)])
+        self.assertEqual(notified, [(0, 0.)])
+
+    def test_break(self):
+        notified = run_filter(SwingingDoor(0.1), [0., 1., 2., 3., 3., 3., 3.])
+        # the end of the ramp is notified when the value read after it breaks the door
+        self.assertEqual(notified, [(0, 0.), (4, 3.)])
+
+    def test_error_bound(self):
+        values = [0., 0.05, -0.05, 0.05, 0., 1.]
+        notified = run_filter(SwingingDoor(0.1), values)
+        self.assertEqual(notified, [(0, 0.), (5, 0.)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Unit tests of the variables keep-alive."""
+
+import json
+import unittest
+
+from pycstbox.hal.heartbeat import Heartbeat, ALIVE_VAR_TYPE
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.
+
+    def __call__(self):
+        return self.now
+
+
+class HeartbeatTestCase(unittest.TestCase):
+    TTL = 100.
+
+    def setUp(self):
+        self.clock = Clock()
+        self.emitted = []
+
+    def make_heartbeat(self, batch=False):
+        heartbeat = Heartbeat('c1', lambda *event: self.emitted.append(event), batch=batch, clock=self.clock)
+        heartbeat.set_variables({'v%d' % i: self.TTL for i in range(5)})
+        return heartbeat
+
+    def notify_all(self, heartbeat):
+        for i in range(5):
+            heartbeat.notified('temperature', 'v%d' % i, '{"value": %d}' % i)
+
+    def test_deadlines(self):
+        heartbeat = self.make_heartbeat()
+        self.notify_all(heartbeat)
+
+        # nothing is refreshed before the first half of the time to live
+        self.clock.now += self.TTL * Heartbeat.SPREAD
+        self.assertEqual(heartbeat.refresh(), 0)
+        # everything is refreshed before its expiration
+        self.clock.now += self.TTL * Heartbeat.SPREAD
+        self.assertEqual(heartbeat.refresh(), 5)
+        self.assertEqual(
+            sorted(self.emitted),
+            [('temperature', 'v%d' % i, '{"value": %d}' % i) for i in range(5)]
+        )
+
+    def test_spread(self):
+        heartbeat = self.make_heartbeat()
+        self.notify_all(heartbeat)
+        counts = []
+        for _ in range(20):
+            self.clock.now += self.TTL / 20
+            counts.append(heartbeat.refresh())
+        self.assertEqual(counts[:9], [0] * 9)
+        self.assertEqual(sum(counts), 5)
+        # the variables notified together are not all refreshed together
+        self.assertLess(max(counts), 5)
+
+    def test_notification_postpones(self):
+        heartbeat = self.make_heartbeat()
+        self.notify_all(heartbeat)
+        self.clock.now += self.TTL * 0.9
+        self.notify_all(heartbeat)
+        self.clock.now += self.TTL * 0.4
+        self.assertEqual(heartbeat.refresh(), 0)
+
+    def test_rescheduled(self):
+        heartbeat = self.make_heartbeat()
+        self.notify_all(heartbeat)
+        self.clock.now += self.TTL
+        self.assertEqual(heartbeat.refresh(), 5)
+        self.clock.now += self.TTL
+        self.assertEqual(heartbeat.refresh(), 5)
+        self.assertEqual(heartbeat.get_stats()['refreshes'], 10)
+
+    def test_unknown_variables(self):
+        heartbeat = self.make_heartbeat()
+        heartbeat.notified('temperature', 'foo', '{}')
+        self.notify_all(heartbeat)
+        heartbeat.set_variables({'v0': self.TTL})
+        stats = heartbeat.get_stats()
+        self.assertEqual((stats['variables'], stats['tracked']), (1, 1))
+        self.clock.now += self.TTL
+        self.assertEqual(heartbeat.refresh(), 1)
+        self.assertEqual(self.emitted, [('temperature', 'v0', '{"value": 0}')])
+
+    def test_batch(self):
+        heartbeat = self.make_heartbeat(batch=True)
+        self.notify_all(heartbeat)
+        self.clock.now += self.TTL
+        self.assertEqual(heartbeat.refresh(), 5)
+        self.assertEqual(len(self.emitted), 1)
+        var_type, var_name, data = self.emitted[0]
+        self.assertEqual((var_type, var_name), (ALIVE_VAR_TYPE, 'c1'))
+        self.assertEqual(sorted(json.loads(data)['vars']), ['v%d' % i for i in range(5)])
+
+    def test_batch_size(self):
+        heartbeat = self.make_heartbeat(batch=True)
+        heartbeat.MAX_BATCH = 2
+        self.notify_all(heartbeat)
+        self.clock.now += self.TTL
+        heartbeat.refresh()
+        self.assertEqual([len(json.loads(e[2])['vars']) for e in self.emitted], [2, 2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
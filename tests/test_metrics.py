@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Unit tests of the polling metrics."""
+
+import json
+import unittest
+
+from pycstbox.hal.metrics import Histogram
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+
+class HistogramTestCase(unittest.TestCase):
+    def setUp(self):
+        self.histogram = Histogram()
+        for value in (0.0005, 0.001, 0.003, 0.004, 0.015, 0.3, 45.):
+            self.histogram.add(value)
+
+    def test_buckets(self):
+        counts = self.histogram.counts
+        self.assertEqual(counts[0], 2)
+        self.assertEqual(counts[Histogram.BOUNDS.index(0.005)], 2)
+        self.assertEqual(counts[-1], 1)
+        self.assertEqual(sum(counts), 7)
+        self.assertEqual((self.histogram.count, self.histogram.max), (7, 45.))
+        self.assertAlmostEqual(self.histogram.mean, 45.3235 / 7)
+
+    def test_percentile(self):
+        self.assertEqual(Histogram().percentile(95), 0.)
+        self.assertEqual(self.histogram.percentile(25), 0.001)
+        self.assertEqual(self.histogram.percentile(50), 0.005)
+        self.assertEqual(self.histogram.percentile(100), 45.)
+
+    def test_merge(self):
+        other = Histogram()
+        other.add(0.5)
+        other.add(60.)
+        self.histogram.merge(other)
+        self.assertEqual((self.histogram.count, self.histogram.max), (9, 60.))
+        self.assertEqual(self.histogram.counts[-1], 2)
+
+    def test_snapshot(self):
+        d = self.histogram.as_dict()
+        saved = json.dumps(d)
+        # the snapshot is not altered by the values added after it is taken
+        self.histogram.add(0.001)
+        self.assertEqual(json.dumps(d), saved)
+
+    def test_round_trip(self):
+        restored = Histogram.from_dict(json.loads(json.dumps(self.histogram.as_dict())))
+        self.assertEqual(restored.counts, self.histogram.counts)
+        self.assertEqual((restored.count, restored.sum, restored.max),
+                         (self.histogram.count, self.histogram.sum, self.histogram.max))
+
+    def test_changed_buckets(self):
+        d = self.histogram.as_dict()
+        d['counts'] = d['counts'][:-1]
+        restored = Histogram.from_dict(d)
+        self.assertEqual((restored.count, sum(restored.counts)), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
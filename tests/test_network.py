@@ -0,0 +1,819 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Unit tests of the devices polling engine.
+
+The polls are executed in real time, with periods short enough for keeping the tests fast.
+"""
+
+import json
+import logging
+import multiprocessing
+import threading
+import time
+import unittest
+from collections import namedtuple
+
+from pycstbox.devcfg import Coordinator, Device
+from pycstbox.hal import EventDataDef, HalError
+from pycstbox.hal.device import PolledDevice, CommunicationError, PollTimeoutError
+from pycstbox.hal.drivers import get_hal_device_classes
+from pycstbox.hal.network import (
+    CoordinatorServiceObject, DetachableCoordinatorServiceObject, _PollingThread, _PollSupervisor, _run_worker,
+    PollTask, DeviceListEntry, DeviceNetworkError, DFLT_POLL_PERIOD, DFLT_BACKOFF_MAX
+)
+from pycstbox.hal.scheduler import AdaptivePeriod, CircuitBreaker, PHASING_NONE, PRIORITY_HIGH, PRIORITY_LOW
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+Outputs = namedtuple('Outputs', 'value')
+
+
+class HwDevice(object):
+    """ Low level interface of a test device, which reads are done by a given function."""
+    def __init__(self, read=None, latency=0.):
+        self._read = read
+        self.latency = latency
+        self.terminate = False
+        self.poll_req_interval = 0
+        self.polls = 0
+        self.controls = []
+        self.control_error = None
+        self._lock = threading.Lock()
+
+    def poll(self):
+        with self._lock:
+            self.polls += 1
+            count = self.polls
+        if self.latency:
+            time.sleep(self.latency)
+        return self._read(count) if self._read else Outputs(count)
+
+    def set_control(self, control, value):
+        if self.control_error:
+            raise self.control_error
+        self.controls.append((control, value))
+
+
+class TestDevice(PolledDevice):
+    _OUTPUTS_TO_EVENTS_MAPPING = {'value': EventDataDef('temperature', 'degC')}
+
+    def __init__(self, coord_cfg, dev_cfg, hwdev):
+        super(TestDevice, self).__init__(coord_cfg, dev_cfg)
+        self._hwdev = hwdev
+
+
+class BatchDevice(TestDevice):
+    """ Test device which can be read together with the other ones of its bus.
+
+    The sizes of the batched requests are recorded by the `requests` list, and the results of a request
+    are returned by the `read` function if set.
+    """
+    requests = None
+    read = None
+
+    def batch_key(self):
+        return 'batch'
+
+    def batch_poll(self, devices):
+        self.requests.append(len(devices))
+        if self.read:
+            return self.read(devices)
+        return [d._hwdev.poll() for d in devices]
+
+
+class ConfiguredDevice(TestDevice):
+    """ Test device created by the coordinator from its configuration, which creation fails
+    if it is configured as broken.
+    """
+    def __init__(self, coord_cfg, dev_cfg):
+        if getattr(dev_cfg, 'broken', False):
+            raise HalError('broken device')
+        super(ConfiguredDevice, self).__init__(coord_cfg, dev_cfg, HwDevice(latency=getattr(dev_cfg, 'latency', 0)))
+
+
+class WorkerCoordinator(DetachableCoordinatorServiceObject):
+    """ Coordinator of the test devices created from their configuration, run in a worker process."""
+    def __init__(self, cid):
+        get_hal_device_classes()['configured'] = ConfiguredDevice
+        super(WorkerCoordinator, self).__init__(cid)
+
+
+def make_device_cfg(dev_id, **settings):
+    """ Returns the configuration of a test device created by the coordinator."""
+    settings.setdefault('polling', '1s')
+    cfg = Device(
+        dev_id, address='1', location='test', enabled=True,
+        outputs={'value': {'enabled': True, 'varname': dev_id}}, **settings
+    )
+    cfg.type = 'test:configured'
+    return cfg
+
+
+def make_device(dev_id, hwdev, device_class=TestDevice, **settings):
+    """ Returns the device list entry of a test device.
+
+    :param str dev_id: the device id
+    :param HwDevice hwdev: the low level interface of the device
+    :param type device_class: the class of the device
+    :param settings: additional settings of the device configuration
+    """
+    cfg = Device(
+        dev_id, address='1', location='test', enabled=True,
+        outputs={'value': {'enabled': True, 'varname': dev_id, 'prec': 1}}, **settings
+    )
+    return DeviceListEntry(dev_id, cfg, device_class(None, cfg, hwdev))
+
+
+class FastBreaker(CircuitBreaker):
+    """ Circuit breaker with a short backoff, so that the failing devices are retried quickly."""
+    BACKOFF_MIN = 0.01
+    JITTER = 0
+
+
+class Owner(object):
+    """ Stands for the coordinator owning the polling thread, and collects the emitted events."""
+    coordinator_id = 'test'
+    poll_req_interval = 0
+    bus_rate, bus_burst = 0, 1
+
+    def __init__(self):
+        self.events = []
+
+    def emit_event(self, var_type, var_name, data):
+        self.events.append((var_type, var_name, data))
+
+    @staticmethod
+    def batch_poll(devices):
+        haldevs = [d.haldev for d in devices]
+        return haldevs[0].batch_poll(haldevs)
+
+
+def make_coordinator(**settings):
+    """ Returns a coordinator configured with the given settings."""
+    coordinator = CoordinatorServiceObject('c1')
+    coordinator.log_setLevel(logging.CRITICAL)
+    coordinator._cfg = Coordinator('c1', type='test', **settings)
+    coordinator._configure_coordinator(coordinator._cfg)
+    return coordinator
+
+
+class PollingThread(_PollingThread):
+    STATS_STORAGE_PATH = None
+
+
+class PollingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.owner = Owner()
+        self.thread = None
+
+    def tearDown(self):
+        if self.thread and self.thread.is_alive():
+            self.thread.terminate()
+            self.thread.join(2)
+
+    def run_polling(self, tasks, duration, **kwargs):
+        """ Polls the tasks for a given duration, and returns the stats of the devices."""
+        self.thread = PollingThread(self.owner, tasks, **kwargs)
+        self.thread.log_setLevel(logging.CRITICAL)
+        self.thread.start()
+        time.sleep(duration)
+        self.thread.terminate()
+        self.thread.join(2)
+        self.assertFalse(self.thread.is_alive())
+        return self.thread.get_stats()['devices']
+
+
+class WorkerPoolTestCase(PollingTestCase):
+    def test_unexpected_error_rescheduled(self):
+        def read(count):
+            raise RuntimeError('driver bug')
+
+        hwdev = HwDevice(read)
+        stats = self.run_polling(
+            [PollTask(make_device('d1', hwdev), 0.05, 'bus', breaker=FastBreaker())], 0.5, workers=2
+        )['d1']
+        self.assertGreater(stats['total_poll'], 2)
+        self.assertEqual(stats['unexp_errs'], stats['total_poll'])
+
+    def test_recovery_after_unexpected_error(self):
+        def read(count):
+            if count == 1:
+                raise RuntimeError('driver bug')
+            return Outputs(count)
+
+        stats = self.run_polling(
+            [PollTask(make_device('d1', HwDevice(read)), 0.05, 'bus', breaker=FastBreaker())], 0.3, workers=2
+        )['d1']
+        self.assertEqual((stats['unexp_errs'], stats['recovered']), (1, 1))
+        self.assertTrue(self.owner.events)
+
+    def test_buses_polled_concurrently(self):
+        hwdevs = [HwDevice(latency=0.1) for _ in range(4)]
+        tasks = [PollTask(make_device('d%d' % i, hw), 0.2, 'bus%d' % i) for i, hw in enumerate(hwdevs)]
+        start = time.time()
+        self.run_polling(tasks, 0.05, workers=4, phasing=PHASING_NONE)
+        # the four polls run in parallel, and are waited for by the termination
+        self.assertLess(time.time() - start, 0.3)
+        self.assertEqual([hw.polls for hw in hwdevs], [1] * 4)
+
+    def test_bus_serialized(self):
+        active = []
+        lock = threading.Lock()
+        overlaps = []
+
+        def read(count):
+            with lock:
+                active.append(1)
+                overlaps.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.pop()
+            return Outputs(count)
+
+        tasks = [PollTask(make_device('d%d' % i, HwDevice(read)), 0.05, 'bus') for i in range(4)]
+        self.run_polling(tasks, 0.3, workers=4, phasing=PHASING_NONE)
+        self.assertTrue(overlaps)
+        self.assertEqual(max(overlaps), 1)
+
+
+class BatchPollingTestCase(PollingTestCase):
+    def setUp(self):
+        super(BatchPollingTestCase, self).setUp()
+        self.requests = []
+
+    def batch_tasks(self, count, read=None):
+        tasks = []
+        for i in range(count):
+            dev = make_device('d%d' % i, HwDevice(), BatchDevice)
+            dev.haldev.requests, dev.haldev.read = self.requests, read
+            tasks.append(PollTask(dev, 0.05, 'bus', breaker=FastBreaker(), batch_key='batch'))
+        return tasks
+
+    def test_batched_reads(self):
+        tasks = self.batch_tasks(4)
+        stats = self.run_polling(tasks, 0.3, phasing=PHASING_NONE)
+        self.assertTrue(self.requests)
+        self.assertEqual(set(self.requests), {4})
+        for i, task in enumerate(tasks):
+            self.assertEqual(stats['d%d' % i]['total_poll'], len(self.requests))
+            self.assertEqual(task.dev.haldev._hwdev.polls, len(self.requests))
+        self.assertEqual(set(e[1] for e in self.owner.events), {'d0', 'd1', 'd2', 'd3'})
+
+    def test_device_error(self):
+        def read(devices):
+            return [IOError('no reply') if d is failing else d._hwdev.poll() for d in devices]
+
+        tasks = self.batch_tasks(3, read)
+        failing = tasks[1].dev.haldev
+        stats = self.run_polling(tasks, 0.3, phasing=PHASING_NONE)
+        # only the failed device is affected
+        self.assertGreater(stats['d1']['comm_errs'], 0)
+        self.assertGreater(stats['d1']['total_poll'], 1)
+        for dev_id in ('d0', 'd2'):
+            self.assertEqual(stats[dev_id]['comm_errs'], 0)
+            self.assertGreater(stats[dev_id]['total_poll'], 1)
+
+    def test_request_failure(self):
+        def read(devices):
+            raise IOError('bus error')
+
+        stats = self.run_polling(self.batch_tasks(3, read), 0.3, phasing=PHASING_NONE)
+        for dev_stats in (stats['d%d' % i] for i in range(3)):
+            self.assertGreater(dev_stats['total_poll'], 1)
+            self.assertGreater(dev_stats['comm_errs'], 0)
+
+    def test_unexpected_error_rescheduled(self):
+        def read(devices):
+            raise RuntimeError('driver bug')
+
+        stats = self.run_polling(self.batch_tasks(3, read), 0.3, workers=2, phasing=PHASING_NONE)
+        for dev_stats in (stats['d%d' % i] for i in range(3)):
+            self.assertGreater(dev_stats['total_poll'], 1)
+            self.assertGreater(dev_stats['unexp_errs'], 0)
+
+    def test_not_supported(self):
+        def read(devices):
+            raise NotImplementedError()
+
+        tasks = self.batch_tasks(3, read)
+        stats = self.run_polling(tasks, 0.3, phasing=PHASING_NONE)
+        # the devices are polled one by one once the batched reads have failed
+        self.assertEqual(len(self.requests), 1)
+        for task in tasks:
+            self.assertIsNone(task.batch_key)
+            self.assertGreater(stats[task.dev.id_]['total_poll'], 1)
+            self.assertEqual(stats[task.dev.id_]['total_poll'], task.dev.haldev._hwdev.polls)
+
+
+class SupervisorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.supervisor = _PollSupervisor('test')
+        self.supervisor.log_setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        self.supervisor.terminate()
+
+    def test_completed(self):
+        for i in range(3):
+            self.assertEqual(self.supervisor.call('d1', lambda: i, 1), i)
+        # the idle worker is reused
+        self.assertEqual(self.supervisor._created, 1)
+
+    def test_error(self):
+        def fail():
+            raise CommunicationError('d1', IOError('no reply'))
+
+        self.assertRaises(CommunicationError, self.supervisor.call, 'd1', fail, 1)
+        self.assertEqual(self.supervisor.call('d1', lambda: 1, 1), 1)
+
+    def test_timeout(self):
+        self.assertRaises(PollTimeoutError, self.supervisor.call, 'd1', lambda: time.sleep(0.2), 0.01)
+        # the hung worker is abandoned, and replaced for the next poll
+        self.assertEqual(self.supervisor.call('d1', lambda: 1, 1), 1)
+        self.assertEqual((self.supervisor._created, self.supervisor._abandoned), (2, 1))
+
+
+class PollTimeoutTestCase(PollingTestCase):
+    def test_hung_device_isolated(self):
+        tasks = [
+            PollTask(make_device('hung', HwDevice(latency=1)), 0.05, 'bus', breaker=FastBreaker(), timeout=0.02),
+            PollTask(make_device('d1', HwDevice()), 0.05, 'bus', timeout=0.02)
+        ]
+        stats = self.run_polling(tasks, 0.3)
+        self.assertGreater(stats['hung']['timeouts'], 1)
+        self.assertEqual(stats['hung']['timeouts'], stats['hung']['total_poll'])
+        # the other device of the bus is still polled at its pace
+        self.assertGreaterEqual(stats['d1']['total_poll'], 4)
+        self.assertEqual(stats['d1']['timeouts'], 0)
+
+    def test_late_result_dropped(self):
+        hwdev = HwDevice(latency=0.05)
+        self.run_polling(
+            [PollTask(make_device('d1', hwdev), 0.1, 'bus', breaker=FastBreaker(), timeout=0.01)], 0.3
+        )
+        # the device replied, but too late for its outputs to be processed
+        time.sleep(0.1)
+        self.assertGreater(hwdev.polls, 0)
+        self.assertEqual(self.owner.events, [])
+
+
+class CircuitBreakerPollingTestCase(PollingTestCase):
+    def test_failing_device_backed_off(self):
+        def read(count):
+            raise CommunicationError('failing', 'no reply')
+
+        tasks = [
+            PollTask(make_device('failing', HwDevice(read)), 0.05, 'bus', breaker=FastBreaker()),
+            PollTask(make_device('healthy', HwDevice()), 0.05, 'bus', breaker=FastBreaker())
+        ]
+        stats = self.run_polling(tasks, 0.6, phasing=PHASING_NONE)
+        failing, healthy = stats['failing'], stats['healthy']
+        self.assertEqual(failing['comm_errs'], failing['total_poll'])
+        self.assertEqual((failing['circuit'], failing['trips']), ('open', 1))
+        self.assertLess(failing['total_poll'], healthy['total_poll'] / 2)
+        self.assertEqual((healthy['comm_errs'], healthy['trips']), (0, 0))
+
+    def test_recovery(self):
+        def read(count):
+            if count <= 3:
+                raise CommunicationError('d1', 'no reply')
+            return Outputs(count)
+
+        stats = self.run_polling(
+            [PollTask(make_device('d1', HwDevice(read)), 0.05, 'bus', breaker=FastBreaker())], 0.8
+        )['d1']
+        self.assertEqual((stats['comm_errs'], stats['recovered']), (3, 1))
+        self.assertEqual((stats['circuit'], stats['trips']), ('closed', 1))
+
+
+class AdaptivePollingTestCase(PollingTestCase):
+    def test_changing_values(self):
+        task = PollTask(make_device('d1', HwDevice()), 0.2, 'bus', adaptive=AdaptivePeriod(0.02, 0.2, 0.2))
+        self.run_polling([task], 0.4, phasing=PHASING_NONE)
+        self.assertEqual(task.period, 0.02)
+
+    def test_stable_values(self):
+        hwdev = HwDevice(lambda count: Outputs(1))
+        task = PollTask(make_device('d1', hwdev), 0.02, 'bus', adaptive=AdaptivePeriod(0.02, 0.05, 0.02))
+        self.run_polling([task], 0.3, phasing=PHASING_NONE)
+        self.assertEqual(task.period, 0.05)
+
+
+class PriorityTestCase(PollingTestCase):
+    def test_oversubscribed_bus(self):
+        # the bus can only serve half of the planned polls
+        tasks = [
+            PollTask(make_device('low%d' % i, HwDevice(latency=0.01)), 0.02, 'bus', priority=PRIORITY_LOW)
+            for i in range(3)
+        ]
+        tasks.append(PollTask(make_device('high', HwDevice(latency=0.01)), 0.02, 'bus', priority=PRIORITY_HIGH))
+        stats = self.run_polling(tasks, 0.5, phasing=PHASING_NONE)
+        high = stats.pop('high')
+        # the high priority device gets its polls, the slip being taken by the low priority ones
+        for low in stats.values():
+            self.assertGreater(2 * high['total_poll'], 3 * low['total_poll'])
+            self.assertGreater(low['missed'], high['missed'])
+
+    def test_missed_deadlines(self):
+        stats = self.run_polling([PollTask(make_device('d1', HwDevice(latency=0.1)), 0.03, 'bus')], 0.35)['d1']
+        # each poll lasts for more than 3 periods, which are skipped instead of being caught up
+        self.assertGreaterEqual(stats['missed'], 2 * stats['total_poll'])
+        self.assertLessEqual(stats['total_poll'], 4)
+
+
+class PollingStatsTestCase(PollingTestCase):
+    def test_device_stats(self):
+        hwdev = HwDevice(latency=0.01)
+        stats = self.run_polling([PollTask(make_device('d1', hwdev), 0.05, 'bus')], 0.3)['d1']
+        self.assertEqual(stats['total_poll'], hwdev.polls)
+        # the events of the last poll are not emitted if the termination is requested meanwhile
+        self.assertIn(stats['events'] - len(self.owner.events), (0, 1))
+        self.assertEqual(stats['latency']['count'], stats['total_poll'])
+        self.assertGreaterEqual(stats['latency']['max'], 0.01)
+        self.assertEqual(stats['lag']['count'], stats['total_poll'])
+
+    def test_snapshot(self):
+        self.run_polling([PollTask(make_device('d1', HwDevice()), 0.05, 'bus')], 0.1)
+        stats = self.thread.get_stats()
+        saved = json.dumps(stats)
+        # the snapshot is not altered by the polls done after it is taken
+        self.thread._dev_stats['d1'].latency.add(0.001)
+        self.assertEqual(json.dumps(stats), saved)
+
+
+class ConfigurationTestCase(unittest.TestCase):
+    def test_poll_workers(self):
+        self.assertEqual(make_coordinator()._poll_workers, 0)
+        self.assertEqual(make_coordinator(poll_workers=4)._poll_workers, 4)
+        self.assertEqual(make_coordinator(poll_workers='4')._poll_workers, 4)
+        for invalid in ('foo', -1, None):
+            self.assertEqual(make_coordinator(poll_workers=invalid)._poll_workers, 0)
+
+    def test_bus_pacing(self):
+        coordinator = make_coordinator()
+        self.assertEqual((coordinator._bus_rate, coordinator._bus_burst), (0, 1))
+        coordinator = make_coordinator(bus_rate='2.5', bus_burst='4')
+        self.assertEqual((coordinator._bus_rate, coordinator._bus_burst), (2.5, 4))
+        for invalid in ('foo', -1, 'inf', 'nan', None):
+            coordinator = make_coordinator(bus_rate=invalid, bus_burst=invalid)
+            self.assertEqual((coordinator._bus_rate, coordinator._bus_burst), (0, 1))
+
+    def test_default_bus(self):
+        dev = make_device('d1', HwDevice())
+        self.assertEqual(make_coordinator()._create_poll_task(dev).bus, 'c1')
+        self.assertEqual(make_coordinator(poll_workers=2)._create_poll_task(dev).bus, 'd1')
+        self.assertEqual(make_coordinator(bus='line')._create_poll_task(dev).bus, 'line')
+        dev = make_device('d1', HwDevice(), bus='tcp')
+        self.assertEqual(make_coordinator(bus='line')._create_poll_task(dev).bus, 'tcp')
+
+    def test_replay_speed(self):
+        self.assertEqual(make_coordinator()._replay_speed, 1)
+        self.assertEqual(make_coordinator(replay_speed='10')._replay_speed, 10)
+        self.assertEqual(make_coordinator(replay_speed=0)._replay_speed, 0)
+        for invalid in ('foo', -1, 'inf', None):
+            self.assertEqual(make_coordinator(replay_speed=invalid)._replay_speed, 1)
+
+    def test_backoff_max(self):
+        self.assertEqual(make_coordinator()._backoff_max, DFLT_BACKOFF_MAX)
+        self.assertEqual(make_coordinator(backoff_max='10m')._backoff_max, 600)
+        self.assertEqual(make_coordinator(backoff_max=60)._backoff_max, 60)
+        for invalid in ('foo', 1.5, None):
+            self.assertEqual(make_coordinator(backoff_max=invalid)._backoff_max, DFLT_BACKOFF_MAX)
+
+    def test_polling_period(self):
+        coordinator = make_coordinator()
+        for polling, period in (('100ms', 0.1), ('2s', 2), ('0', DFLT_POLL_PERIOD), ('0s', DFLT_POLL_PERIOD),
+                                ('-5s', DFLT_POLL_PERIOD), ('foo', DFLT_POLL_PERIOD)):
+            task = coordinator._create_poll_task(make_device('d1', HwDevice(), polling=polling))
+            self.assertEqual(task.period, period)
+            self.assertIsNone(task.adaptive)
+
+    def test_adaptive_period(self):
+        coordinator = make_coordinator()
+        task = coordinator._create_poll_task(make_device('d1', HwDevice(), polling='10s', polling_min='1s'))
+        self.assertEqual((task.adaptive.min_period, task.adaptive.max_period, task.period), (1, 10, 10))
+        task = coordinator._create_poll_task(make_device('d1', HwDevice(), polling='10s', polling_min='1m'))
+        self.assertIsNone(task.adaptive)
+
+
+class ReconfigurationTestCase(unittest.TestCase):
+    def setUp(self):
+        get_hal_device_classes()['configured'] = ConfiguredDevice
+        self.coordinator = make_coordinator()
+        # the polling thread is not started, since only the tasks it holds are checked
+        self.thread = self.coordinator._polling_thread = PollingThread(self.coordinator, [])
+        self.thread.log_setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        del get_hal_device_classes()['configured']
+
+    def assertDeviceRemoved(self, dev_id):
+        self.assertNotIn(dev_id, self.coordinator._devices)
+        self.assertNotIn(dev_id, self.coordinator._cfg)
+        self.assertNotIn(dev_id, self.thread._tasks)
+
+    def test_add(self):
+        self.coordinator.update_device(make_device_cfg('d1'))
+        dev = self.coordinator._devices['d1']
+        self.assertIs(self.thread._tasks['d1'].dev, dev)
+        self.assertIn('d1', self.coordinator._cfg)
+
+    def test_update(self):
+        self.coordinator.update_device(make_device_cfg('d1'))
+        old = self.coordinator._devices['d1']
+        self.coordinator.update_device(make_device_cfg('d1', polling='2s'))
+        dev = self.coordinator._devices['d1']
+        self.assertIsNot(dev, old)
+        self.assertTrue(old.haldev._hwdev.terminate)
+        self.assertIs(self.thread._tasks['d1'].dev, dev)
+        self.assertEqual(self.thread._tasks['d1'].period, 2)
+
+    def test_update_failure(self):
+        self.coordinator.update_device(make_device_cfg('d1'))
+        self.coordinator.update_device(make_device_cfg('d2'))
+        old = self.coordinator._devices['d1']
+        self.coordinator.update_device(make_device_cfg('d1', broken=True))
+        # no stale entry is left for the device, the other ones being not affected
+        self.assertDeviceRemoved('d1')
+        self.assertTrue(old.haldev._hwdev.terminate)
+        self.assertIn('d2', self.thread._tasks)
+
+    def test_add_failure(self):
+        self.coordinator.update_device(make_device_cfg('d1', broken=True))
+        self.assertDeviceRemoved('d1')
+
+    def test_unknown_driver(self):
+        cfg = make_device_cfg('d1')
+        cfg.type = 'test:unknown'
+        self.coordinator.update_device(cfg)
+        self.assertDeviceRemoved('d1')
+
+    def test_disable(self):
+        self.coordinator.update_device(make_device_cfg('d1'))
+        cfg = make_device_cfg('d1')
+        cfg.enabled = False
+        self.coordinator.update_device(cfg)
+        self.assertDeviceRemoved('d1')
+
+    def test_remove(self):
+        self.coordinator.update_device(make_device_cfg('d1'))
+        self.coordinator.remove_device('d1')
+        self.assertDeviceRemoved('d1')
+        # removing an unknown device is harmless
+        self.coordinator.remove_device('d1')
+
+
+class EventManager(object):
+    """ Stands for the Event Manager of a coordinator."""
+    def __init__(self):
+        self.events = []
+
+    def emitEvent(self, var_type, var_name, data):  #pylint: disable=C0103
+        self.events.append((var_type, var_name, data))
+
+
+class OnDemandReadTestCase(unittest.TestCase):
+    def setUp(self):
+        get_hal_device_classes()['configured'] = ConfiguredDevice
+        self.coordinator = make_coordinator()
+        self.coordinator._evtmgr = EventManager()
+        self.thread = self.coordinator._polling_thread = PollingThread(self.coordinator, [])
+        self.thread.log_setLevel(logging.CRITICAL)
+        self.thread.start()
+        self.results = []
+        self.done = threading.Event()
+
+    def tearDown(self):
+        self.thread.terminate()
+        self.thread.join(2)
+        del get_hal_device_classes()['configured']
+
+    def add_device(self, dev_id, **settings):
+        """ Adds a device polled every 10s, and waits for its first poll."""
+        self.coordinator.update_device(make_device_cfg(dev_id, polling='10s', **settings))
+        haldev = self.coordinator._devices[dev_id].haldev
+        deadline = time.time() + 1
+        while haldev.last_read_time is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertIsNotNone(haldev.last_read_time)
+        return haldev._hwdev
+
+    def read(self, dev_id, max_age):
+        def callback(result, error=None):
+            self.results.append((result, error))
+            self.done.set()
+
+        self.coordinator.read_device(dev_id, max_age, callback)
+
+    def wait_results(self, count=1):
+        deadline = time.time() + 2
+        while len(self.results) < count and time.time() < deadline:
+            self.done.wait(0.05)
+        self.assertEqual(len(self.results), count)
+        return self.results
+
+    def test_fresh_outputs(self):
+        hwdev = self.add_device('d1')
+        self.read('d1', 60)
+        # the reply is immediate, and does not cost a poll
+        self.assertEqual(len(self.results), 1)
+        result, error = self.results[0]
+        self.assertIsNone(error)
+        self.assertEqual((result['device'], result['outputs']), ('d1', {'value': 1}))
+        self.assertEqual(hwdev.polls, 1)
+
+    def test_poll_on_demand(self):
+        hwdev = self.add_device('d1')
+        self.read('d1', 0)
+        result, error = self.wait_results()[0]
+        self.assertIsNone(error)
+        self.assertEqual(result['outputs'], {'value': 2})
+        self.assertLess(result['age'], 1)
+        self.assertEqual(hwdev.polls, 2)
+
+    def test_coalesced_requests(self):
+        hwdev = self.add_device('d1', latency=0.1)
+        for _ in range(3):
+            self.read('d1', 0)
+        # the requests are served by the same poll
+        for result, error in self.wait_results(3):
+            self.assertEqual(result['outputs'], {'value': 2})
+        self.assertEqual(hwdev.polls, 2)
+
+    def test_poll_error(self):
+        hwdev = self.add_device('d1')
+
+        def read(count):
+            raise IOError('no reply')
+
+        hwdev._read = read
+        self.read('d1', 0)
+        result, error = self.wait_results()[0]
+        self.assertIsNone(result)
+        self.assertTrue(error)
+
+    def test_unknown_device(self):
+        self.add_device('d1')
+        self.assertRaises(DeviceNetworkError, self.read, 'd2', 0)
+
+
+class CommandTestCase(unittest.TestCase):
+    def setUp(self):
+        get_hal_device_classes()['configured'] = ConfiguredDevice
+        self.coordinator = make_coordinator()
+        self.coordinator._evtmgr = EventManager()
+        self.thread = self.coordinator._polling_thread = PollingThread(self.coordinator, [])
+        self.thread.log_setLevel(logging.CRITICAL)
+        self.thread.start()
+
+    def tearDown(self):
+        self.thread.terminate()
+        self.thread.join(2)
+        del get_hal_device_classes()['configured']
+
+    def add_device(self, dev_id, var_name, **settings):
+        """ Adds a device which control is bound to a given variable, and waits for its first poll."""
+        self.coordinator.update_device(
+            make_device_cfg(dev_id, polling='10s', controls={'setpoint': {'varname': var_name}}, **settings)
+        )
+        hwdev = self.coordinator._devices[dev_id].haldev._hwdev
+        deadline = time.time() + 1
+        while not hwdev.polls and time.time() < deadline:
+            time.sleep(0.01)
+        return hwdev
+
+    def send(self, var_name, value):
+        self.coordinator._control_event(int(time.time() * 1000), 'temperature', var_name, json.dumps({'value': value}))
+
+    def wait_commands(self, count):
+        """ Waits for a given count of commands to be processed, and returns the commands stats."""
+        deadline = time.time() + 1
+        while time.time() < deadline:
+            stats = self.thread.get_stats()['commands']
+            if stats['applied'] + stats['failed'] >= count:
+                return stats
+            time.sleep(0.01)
+        self.fail('commands not processed')
+
+    def test_routing(self):
+        hwdev1 = self.add_device('d1', 'sp1')
+        hwdev2 = self.add_device('d2', 'sp2')
+        self.send('sp2', 19.5)
+        self.send('sp1', 21)
+        # commands on variables which are not controls, or without value are ignored
+        self.send('unknown', 0)
+        self.coordinator._control_event(0, 'temperature', 'sp1', '{}')
+        stats = self.wait_commands(2)
+        self.assertEqual((stats['received'], stats['applied']), (2, 2))
+        self.assertEqual(hwdev1.controls, [('setpoint', 21)])
+        self.assertEqual(hwdev2.controls, [('setpoint', 19.5)])
+        self.assertEqual(stats['latency']['count'], 2)
+
+    def test_duplicate_variable(self):
+        self.add_device('d1', 'sp')
+        self.add_device('d2', 'sp')
+        # the variable is routed to one of the devices only
+        controls = self.coordinator._controls
+        self.assertEqual(list(controls), ['sp'])
+        self.assertIn(controls['sp'], (('d1', 'setpoint'), ('d2', 'setpoint')))
+
+    def test_coalesced(self):
+        hwdev = self.add_device('d1', 'sp1', latency=0.2)
+        # the commands wait for the end of the first poll, and are collapsed to the latest one
+        for value in range(3):
+            self.send('sp1', value)
+        stats = self.wait_commands(1)
+        self.assertEqual((stats['received'], stats['coalesced'], stats['applied']), (3, 2, 1))
+        self.assertEqual(hwdev.controls, [('setpoint', 2)])
+
+    def test_failure(self):
+        hwdev = self.add_device('d1', 'sp1')
+        for count, error in enumerate((IOError('no reply'), RuntimeError('driver bug')), 1):
+            hwdev.control_error = error
+            self.send('sp1', 20)
+            self.assertEqual(self.wait_commands(count)['failed'], count)
+        # the failures do not stop the commands nor the polls
+        hwdev.control_error = None
+        self.send('sp1', 21)
+        self.assertEqual(self.wait_commands(3)['applied'], 1)
+        self.assertEqual(hwdev.controls, [('setpoint', 21)])
+        self.assertTrue(self.thread.is_alive())
+
+
+def run_worker(conn, coordinators):
+    _PollingThread.STATS_STORAGE_PATH = None
+    _run_worker(conn, coordinators, logging.CRITICAL)
+
+
+class WorkerProcessTestCase(unittest.TestCase):
+    def setUp(self):
+        cfg = Coordinator('c1', type='test')
+        for dev_id in ('d1', 'd2'):
+            cfg.add_device(make_device_cfg(dev_id, polling='50ms'))
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=run_worker, args=(child_conn, [('c1', WorkerCoordinator, cfg)]))
+        self.process.start()
+        child_conn.close()
+
+    def tearDown(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+    def receive(self, cmd, timeout=2):
+        """ Returns the argument of the next message of a given type sent by the worker."""
+        deadline = time.time() + timeout
+        while self.conn.poll(max(deadline - time.time(), 0)):
+            msg_cmd, cid, arg = self.conn.recv()
+            self.assertEqual(cid, 'c1')
+            if msg_cmd == cmd:
+                return arg
+        self.fail('no %s message received' % cmd)
+
+    def wait_polls(self):
+        """ Waits for the events of all the devices."""
+        var_names = set()
+        while var_names != {'d1', 'd2'}:
+            var_names.add(self.receive('evt')[1])
+
+    def test_events_relayed(self):
+        self.wait_polls()
+
+    def test_stats(self):
+        self.wait_polls()
+        self.conn.send(('stats', 'c1', 42))
+        req_id, stats = self.receive('stats')
+        self.assertEqual(req_id, 42)
+        self.assertEqual(set(stats['devices']), {'d1', 'd2'})
+
+    def test_remove(self):
+        self.wait_polls()
+        self.conn.send(('remove', 'c1', 'd1'))
+        self.conn.send(('stats', 'c1', 0))
+        stats = self.receive('stats')[1]
+        self.assertEqual(set(stats['devices']), {'d2'})
+
+    def test_stop(self):
+        self.conn.send(('stop', None, None))
+        self.process.join(5)
+        self.assertEqual(self.process.exitcode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
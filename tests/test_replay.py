@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Unit tests of the polls recording and replay."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import namedtuple
+
+from pycstbox.hal.replay import PollRecorder, ReplayHwDevice, load_recording
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+Outputs = namedtuple('Outputs', 'temp hum')
+
+
+class RecordingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'polls.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def record(self, count, close=True):
+        recorder = PollRecorder(self.path)
+        recorder.FLUSH_RECORDS = 10
+        for i in range(count):
+            recorder.record('d1', 100. + i, Outputs(20 + i, 50), ['temp', 'hum'])
+            recorder.record('d2', 100.5 + i, Outputs(i, None), ['temp'])
+        if close:
+            recorder.close()
+        return recorder
+
+    def test_round_trip(self):
+        self.record(5)
+        self.record(5)
+        records = load_recording(self.path)
+        self.assertEqual(sorted(records), ['d1', 'd2'])
+        self.assertEqual(len(records['d1']), 10)
+        timestamp, values = records['d1'][0]
+        self.assertEqual((timestamp, values.temp, values.hum), (100., 20, 50))
+        self.assertEqual(records['d2'][-1][1]._fields, ('temp',))
+
+    def test_not_closed(self):
+        recorder = self.record(50, close=False)
+        try:
+            records = load_recording(self.path)
+            # all the records are flushed but the last ones
+            self.assertTrue(40 <= len(records['d1']) <= 50)
+            self.assertEqual(records['d1'][0][1].temp, 20)
+        finally:
+            recorder.close()
+
+    def test_truncated(self):
+        self.record(200)
+        with open(self.path, 'rb') as fp:
+            data = fp.read()
+        with open(self.path, 'wb') as fp:
+            fp.write(data[:len(data) / 2])
+        records = load_recording(self.path)
+        self.assertTrue(0 < len(records['d1']) < 200)
+        self.assertEqual([r[1].temp for r in records['d1']], range(20, 20 + len(records['d1'])))
+
+    def test_not_a_recording(self):
+        with open(self.path, 'w') as fp:
+            fp.write('foo\n')
+        self.assertRaises(IOError, load_recording, self.path)
+
+
+class ReplayHwDeviceTestCase(unittest.TestCase):
+    READS = [(10., 'a'), (20., 'b'), (30., 'c')]
+
+    def test_step(self):
+        hwdev = ReplayHwDevice(self.READS, speed=0)
+        self.assertEqual([hwdev.poll() for _ in range(4)], ['a', 'b', 'c', None])
+        hwdev = ReplayHwDevice(self.READS, speed=0, loop=True)
+        self.assertEqual([hwdev.poll() for _ in range(4)], ['a', 'b', 'c', 'a'])
+
+    def test_timed(self):
+        clock = [0.]
+        hwdev = ReplayHwDevice(self.READS, speed=2., clock=lambda: clock[0])
+        polls = []
+        for now in (0., 4., 5., 12., 100.):
+            clock[0] = now
+            polls.append(hwdev.poll())
+        self.assertEqual(polls, ['a', 'a', 'b', 'c', 'c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
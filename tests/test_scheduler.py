@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of CSTBox.
+#
+# CSTBox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# CSTBox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with CSTBox.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Unit tests of the polling tasks scheduling."""
+
+import unittest
+from collections import namedtuple
+
+from pycstbox.hal.scheduler import (
+    PollScheduler, AdaptivePeriod, CircuitBreaker, BusPacer, hash_phase, plan_phases,
+    PHASING_NONE, PHASING_HASH, PHASING_LEVEL, CIRCUIT_CLOSED, CIRCUIT_OPEN, CIRCUIT_HALF_OPEN,
+    PRIORITY_HIGH, PRIORITY_LOW
+)
+
+__author__ = 'Eric PASCUAL - CSTB (eric.pascual@cstb.fr)'
+
+
+class PollSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = PollScheduler()
+
+    def drain(self, now):
+        keys = []
+        while True:
+            schedule = self.scheduler.pop_due(now)
+            if not schedule:
+                return keys
+            keys.append(schedule.task)
+
+    def test_time_order(self):
+        for key, when in (('a', 3.), ('b', 1.), ('c', 2.)):
+            self.scheduler.schedule(key, when, key)
+        self.assertEqual(len(self.scheduler), 3)
+        self.assertEqual(self.scheduler.next_time(), 1.)
+        self.assertIsNone(self.scheduler.pop_due(0.5))
+        self.assertEqual(self.drain(10.), ['b', 'c', 'a'])
+        self.assertEqual(len(self.scheduler), 0)
+        self.assertIsNone(self.scheduler.next_time())
+
+    def test_same_time_fifo(self):
+        for key in 'abcd':
+            self.scheduler.schedule(key, 1., key)
+        self.assertEqual(self.drain(1.), list('abcd'))
+
+    def test_priority_among_due(self):
+        self.scheduler.schedule('low', 1., 'low', PRIORITY_LOW)
+        self.scheduler.schedule('normal', 2., 'normal')
+        self.scheduler.schedule('high', 3., 'high', PRIORITY_HIGH)
+        self.scheduler.schedule('later', 5., 'later', PRIORITY_HIGH)
+        self.assertEqual(self.drain(4.), ['high', 'normal', 'low'])
+        self.assertEqual(self.drain(5.), ['later'])
+
+    def test_next_time_of_due_tasks(self):
+        self.scheduler.schedule('low', 1., 'low', PRIORITY_LOW)
+        self.scheduler.schedule('high', 2., 'high', PRIORITY_HIGH)
+        self.scheduler.schedule('pending', 10., 'pending')
+        self.assertEqual(self.scheduler.pop_due(3.).task, 'high')
+        # the remaining due task is reported, although in the past
+        self.assertEqual(self.scheduler.next_time(), 1.)
+
+    def test_reschedule(self):
+        self.scheduler.schedule('a', 1., 'a')
+        self.scheduler.schedule('b', 2., 'b')
+        self.scheduler.reschedule('a', 3.)
+        self.assertEqual(self.scheduler.when('a'), 3.)
+        self.assertEqual(len(self.scheduler), 2)
+        self.assertEqual(self.drain(10.), ['b', 'a'])
+        self.assertRaises(KeyError, self.scheduler.reschedule, 'a', 4.)
+
+    def test_schedule_replaces(self):
+        self.scheduler.schedule('a', 1., 'first')
+        self.scheduler.schedule('a', 2., 'second')
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(self.drain(10.), ['second'])
+
+    def test_cancel(self):
+        self.scheduler.schedule('a', 1., 'a')
+        self.scheduler.schedule('b', 2., 'b')
+        self.assertTrue(self.scheduler.cancel('a'))
+        self.assertFalse(self.scheduler.cancel('a'))
+        self.assertNotIn('a', self.scheduler)
+        self.assertEqual(self.scheduler.next_time(), 2.)
+        self.assertEqual(self.drain(10.), ['b'])
+
+    def test_cancel_due(self):
+        self.scheduler.schedule('a', 1., 'a', PRIORITY_HIGH)
+        self.scheduler.schedule('b', 2., 'b')
+        self.scheduler.schedule('c', 3., 'c')
+        # moves the due entries to the ready queue
+        self.assertEqual(self.scheduler.pop_due(3.).task, 'a')
+        self.scheduler.cancel('b')
+        self.assertEqual(self.scheduler.next_time(), 3.)
+        self.assertEqual(self.drain(3.), ['c'])
+
+    def test_pop(self):
+        self.scheduler.schedule('a', 5., 'task')
+        schedule = self.scheduler.pop('a')
+        self.assertEqual((schedule.when, schedule.task), (5., 'task'))
+        self.assertIsNone(self.scheduler.pop('a'))
+        self.assertIsNone(self.scheduler.pop_due(10.))
+
+    def test_lazy_cancellation(self):
+        for i in range(10):
+            self.scheduler.schedule(i, float(i), i)
+        for i in range(5):
+            self.scheduler.cancel(i)
+        # cancelled entries stay in the heap until they reach its top
+        self.assertEqual(len(self.scheduler._heap), 10)
+        self.assertEqual(self.scheduler._removed, 5)
+        self.assertEqual(self.scheduler.next_time(), 5.)
+        self.assertEqual(len(self.scheduler._heap), 5)
+        self.assertEqual(self.scheduler._removed, 0)
+
+    def test_compaction(self):
+        count = 100
+        for i in range(count):
+            self.scheduler.schedule(i, float(i), i)
+        for i in range(count - 10):
+            self.scheduler.cancel(i)
+            heap = self.scheduler._heap
+            self.assertEqual(len(heap), len(self.scheduler) + self.scheduler._removed)
+            self.assertLessEqual(self.scheduler._removed, PollScheduler.COMPACTION_RATIO * len(self.scheduler) + 16)
+        self.assertLess(len(self.scheduler._heap), count)
+        self.assertEqual(self.drain(float(count)), range(count - 10, count))
+
+    def test_compaction_of_rescheduled_tasks(self):
+        for i in range(10):
+            self.scheduler.schedule(i, float(i), i)
+        for n in range(1000):
+            self.scheduler.reschedule(n % 10, 100. + n)
+        self.assertLessEqual(len(self.scheduler._heap), (PollScheduler.COMPACTION_RATIO + 1) * 10 + 17)
+        self.assertEqual(sorted(self.drain(2000.)), range(10))
+
+    def test_clear(self):
+        for i in range(10):
+            self.scheduler.schedule(i, float(i), i)
+        self.scheduler.pop_due(5.)
+        self.scheduler.clear()
+        self.assertEqual(len(self.scheduler), 0)
+        self.assertIsNone(self.scheduler.next_time())
+        self.assertIsNone(self.scheduler.pop_due(100.))
+
+
+class AdaptivePeriodTestCase(unittest.TestCase):
+    def test_bounds(self):
+        self.assertRaises(ValueError, AdaptivePeriod, 0, 10, 5)
+        self.assertRaises(ValueError, AdaptivePeriod, 10, 5, 5)
+        self.assertEqual(AdaptivePeriod(1, 10, 20).period, 10)
+        self.assertEqual(AdaptivePeriod(1, 10, 0.5).period, 1)
+
+    def test_update(self):
+        period = AdaptivePeriod(1, 10, 8)
+        self.assertEqual(period.update(1), 4)
+        self.assertEqual(period.update(3), 2)
+        self.assertEqual(period.update(1), 1)
+        self.assertEqual(period.update(1), 1)
+        self.assertEqual(period.update(0), 1.25)
+        for _ in range(20):
+            period.update(0)
+        self.assertEqual(period.period, 10)
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(backoff_max=60)
+
+    def test_second_chance(self):
+        self.assertEqual(self.breaker.failure(10), 0)
+        self.assertEqual(self.breaker.state, CIRCUIT_CLOSED)
+        self.breaker.success()
+        self.assertEqual(self.breaker.failure(10), 0)
+        self.assertEqual(self.breaker.trips, 0)
+
+    def test_trip(self):
+        self.breaker.failure(10)
+        delay = self.breaker.failure(10)
+        self.assertEqual(self.breaker.state, CIRCUIT_OPEN)
+        self.assertEqual(self.breaker.trips, 1)
+        self.assertEqual(self.breaker.backoff, 20)
+        self.assertTrue(20 * (1 - CircuitBreaker.JITTER) <= delay <= 20 * (1 + CircuitBreaker.JITTER))
+
+    def test_minimum_backoff(self):
+        self.breaker.failure(0.1)
+        self.breaker.failure(0.1)
+        self.assertEqual(self.breaker.backoff, CircuitBreaker.BACKOFF_MIN)
+
+    def test_exponential_backoff(self):
+        self.breaker.failure(10)
+        self.breaker.failure(10)
+        backoffs = []
+        for _ in range(4):
+            self.breaker.probe()
+            self.assertEqual(self.breaker.state, CIRCUIT_HALF_OPEN)
+            self.breaker.failure(10)
+            self.assertEqual(self.breaker.state, CIRCUIT_OPEN)
+            backoffs.append(self.breaker.backoff)
+        self.assertEqual(backoffs, [40, 60, 60, 60])
+        self.assertEqual(self.breaker.trips, 1)
+
+    def test_recovery(self):
+        self.breaker.failure(10)
+        self.breaker.failure(10)
+        self.breaker.probe()
+        self.breaker.success()
+        self.assertEqual(self.breaker.state, CIRCUIT_CLOSED)
+        self.assertEqual((self.breaker.failures, self.breaker.backoff), (0, 0))
+        # the probe of a closed circuit is a normal poll
+        self.breaker.probe()
+        self.assertEqual(self.breaker.state, CIRCUIT_CLOSED)
+
+
+class BusPacerTestCase(unittest.TestCase):
+    def test_unlimited(self):
+        pacer = BusPacer()
+        for now in (0., 0., 0.):
+            self.assertEqual(pacer.delay(now), 0)
+            pacer.acquire(now)
+            pacer.release(now)
+
+    def test_gap(self):
+        pacer = BusPacer()
+        pacer.acquire(10.)
+        pacer.release(10.5, gap=0.2)
+        self.assertAlmostEqual(pacer.delay(10.5), 0.2)
+        self.assertAlmostEqual(pacer.delay(10.6), 0.1)
+        self.assertEqual(pacer.delay(11.), 0)
+        # the gap is the one of the last transaction
+        pacer.acquire(11.)
+        pacer.release(11., gap=0.)
+        self.assertEqual(pacer.delay(11.), 0)
+
+    def test_rate(self):
+        pacer = BusPacer(rate=2.)
+        self.assertEqual(pacer.delay(0.), 0)
+        pacer.acquire(0.)
+        self.assertAlmostEqual(pacer.delay(0.), 0.5)
+        self.assertAlmostEqual(pacer.delay(0.25), 0.25)
+        self.assertEqual(pacer.delay(0.5), 0)
+
+    def test_burst(self):
+        pacer = BusPacer(rate=1., burst=3)
+        for _ in range(3):
+            self.assertEqual(pacer.delay(0.), 0)
+            pacer.acquire(0.)
+        self.assertAlmostEqual(pacer.delay(0.), 1.)
+        # the bucket is refilled up to the burst size only
+        self.assertEqual(pacer.delay(100.), 0)
+        self.assertEqual(pacer.tokens, 3)
+
+    def test_rate_and_gap(self):
+        pacer = BusPacer(rate=1.)
+        pacer.acquire(0.)
+        pacer.release(0.1, gap=2.)
+        self.assertAlmostEqual(pacer.delay(0.1), 2.)
+        pacer = BusPacer(rate=1.)
+        pacer.acquire(0.)
+        pacer.release(0.1, gap=0.1)
+        self.assertAlmostEqual(pacer.delay(0.1), 0.9)
+
+
+Dev = namedtuple('Dev', 'id_')
+Task = namedtuple('Task', 'dev period bus')
+
+
+class PhasingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tasks = [Task(Dev('d%d' % i), 10. if i % 2 else 20., 'bus%d' % (i % 3)) for i in range(12)]
+
+    def test_hash_phase(self):
+        phase = hash_phase('dev', 10.)
+        self.assertTrue(0 <= phase < 10.)
+        self.assertEqual(hash_phase('dev', 10.), phase)
+        self.assertAlmostEqual(hash_phase('dev', 20.), 2 * phase)
+
+    def test_none(self):
+        self.assertEqual(set(plan_phases(self.tasks, PHASING_NONE).values()), {0})
+
+    def test_hash(self):
+        offsets = plan_phases(self.tasks, PHASING_HASH)
+        for task in self.tasks:
+            self.assertEqual(offsets[task.dev.id_], hash_phase(task.dev.id_, task.period))
+
+    def test_level(self):
+        offsets = plan_phases(self.tasks, PHASING_LEVEL)
+        self.assertEqual(len(offsets), len(self.tasks))
+        for bus in ('bus0', 'bus1', 'bus2'):
+            bus_tasks = [t for t in self.tasks if t.bus == bus]
+            self.assertEqual(
+                sorted(offsets[t.dev.id_] / t.period for t in bus_tasks),
+                [float(i) / len(bus_tasks) for i in range(len(bus_tasks))]
+            )
+
+    def test_invalid_mode(self):
+        self.assertRaises(ValueError, plan_phases, self.tasks, 'foo')
+
+
+if __name__ == '__main__':
+    unittest.main()